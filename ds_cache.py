@@ -0,0 +1,416 @@
+"""
+Download cache for the `cate ds copy` steps of the happy path and validation scripts.
+
+Every run of a use case script downloads its datasets again, and several scripts download the same subsets,
+e.g. the two year SST subset of UC06. `python ds_cache.py copy` takes the arguments of `cate ds copy`. A request
+is keyed by its dataset ID, time range, region, variables and the version of the store (the cate version), all
+normalized, so `--vars "cfc, cee"` and `--vars cee,cfc` are the same request. On a miss `cate ds copy` is run and
+the files of the new local data source, its metadata file and its directory in the local data store, are kept in
+the cache. On a hit the files are copied into the local data store under the requested name, without downloading
+anything.
+
+The files are stored once per content, in files named by their SHA-256, so equal subsets copied under different
+names share their data. A SQLite index in WAL mode maps the requests to their files and is shared by concurrent
+scripts. The least recently used requests are evicted once the files exceed the maximum size. Hits, misses and the
+bytes saved are counted in the index, `python ds_cache.py stats` prints them.
+
+Usage:
+
+    python ds_cache.py copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 \\
+        --name SST_2006_2007 --time '2006-01-01,2007-12-31' --region ' -175,-10,-115,10' --vars 'analysed_sst'
+    python ds_cache.py stats
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+DATASET_CACHE_DIR = os.environ.get('CATE_E2E_DATASET_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'cate-e2e', 'datasets'))
+# bytes the files may occupy before the least recently used requests are evicted
+DATASET_CACHE_MAX_SIZE = 50 * 1024 * 1024 * 1024
+# share of the maximum size the cache is evicted down to
+EVICT_TARGET = 0.9
+LOCK_TIMEOUT = 60
+
+COUNTER_NAMES = ['hits', 'misses', 'bytes_saved', 'bytes_fetched']
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    request TEXT NOT NULL,
+    local_name TEXT NOT NULL,
+    store_dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT NOT NULL,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (key, path)
+);
+CREATE INDEX IF NOT EXISTS files_digest ON files (digest);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+
+def log(message):
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {message}')
+
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TB'
+
+
+def get_store_version():
+    try:
+        from cate.version import __version__
+        return __version__
+    except ImportError:
+        pass
+    try:
+        output = subprocess.run(['cate', '--version'], capture_output=True, text=True).stdout
+    except OSError:
+        output = ''
+    return output.strip() or 'unknown'
+
+
+def get_local_store_dir():
+    try:
+        from cate.ds.local import get_data_store_path
+        return get_data_store_path()
+    except ImportError:
+        store_dir = os.environ.get('CATE_LOCAL_DATA_STORE_PATH')
+        if store_dir is None:
+            raise ValueError('The local data store of cate is unknown, use --store-dir')
+        return store_dir
+
+
+def normalize_time(time_range):
+    return ','.join(part.strip() for part in time_range.split(',')) if time_range else None
+
+
+def normalize_region(region):
+    if not region:
+        return None
+    region = ' '.join(region.split())
+    try:
+        return ','.join(str(float(part)) for part in region.split(','))
+    except ValueError:
+        # WKT, e.g. POLYGON((...))
+        return region.upper()
+
+
+def normalize_vars(var_names):
+    if not var_names:
+        return None
+    return sorted({var_name.strip() for var_name in var_names.split(',') if var_name.strip()})
+
+
+def get_request(ds_id, time_range, region, var_names, store_version):
+    return {'ds_id': ds_id,
+            'time': normalize_time(time_range),
+            'region': normalize_region(region),
+            'vars': normalize_vars(var_names),
+            'store_version': store_version}
+
+
+def get_key(request):
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def get_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_data_source_name(entry):
+    """Name of the local data source a top level entry of the local data store belongs to"""
+    if entry.endswith('.json'):
+        entry = entry[:-len('.json')]
+    return entry[len('local.'):] if entry.startswith('local.') else entry
+
+
+def list_data_source_files(store_dir, name):
+    """Relative paths of the files of local data source *name*, its metadata file and the files of its directory"""
+    paths = []
+    for entry in os.listdir(store_dir):
+        if get_data_source_name(entry) != name:
+            continue
+        path = os.path.join(store_dir, entry)
+        if not os.path.isdir(path):
+            paths.append(entry)
+            continue
+        for root, _, names in os.walk(path):
+            paths += [os.path.relpath(os.path.join(root, file_name), store_dir) for file_name in names]
+    return sorted(paths)
+
+
+def rename_path(path, old_name, new_name):
+    """Path of a file of local data source *old_name* for *new_name*, only the top level entry is named after it"""
+    parts = path.split(os.sep)
+    parts[0] = parts[0].replace(old_name, new_name)
+    return os.sep.join(parts)
+
+
+def rename_text(text, old_store_dir, old_name, new_store_dir, new_name):
+    """Metadata of local data source *old_name* for *new_name* in another store directory"""
+    def escape(s):
+        return json.dumps(s)[1:-1]
+
+    text = text.replace(escape(os.path.join(old_store_dir, old_name)), escape(os.path.join(new_store_dir, new_name)))
+    text = text.replace(escape(old_store_dir), escape(new_store_dir))
+    text = text.replace(f'local.{old_name}', f'local.{new_name}')
+    return text.replace(f'"{old_name}"', f'"{new_name}"')
+
+
+class DatasetCache:
+
+    def __init__(self, cache_dir=DATASET_CACHE_DIR, max_size=DATASET_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._connection = None
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            connection = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'),
+                                         timeout=LOCK_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _get_object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    def _count(self, **counts):
+        for name, value in counts.items():
+            self.connection.execute('INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)', (name,))
+            self.connection.execute('UPDATE counters SET value = value + ? WHERE name = ?', (value, name))
+
+    def get(self, key):
+        """(local name, store directory, size, {path: digest}) of a cached request, or None"""
+        row = self.connection.execute('SELECT local_name, store_dir, size FROM entries WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        files = dict(self.connection.execute('SELECT path, digest FROM files WHERE key = ?', (key,)).fetchall())
+        if not all(os.path.exists(self._get_object_path(digest)) for digest in files.values()):
+            # evicted by another script
+            return None
+        return row[0], row[1], row[2], files
+
+    def put(self, key, request, local_name, store_dir, paths):
+        """Keep the files *paths* of the local data store which `cate ds copy` added for *request*"""
+        files = {}
+        sizes = {}
+        for path in paths:
+            source = os.path.join(store_dir, path)
+            digest = get_digest(source)
+            target = self._get_object_path(digest)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # copied to a temporary file first, so concurrent scripts never see a partial file
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+                os.close(fd)
+                shutil.copyfile(source, temp_path)
+                os.replace(temp_path, target)
+            files[path] = digest
+            sizes[digest] = os.path.getsize(target)
+        size = sum(sizes.values())
+        now = time.time()
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany('INSERT OR IGNORE INTO objects (digest, size) VALUES (?, ?)', sizes.items())
+            self.connection.execute('DELETE FROM files WHERE key = ?', (key,))
+            self.connection.executemany('INSERT INTO files (key, path, digest) VALUES (?, ?, ?)',
+                                        [(key, path, digest) for path, digest in files.items()])
+            self.connection.execute('INSERT OR REPLACE INTO entries '
+                                    '(key, request, local_name, store_dir, size, created, last_used) '
+                                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (key, json.dumps(request), local_name, store_dir, size, now, now))
+            self._count(misses=1, bytes_fetched=size)
+        self._evict()
+        return size
+
+    def restore(self, key, entry, local_name, store_dir):
+        """Copy the files of a cached request into the local data store as *local_name*, returns their size"""
+        old_name, old_store_dir, size, files = entry
+        for path, digest in files.items():
+            target = os.path.join(store_dir, rename_path(path, old_name, local_name))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+            os.close(fd)
+            if path.endswith('.json'):
+                with open(self._get_object_path(digest)) as f:
+                    text = rename_text(f.read(), old_store_dir, old_name, store_dir, local_name)
+                with open(temp_path, 'w') as f:
+                    f.write(text)
+            else:
+                shutil.copyfile(self._get_object_path(digest), temp_path)
+            os.replace(temp_path, target)
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._count(hits=1, bytes_saved=size)
+        return size
+
+    def get_size(self):
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def _evict(self):
+        total_size = self.get_size()
+        if total_size <= self.max_size:
+            return
+        removed = []
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            for key, in self.connection.execute('SELECT key FROM entries ORDER BY last_used').fetchall():
+                if total_size <= self.max_size * EVICT_TARGET:
+                    break
+                digests = [digest for digest, in self.connection.execute(
+                    'SELECT digest FROM files WHERE key = ?', (key,)).fetchall()]
+                self.connection.execute('DELETE FROM files WHERE key = ?', (key,))
+                self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                # files are shared by all requests with the same content
+                for digest in set(digests):
+                    if self.connection.execute('SELECT 1 FROM files WHERE digest = ? LIMIT 1',
+                                               (digest,)).fetchone() is not None:
+                        continue
+                    size = self.connection.execute('SELECT size FROM objects WHERE digest = ?',
+                                                   (digest,)).fetchone()
+                    self.connection.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+                    if size is not None:
+                        total_size -= size[0]
+                        removed.append(digest)
+        for digest in removed:
+            try:
+                os.remove(self._get_object_path(digest))
+            except OSError:
+                continue
+
+    def get_counters(self):
+        counters = dict.fromkeys(COUNTER_NAMES, 0)
+        counters.update(self.connection.execute('SELECT name, value FROM counters').fetchall())
+        requests = counters['hits'] + counters['misses']
+        counters['hit_rate'] = counters['hits'] / requests if requests else None
+        counters['entries'] = self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        counters['size'] = self.get_size()
+        return counters
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def run_cate_copy(copy_args, cate_main=None):
+    """Runs `cate ds copy`, in this process if the main() of the Cate CLI is given"""
+    if cate_main is not None:
+        try:
+            return cate_main(['ds', 'copy'] + copy_args) or 0
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else 0
+    return subprocess.run(['cate', 'ds', 'copy'] + copy_args).returncode
+
+
+def copy(args, copy_args, cate_main=None):
+    if not args.name:
+        # the name cate chooses is not known beforehand
+        log('No --name given, the dataset is copied without the cache.')
+        return run_cate_copy(copy_args, cate_main)
+    store_dir = args.store_dir or get_local_store_dir()
+    cache = DatasetCache(args.cache_dir, int(args.max_size * 1024 * 1024 * 1024))
+    request = get_request(args.ds_id, args.time, args.region, args.vars, get_store_version())
+    key = get_key(request)
+    try:
+        entry = cache.get(key)
+        if entry is not None:
+            if any(os.path.exists(os.path.join(store_dir, rename_path(path, entry[0], args.name)))
+                   for path in entry[3]):
+                log(f'local.{args.name} already exists in the local data store.')
+                return 1
+            size = cache.restore(key, entry, args.name, store_dir)
+            log(f'Copied local.{args.name} from the dataset cache, {format_size(size)} saved '
+                f'({format_size(cache.get_counters()["bytes_saved"])} in total).')
+            return 0
+        exit_code = run_cate_copy(copy_args, cate_main)
+        if exit_code != 0:
+            return exit_code
+        # only the files of the new data source, other scripts may write to the local data store meanwhile
+        paths = list_data_source_files(store_dir, args.name) if os.path.isdir(store_dir) else []
+        if not paths:
+            log(f'cate ds copy wrote no files of local.{args.name} to {store_dir}, it is not cached.')
+            return 0
+        size = cache.put(key, request, args.name, store_dir, paths)
+        log(f'Cached local.{args.name}, {format_size(size)} in {len(paths)} files.')
+        return 0
+    finally:
+        cache.close()
+
+
+def stats(args):
+    cache = DatasetCache(args.cache_dir, int(args.max_size * 1024 * 1024 * 1024))
+    counters = cache.get_counters()
+    cache.close()
+    hit_rate = 'n/a' if counters['hit_rate'] is None else f'{counters["hit_rate"]:.0%}'
+    print(f'{counters["entries"]} datasets, {format_size(counters["size"])} in {args.cache_dir}')
+    print(f'{counters["hits"]} hits, {counters["misses"]} misses, hit rate {hit_rate}')
+    print(f'{format_size(counters["bytes_saved"])} saved, {format_size(counters["bytes_fetched"])} downloaded')
+    return 0
+
+
+def main(args=None, cate_main=None):
+    parser = argparse.ArgumentParser(description='Download cache for cate ds copy.')
+    parser.add_argument('--cache-dir', default=DATASET_CACHE_DIR,
+                        help=f'Directory of the cache, defaults to {DATASET_CACHE_DIR}.')
+    parser.add_argument('--max-size', type=float, default=DATASET_CACHE_MAX_SIZE / 1024 ** 3,
+                        help=f'GB the cached datasets may occupy, defaults to {DATASET_CACHE_MAX_SIZE // 1024 ** 3}.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    copy_parser = subparsers.add_parser('copy', help='Same as cate ds copy, served from the cache if possible.')
+    copy_parser.add_argument('ds_id')
+    copy_parser.add_argument('--name', '-n')
+    copy_parser.add_argument('--time', '-t')
+    copy_parser.add_argument('--region', '-r')
+    copy_parser.add_argument('--vars', '-v')
+    copy_parser.add_argument('--store-dir', help='Directory of the local data store of cate, found if omitted.')
+    subparsers.add_parser('stats', help='Print hits, misses and bytes saved.')
+    args = parser.parse_args(args)
+
+    if args.command == 'stats':
+        return stats(args)
+    copy_args = [args.ds_id]
+    for option in ['name', 'time', 'region', 'vars']:
+        if getattr(args, option) is not None:
+            copy_args += [f'--{option}', getattr(args, option)]
+    return copy(args, copy_args, cate_main)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
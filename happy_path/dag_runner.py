@@ -0,0 +1,273 @@
+"""
+Runs the happy path and validation scripts with independent steps in parallel.
+
+The scripts run top to bottom, but many of their steps do not depend on each other, e.g. the two downloads of
+`uc09.sh`, its two `subset_spatial` steps and the `tseries_point` steps on `cloud_sub` and `ozone_sub`. This runner
+builds a graph of the steps of a script from the resources, datasets and files every step reads and writes:
+
+* `cate ds copy` and `ds_cache.py copy` write the local dataset `local.<name>`, `cate res open` reads it;
+* `cate res open`, `res read` and `res set` write their resource, `res set` reads the `@resource` arguments;
+* `cate res write`, `res print` and `res plot` read their resource, `res write` writes its file;
+* `file=` arguments are files read or written by the operation, their steps run in script order.
+
+A step runs after the last step writing what it reads, and after the steps reading what it writes. All other
+commands (`cate ws ...`, `cd`, `mkdir`, `rm`, ...) are barriers, they run alone after all steps before them. The
+steps are run like in runner.py, with the Cate CLI in this process and one workspace manager, by a pool of threads.
+Changes of a workspace are serialized, the operations of the steps run concurrently.
+
+The start, wall time and exit code of every step and its dependencies are written to a CSV, the wall time of every
+script is printed together with its longest chain of dependent steps.
+
+Usage, from the `scripts` directory:
+
+    python ../dag_runner.py uc09.sh --workers 4
+    python ../dag_runner.py ../../validation/scripts/UC6/UC06_S1_v002.sh
+"""
+import argparse
+import csv
+import functools
+import glob
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from runner import new_cate_cli, read_steps, run_step
+
+DAG_TIMINGS_CSV = 'happy_path_dag_timings.csv'
+DAG_TIMINGS_HEADER_ROW = ['script', 'step', 'line', 'command', 'depends_on', 'start', 'seconds', 'exit_code']
+WORKERS = 4
+
+
+class Step:
+
+    def __init__(self, step, line_number, args):
+        self.step = step
+        self.line_number = line_number
+        self.args = args
+        self.reads, self.writes = get_accesses(args)
+        self.depends_on = set()
+
+    @property
+    def is_barrier(self):
+        return self.reads is None
+
+    @property
+    def command(self):
+        return ' '.join(self.args)
+
+
+def get_option(args, *names):
+    for index, arg in enumerate(args[:-1]):
+        if arg in names:
+            return args[index + 1]
+    return None
+
+
+def get_op_accesses(op_args):
+    """Resources and files read and written by the arguments of an operation"""
+    reads = set()
+    writes = set()
+    for op_arg in op_args:
+        name, _, value = op_arg.partition('=')
+        if value.startswith('@'):
+            reads.add(('res', value[1:]))
+        elif name == 'file':
+            # read or written by the operation, the steps using a file run in order
+            reads.add(('file', os.path.normpath(value)))
+            writes.add(('file', os.path.normpath(value)))
+    return reads, writes
+
+
+def get_copy_accesses(args):
+    name = get_option(args, '--name', '-n')
+    return (set(), {('ds', f'local.{name}')}) if name else (None, None)
+
+
+def get_accesses(args):
+    """
+    Resources, local datasets and files a step reads and writes.
+    Reads are None for barriers.
+    """
+    if args[0] == 'python' and os.path.basename(args[1]) == 'ds_cache.py' and args[2:3] == ['copy']:
+        return get_copy_accesses(args)
+    if args[0] != 'cate' or len(args) < 4:
+        return None, None
+    command, res_name = tuple(args[1:3]), args[3] if len(args) > 3 else None
+    if command == ('ds', 'copy'):
+        return get_copy_accesses(args)
+    if command == ('res', 'open'):
+        return {('ds', args[4])} if len(args) > 4 else set(), {('res', res_name)}
+    if command == ('res', 'read'):
+        return {('file', os.path.normpath(args[4]))} if len(args) > 4 else set(), {('res', res_name)}
+    if command == ('res', 'set'):
+        reads, writes = get_op_accesses(args[5:])
+        return reads, writes | {('res', res_name)}
+    if command == ('res', 'write'):
+        return {('res', res_name)}, {('file', os.path.normpath(args[4]))} if len(args) > 4 else set()
+    if command in (('res', 'print'), ('res', 'plot')):
+        reads, writes = get_op_accesses(args[4:])
+        return reads | {('res', res_name)}, writes
+    return None, None
+
+
+def build_graph(steps):
+    """Sets the steps every step depends on"""
+    last_barrier = None
+    since_barrier = []
+    last_writer = {}
+    readers = {}
+    for step in steps:
+        if step.is_barrier:
+            step.depends_on.update(since_barrier)
+            if last_barrier is not None:
+                step.depends_on.add(last_barrier)
+            last_barrier = step
+            since_barrier = []
+            last_writer = {}
+            readers = {}
+            continue
+        if last_barrier is not None:
+            step.depends_on.add(last_barrier)
+        for item in step.reads:
+            if item in last_writer:
+                step.depends_on.add(last_writer[item])
+        for item in step.writes:
+            if item in last_writer:
+                step.depends_on.add(last_writer[item])
+            step.depends_on.update(readers.get(item, []))
+        step.depends_on.discard(step)
+        for item in step.reads:
+            readers.setdefault(item, []).append(step)
+        for item in step.writes:
+            last_writer[item] = step
+            readers[item] = []
+        since_barrier.append(step)
+    return steps
+
+
+def lock_workspaces():
+    """Serialize the changes of the workspaces, the steps share them"""
+    try:
+        from cate.core.workspace import Workspace
+    except ImportError:
+        return []
+    lock = threading.RLock()
+
+    def locked(method):
+        @functools.wraps(method)
+        def locked_method(*args, **kwargs):
+            with lock:
+                return method(*args, **kwargs)
+        return locked_method
+
+    patched = []
+    for name in ['set_resource', 'rename_resource', 'delete_resource', 'save']:
+        if hasattr(Workspace, name):
+            setattr(Workspace, name, locked(getattr(Workspace, name)))
+            patched.append(name)
+    return patched
+
+
+def run_graph(script_path, cate_main, workers):
+    """Runs all steps of a script from its directory, a step once the steps it depends on are done.
+    Returns the steps, their timing rows and the wall time."""
+    script_name = os.path.basename(script_path)
+    script_path = os.path.abspath(script_path)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(script_path))
+    steps = build_graph([Step(step, line_number, args)
+                         for step, (line_number, args) in enumerate(read_steps(script_path), 1)])
+    script_start = time.perf_counter()
+    rows = {}
+
+    def run(step):
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {script_name} step {step.step}: {step.command}')
+        start = time.perf_counter()
+        try:
+            exit_code = run_step(cate_main, step.args)
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+        rows[step] = {'script': script_name,
+                      'step': step.step,
+                      'line': step.line_number,
+                      'command': step.command,
+                      'depends_on': ' '.join(str(s.step) for s in sorted(step.depends_on, key=lambda s: s.step)),
+                      'start': round(start - script_start, 3),
+                      'seconds': round(time.perf_counter() - start, 3),
+                      'exit_code': exit_code}
+
+    try:
+        pending = list(steps)
+        done = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending or running:
+                # like the shell, a step runs even if a step it depends on failed
+                for step in [s for s in pending if s.depends_on <= done]:
+                    # barriers change the directory or the workspaces, they run alone
+                    if step.is_barrier and running:
+                        break
+                    pending.remove(step)
+                    running[executor.submit(run, step)] = step
+                    if step.is_barrier:
+                        break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done.add(running.pop(future))
+    finally:
+        os.chdir(cwd)
+    return steps, [rows[step] for step in steps], time.perf_counter() - script_start
+
+
+def get_critical_path(steps, rows):
+    """Seconds of the longest chain of dependent steps"""
+    finish = {}
+    for step, row in zip(steps, rows):
+        finish[step] = row['seconds'] + max((finish[s] for s in step.depends_on), default=0)
+    return max(finish.values(), default=0)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run happy path and validation scripts with independent steps '
+                                                 'in parallel.')
+    parser.add_argument('scripts', nargs='*', help='Scripts to run, defaults to all uc*.sh in this directory.')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help=f'Number of steps run at the same time, defaults to {WORKERS}.')
+    parser.add_argument('--timings-csv', default=DAG_TIMINGS_CSV,
+                        help=f'CSV the step timings are written to, defaults to {DAG_TIMINGS_CSV}.')
+    args = parser.parse_args(args)
+    scripts = args.scripts or sorted(glob.glob('uc*.sh'))
+
+    start = time.perf_counter()
+    cate_main, workspace_manager = new_cate_cli()
+    if not lock_workspaces():
+        print('The workspaces of cate cannot be locked, changes of a workspace are not serialized.')
+    print(f'Importing cate took {time.perf_counter() - start:.1f} seconds.')
+
+    rows = []
+    for script_path in scripts:
+        steps, script_rows, seconds = run_graph(script_path, cate_main, args.workers)
+        rows.extend(script_rows)
+        if hasattr(workspace_manager, 'close_all_workspaces'):
+            # resources of one script are not needed by the next
+            workspace_manager.close_all_workspaces()
+        failed = sum(1 for row in script_rows if row['exit_code'] != 0)
+        print(f'{os.path.basename(script_path)}: {len(script_rows)} steps, {failed} failed, {seconds:.1f} seconds, '
+              f'{sum(row["seconds"] for row in script_rows):.1f} seconds of steps, '
+              f'longest chain {get_critical_path(steps, script_rows):.1f} seconds')
+
+    with open(args.timings_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=DAG_TIMINGS_HEADER_ROW)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'All scripts took {time.perf_counter() - start:.1f} seconds, step timings are in {args.timings_csv}.')
+    return 1 if any(row['exit_code'] != 0 for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Runs the happy path scripts in a single Python process.
+
+The `uc*.sh` and `uc*.bat` scripts call the Cate CLI once per step, so every step starts a new interpreter,
+imports cate, xarray and dask, and reloads the workspace from disk. This runner reads the same scripts and
+executes every `cate ...` line with the Cate CLI in this process. All steps share one workspace manager, so the
+workspace and its resources stay in memory from one step to the next. The shell commands used by the scripts
+(`cd`, `mkdir`, `rm -rf`, `rmdir /S /Q`) are executed by the runner itself, the downloads through the dataset
+cache (`python "$(dirname "$0")/../../ds_cache.py" copy ...`) are run in this process as well.
+
+Like the shell, the runner goes on with the next step if a step fails. The wall time and exit code of every
+step are printed and written to a CSV.
+
+Usage, from the `scripts` directory:
+
+    python ../runner.py uc02.sh uc09.sh
+    python ../runner.py            # all uc*.sh scripts
+"""
+import argparse
+import csv
+import functools
+import glob
+import importlib.util
+import os
+import shlex
+import shutil
+import sys
+import time
+import traceback
+from datetime import datetime
+
+TIMINGS_CSV = 'happy_path_timings.csv'
+TIMINGS_HEADER_ROW = ['script', 'step', 'line', 'command', 'seconds', 'exit_code']
+
+
+def read_steps(script_path):
+    """(line number, arguments) of every command of a .sh or .bat script"""
+    # paths relative to the script, like "$(dirname "$0")/../../../ds_cache.py", are resolved by the runner
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    with open(script_path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#') or line.startswith('@') or line.split()[0].lower() == 'rem':
+                continue
+            line = line.replace('$(dirname "$0")', script_dir).replace('%~dp0', script_dir + os.sep)
+            yield line_number, shlex.split(line, comments=True)
+
+
+def new_cate_cli():
+    """main() of the Cate CLI, with all commands sharing one workspace manager"""
+    from cate.cli import main as cate_cli
+    from cate.core.wsmanag import FSWorkspaceManager
+
+    # the commands of the Cate CLI get their workspace manager from this private factory, there is no public
+    # way to pass one in
+    if not callable(getattr(cate_cli, '_new_workspace_manager', None)):
+        raise RuntimeError('The Cate CLI has no _new_workspace_manager() any more, its steps cannot share one '
+                           'workspace manager. Run the scripts with the shell instead and update new_cate_cli().')
+    workspace_manager = FSWorkspaceManager()
+    cate_cli._new_workspace_manager = lambda *args, **kwargs: workspace_manager
+    return cate_cli.main, workspace_manager
+
+
+def run_shell_command(args):
+    command = args[0].lower()
+    if command == 'cd':
+        os.chdir(args[1])
+    elif command == 'mkdir':
+        os.makedirs(args[-1], exist_ok=True)
+    elif command in ('rm', 'rmdir'):
+        # rm -rf <dir> or rmdir /S /Q <dir>
+        shutil.rmtree(args[-1], ignore_errors=True)
+    else:
+        raise ValueError(f'Unsupported command "{" ".join(args)}"')
+    return 0
+
+
+@functools.lru_cache()
+def load_ds_cache(path):
+    spec = importlib.util.spec_from_file_location('ds_cache', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_step(cate_main, args):
+    if args[0] == 'python' and os.path.basename(args[1]) == 'ds_cache.py':
+        # downloads missing in the cache are copied with the Cate CLI of this process
+        return load_ds_cache(args[1]).main(args[2:], cate_main=cate_main)
+    if args[0] != 'cate':
+        return run_shell_command(args)
+    try:
+        return cate_main(args[1:]) or 0
+    except SystemExit as e:
+        # e.g. "cate ws exit", which must not end the runner
+        return e.code if isinstance(e.code, int) else 0
+
+
+def run_script(script_path, cate_main):
+    """Runs all steps of a script from its directory, yields a timing row per step"""
+    script_name = os.path.basename(script_path)
+    script_path = os.path.abspath(script_path)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(script_path))
+    try:
+        for step, (line_number, args) in enumerate(read_steps(script_path), 1):
+            command = ' '.join(args)
+            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {script_name} step {step}: {command}')
+            start = time.perf_counter()
+            try:
+                exit_code = run_step(cate_main, args)
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+            yield {'script': script_name,
+                   'step': step,
+                   'line': line_number,
+                   'command': command,
+                   'seconds': round(time.perf_counter() - start, 3),
+                   'exit_code': exit_code}
+    finally:
+        os.chdir(cwd)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run happy path scripts in a single Python process.')
+    parser.add_argument('scripts', nargs='*', help='Scripts to run, defaults to all uc*.sh in this directory.')
+    parser.add_argument('--timings-csv', default=TIMINGS_CSV,
+                        help=f'CSV the step timings are written to, defaults to {TIMINGS_CSV}.')
+    args = parser.parse_args(args)
+    scripts = args.scripts or sorted(glob.glob('uc*.sh'))
+
+    start = time.perf_counter()
+    cate_main, workspace_manager = new_cate_cli()
+    print(f'Importing cate took {time.perf_counter() - start:.1f} seconds.')
+
+    rows = []
+    for script_path in scripts:
+        script_rows = list(run_script(script_path, cate_main))
+        rows.extend(script_rows)
+        if hasattr(workspace_manager, 'close_all_workspaces'):
+            # resources of one script are not needed by the next
+            workspace_manager.close_all_workspaces()
+        failed = sum(1 for row in script_rows if row['exit_code'] != 0)
+        print(f'{os.path.basename(script_path)}: {len(script_rows)} steps, {failed} failed, '
+              f'{sum(row["seconds"] for row in script_rows):.1f} seconds')
+        for row in sorted(script_rows, key=lambda r: -r['seconds'])[:5]:
+            print(f'    {row["seconds"]:8.1f} s  step {row["step"]}: {row["command"]}')
+
+    with open(args.timings_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TIMINGS_HEADER_ROW)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'All scripts took {time.perf_counter() - start:.1f} seconds, step timings are in {args.timings_csv}.')
+    return 1 if any(row['exit_code'] != 0 for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,8 @@
 @echo off
 
 rem 1. load data:
-cate ds copy esacci.SOILMOISTURE.day.L3S.SSMV.multi-sensor.multi-platform.COMBINED.03-2.r1 --name SOILM_2006_2009_region_7_48_10_52 --time "2006-01-01,2009-12-31" --region "7,48,10,52" --vars "sm"
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name CLOUD_2006_2009_region_7_48_10_52 --time "2006-01-01,2009-12-31" --region "7,48,10,52" --vars "cfc"
+python "%~dp0../../ds_cache.py" copy esacci.SOILMOISTURE.day.L3S.SSMV.multi-sensor.multi-platform.COMBINED.03-2.r1 --name SOILM_2006_2009_region_7_48_10_52 --time "2006-01-01,2009-12-31" --region "7,48,10,52" --vars "sm"
+python "%~dp0../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name CLOUD_2006_2009_region_7_48_10_52 --time "2006-01-01,2009-12-31" --region "7,48,10,52" --vars "cfc"
 
 rmdir /S /Q uc02
 mkdir uc02
@@ -2,8 +2,8 @@
 
 rem 1. load data:
 
-cate ds copy esacci.OZONE.mon.L3.NP.multi-sensor.multi-platform.MERGED.fv0002.r1 --name OZ_UC4_1997_2008_GHG --time "1997-01-01,2008-12-31"  --region " -160,23,-69,50" --vars "O3_du_tot"
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name CC_UC4_1997_2008_GBT --time "1997-01-01,2008-12-31"  --region " -160,23,-69,50" --vars "cfc"
+python "%~dp0../../ds_cache.py" copy esacci.OZONE.mon.L3.NP.multi-sensor.multi-platform.MERGED.fv0002.r1 --name OZ_UC4_1997_2008_GHG --time "1997-01-01,2008-12-31"  --region " -160,23,-69,50" --vars "O3_du_tot"
+python "%~dp0../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name CC_UC4_1997_2008_GBT --time "1997-01-01,2008-12-31"  --region " -160,23,-69,50" --vars "cfc"
 
 rmdir /S /Q uc04
 mkdir uc04
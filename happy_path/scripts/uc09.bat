@@ -1,9 +1,9 @@
 @echo off
 
 rem Download some CCI Cloud data
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name CLOUD_2007 --time 2007-01-01,2007-03-31
+python "%~dp0../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name CLOUD_2007 --time 2007-01-01,2007-03-31
 rem Download some CCI Ozone data
-cate ds copy esacci.OZONE.mon.L3.NP.multi-sensor.multi-platform.MERGED.fv0002.r1 --name OZONE_2007 --time 2007-01-01,2007-03-31
+python "%~dp0../../ds_cache.py" copy esacci.OZONE.mon.L3.NP.multi-sensor.multi-platform.MERGED.fv0002.r1 --name OZONE_2007 --time 2007-01-01,2007-03-31
 
 rmdir /S /Q uc09
 mkdir uc09
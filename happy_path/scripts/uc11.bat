@@ -1,9 +1,9 @@
 @echo off
 
 rem Download Data. Select variables, region and time right away to save bandwith
-cate ds copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name "SST_polar_2007" --time "2007-01-01,2007-01-15" --vars "analysed_sst, sea_ice_fraction" --region " -180, 60, 180, 90"
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.AVHRR.multi-platform.AVHRR-AM.2-0.r1 --name "CLOUDS_polar_2007" --time "2007-01-01,2007-01-31" --vars "cfc, cee" --region " -180, 60, 180, 90"
-cate ds copy esacci.AEROSOL.mon.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 --name "AEROSOL_polar_2007" --time "2007-01-01,2007-03-31" --region " -180, 60, 180, 90"
+python "%~dp0../../ds_cache.py" copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name "SST_polar_2007" --time "2007-01-01,2007-01-15" --vars "analysed_sst, sea_ice_fraction" --region " -180, 60, 180, 90"
+python "%~dp0../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.AVHRR.multi-platform.AVHRR-AM.2-0.r1 --name "CLOUDS_polar_2007" --time "2007-01-01,2007-01-31" --vars "cfc, cee" --region " -180, 60, 180, 90"
+python "%~dp0../../ds_cache.py" copy esacci.AEROSOL.mon.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 --name "AEROSOL_polar_2007" --time "2007-01-01,2007-03-31" --region " -180, 60, 180, 90"
 
 rmdir /S /Q uc11
 mkdir uc11
@@ -1,7 +1,7 @@
 #!/usr/bin/env bash
 
 # Download Ozone data. Select variables, region and time right away to save bandwith
-cate ds copy esacci.OZONE.mon.L3.NP.multi-sensor.multi-platform.MERGED.fv0002.r1 --name "ozone-europe.mon.2007.2008" --time 2007-01-01,2008-12-31 --vars "O3_du_tot, O3_ndens" --region "POLYGON((-12.05078125 73.54664369613808,33.65234375 73.54664369613808,33.65234375 35.65604583948963,-12.05078125 35.65604583948963,-12.05078125 73.54664369613808))"
+python "$(dirname "$0")/../../ds_cache.py" copy esacci.OZONE.mon.L3.NP.multi-sensor.multi-platform.MERGED.fv0002.r1 --name "ozone-europe.mon.2007.2008" --time 2007-01-01,2008-12-31 --vars "O3_du_tot, O3_ndens" --region "POLYGON((-12.05078125 73.54664369613808,33.65234375 73.54664369613808,33.65234375 35.65604583948963,-12.05078125 35.65604583948963,-12.05078125 73.54664369613808))"
 
 rm -rf uc19/
 mkdir uc19
@@ -1,8 +1,8 @@
 @echo off
 
 rem Download data
-cate ds copy esacci.AEROSOL.mon.L3C.AER_PRODUCTS.AATSR.Envisat.ORAC.03-02.r1 --name uc22_aerosol --time "2010-01-01,2010-12-31" --region " -100,-90,80,90" --vars "AOD550_mean"
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name uc22_cloud --time "2010-01-01,2010-12-31" --region " -100,-90,80,90" --vars "cfc"
+python "%~dp0../../ds_cache.py" copy esacci.AEROSOL.mon.L3C.AER_PRODUCTS.AATSR.Envisat.ORAC.03-02.r1 --name uc22_aerosol --time "2010-01-01,2010-12-31" --region " -100,-90,80,90" --vars "AOD550_mean"
+python "%~dp0../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.multi-sensor.multi-platform.ATSR2-AATSR.2-0.r1 --name uc22_cloud --time "2010-01-01,2010-12-31" --region " -100,-90,80,90" --vars "cfc"
 
 rmdir /S /Q uc22
 mkdir uc22
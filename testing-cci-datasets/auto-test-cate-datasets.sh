@@ -22,23 +22,20 @@ for test_mode in "${test_modes[@]}";do
     cd "$project_dirs"/"$cate_env" || exit
     bash "$test_directory"/update_cate_envs.sh "$test_mode"
   fi
-  cd "$test_directory" || exit
-  source ~/miniconda3/bin/activate "$cate_env"
-  echo "activated environment $cate_env"
-  for cci_store in "${cci_stores[@]}";do
-    python "$test_directory"/test_cci_data_support.py "$cci_store" "$test_mode"
-  done
-  source ~/miniconda3/bin/deactivate
 done
+cd "$test_directory" || exit
 
 # activating production env for stability reasons.
-# The executed script does only do file joggling - so no need to have different envs for the runs.
+# The orchestrator runs every mode x store sweep concurrently in the env of its mode and then the
+# summaries in the production env, it only does process and file handling itself.
 source ~/miniconda3/bin/activate cate-env-production
-for test_mode in "${test_modes[@]}";do
-  for cci_store in "${cci_stores[@]}";do
-    python generate_summary.py "$cci_store" "$test_mode"
-  done
-done
+# a failed sweep or summary must not keep the results of the other cells from being published,
+# the exit status of the night is returned at the end
+status=0
+python orchestrator.py --modes "${test_modes[@]}" --stores "${cci_stores[@]}" || status=$?
+# what changed since the last run and what differs between stage and production
+python history_store.py transitions --since "$(date +%F)" || status=$?
+python history_store.py deltas stage production || status=$?
 source ~/miniconda3/bin/deactivate
 
 git add .
@@ -47,3 +44,5 @@ git push
 
 # writing automated email still needs to be implemened
 #   python write_email.py
+
+exit $status
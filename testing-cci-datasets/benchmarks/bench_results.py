@@ -0,0 +1,39 @@
+"""
+Results files of the benchmarks, one JSON line per run.
+"""
+import json
+import os
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=BENCHMARKS_DIR,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_previous_result(results_file, config):
+    previous = None
+    if not os.path.isfile(results_file):
+        return previous
+    with open(results_file) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result['config'] == config:
+                previous = result
+    return previous
+
+
+def append_result(results_file, result):
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, 'a') as f:
+        f.write(json.dumps(result) + '\n')
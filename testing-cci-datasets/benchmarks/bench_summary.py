@@ -0,0 +1,117 @@
+"""
+Benchmark of generate_summary.py on a synthetic result set.
+
+Writes a results CSV with the layout of test_cci_data_support.py and a
+configurable number of rows, by default 100000, and times
+generate_summary.main on it. Every result is appended to
+benchmarks/results/bench_summary.jsonl and compared to the last result of the
+same configuration.
+
+Usage, from the testing-cci-datasets directory:
+
+    python benchmarks/bench_summary.py --rows 100000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import generate_summary
+from bench_results import RESULTS_DIR
+from bench_results import append_result
+from bench_results import get_git_commit
+from bench_results import read_previous_result
+
+RESULTS_FILE = os.path.join(RESULTS_DIR, 'bench_summary.jsonl')
+STORE_NAME = 'synthetic-store'
+
+# ECV names as they appear in the results, some containing others
+ECVS = ['AEROSOL', 'BIOMASS', 'CLOUD', 'FIRE', 'GHG', 'ICESHEETS', 'LAKES',
+        'LC', 'OC', 'OZONE', 'PERMAFROST', 'SEAICE', 'SEALEVEL', 'SEASTATE',
+        'SEASURFACESALINITY', 'SNOW', 'SOILMOISTURE', 'SST', 'WATERVAPOUR',
+        'ICE']
+STAGE_VALUES = ['yes', 'yes', 'yes', 'no', 'not_tested']
+
+
+def write_synthetic_results(results_csv, num_rows, seed):
+    rng = random.Random(seed)
+    with open(results_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(generate_summary.HEADER_ROW)
+        for i in range(num_rows):
+            ecv = rng.choice(ECVS)
+            supported = 'yes' if rng.random() < 0.9 else 'no'
+            stages = [rng.choice(STAGE_VALUES) for _ in range(5)]
+            comment = '' if 'no' not in stages \
+                else f'Failed with "error {i}", see traceback'
+            writer.writerow([ecv,
+                             f'esacci.{ecv}.day.L3C.SYN.synthetic.r{i}',
+                             f'ESA {ecv} Climate Change Initiative {i}',
+                             supported, 'dataset', *stages, comment])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark generate_summary.py on a synthetic result '
+                    'set.')
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='Number of result rows.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the synthetic result set.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs, the fastest is reported.')
+    parser.add_argument('--no-store', action='store_true',
+                        help='Do not append the result to '
+                             f'{RESULTS_FILE}.')
+    args = parser.parse_args(args)
+    config = dict(rows=args.rows, seed=args.seed)
+
+    cwd = os.getcwd()
+    timings = []
+    # generate_summary reads and writes relative to the working directory
+    with tempfile.TemporaryDirectory(prefix='cate-e2e-bench-') as work_dir:
+        os.chdir(work_dir)
+        try:
+            os.makedirs(STORE_NAME)
+            results_csv = f'{STORE_NAME}/{generate_summary.DATE_TODAY}_test_' \
+                          f'{STORE_NAME}_data_support.csv'
+            write_synthetic_results(results_csv, args.rows, args.seed)
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                generate_summary.main([STORE_NAME])
+                timings.append(time.perf_counter() - start)
+        finally:
+            os.chdir(cwd)
+
+    seconds = min(timings)
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': get_git_commit(),
+        'config': config,
+        'seconds': seconds,
+        'rows_per_second': args.rows / seconds,
+    }
+    print(f'{args.rows} rows summarized in {seconds:.2f} s '
+          f'({result["rows_per_second"]:.0f} rows/s)')
+    previous = read_previous_result(RESULTS_FILE, config)
+    if previous is None:
+        print('No previous result with the same configuration.')
+    else:
+        print(f'Compared to commit {previous["commit"]} '
+              f'of {previous["timestamp"]}: {previous["seconds"]:.2f} s -> '
+              f'{seconds:.2f} s ({seconds / previous["seconds"] - 1:+.1%})')
+
+    if not args.no_store:
+        append_result(RESULTS_FILE, result)
+
+
+if __name__ == '__main__':
+    main()
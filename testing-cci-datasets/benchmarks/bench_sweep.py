@@ -0,0 +1,206 @@
+"""
+Offline benchmark of the test harness against the synthetic data store.
+
+Runs test_open_ds for every synthetic dataset, sequentially or on a worker
+pool, followed by generate_summary.main, and reports datasets per minute,
+per-stage latencies and peak memory. Every result is appended to
+benchmarks/results/bench_sweep.jsonl together with the current git commit
+and compared to the last result of the same configuration, so regressions
+of the harness show up between commits.
+
+Usage, from the testing-cci-datasets directory:
+
+    python benchmarks/bench_sweep.py --datasets 500 --workers 4
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import generate_summary
+import test_cci_data_support
+from bench_results import RESULTS_DIR
+from bench_results import append_result
+from bench_results import get_git_commit
+from bench_results import read_previous_result
+from cate.core import DATA_STORE_POOL
+from instrumentation import percentile
+from instrumentation import read_metrics_rows
+from result_store import ResultStore
+from synthetic_store import SYNTHETIC_STORE_INSTANCE_ID
+from synthetic_store import TIME_PERIODS
+from synthetic_store import register_synthetic_store
+
+RESULTS_FILE = os.path.join(RESULTS_DIR, 'bench_sweep.jsonl')
+# relative change of datasets per minute reported as a regression
+REGRESSION_THRESHOLD = 0.1
+
+
+def get_peak_rss():
+    # ru_maxrss is given in kilobytes on Linux
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return max(self_usage.ru_maxrss, children_usage.ru_maxrss) * 1024
+
+
+def _register_in_worker(store_name, store_params):
+    register_synthetic_store(store_name, **store_params)
+
+
+def run_sweep(store_params, workers, test_options):
+    store_name = SYNTHETIC_STORE_INSTANCE_ID
+    register_synthetic_store(store_name, **store_params)
+    os.makedirs(store_name, exist_ok=True)
+    support_file_name = f'{test_cci_data_support.date_today}_test_' \
+                        f'{store_name}_data_support'
+    results_csv = f'{store_name}/{support_file_name}.csv'
+    metrics_csv = f'{store_name}/{support_file_name}_metrics.csv'
+    result_store = ResultStore(f'{store_name}/{support_file_name}.sqlite')
+    store = DATA_STORE_POOL.get_store(store_name)
+    lds = DATA_STORE_POOL.get_store('local')
+    data_ids = list(store.get_data_ids())
+
+    start = time.perf_counter()
+    if workers > 1:
+        test_cci_data_support.run_parallel_sweep(
+            data_ids, result_store, store_name, workers,
+            test_options=test_options,
+            metrics_csv=metrics_csv,
+            worker_initializer=_register_in_worker,
+            initargs=(store_name, store_params))
+    else:
+        test_cci_data_support.run_sequential_sweep(
+            data_ids, store, lds, result_store, store_name,
+            test_options=test_options,
+            metrics_csv=metrics_csv)
+    result_store.export_csv(results_csv, test_cci_data_support.header_row)
+    result_store.close()
+    sweep_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    generate_summary.main([store_name])
+    summary_seconds = time.perf_counter() - start
+
+    return len(data_ids), sweep_seconds, summary_seconds, \
+        read_metrics_rows(metrics_csv)
+
+
+def get_stage_latencies(metrics_rows):
+    wall_times = {}
+    for row in metrics_rows:
+        wall_times.setdefault(row['stage'], []).append(float(row['wall_time']))
+    return {stage: {'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'max': max(values)}
+            for stage, values in sorted(wall_times.items())}
+
+
+def print_comparison(result, previous):
+    if previous is None:
+        print('No previous result with the same configuration.')
+        return
+    print(f'Compared to commit {previous["commit"]} '
+          f'of {previous["timestamp"]}:')
+    change = result['datasets_per_minute'] \
+        / previous['datasets_per_minute'] - 1
+    print(f'  datasets/min: {previous["datasets_per_minute"]:.1f} -> '
+          f'{result["datasets_per_minute"]:.1f} ({change:+.1%})')
+    if change < -REGRESSION_THRESHOLD:
+        print('  REGRESSION: the harness got slower.')
+    for stage, latencies in result['stage_latencies'].items():
+        previous_latencies = previous['stage_latencies'].get(stage)
+        if previous_latencies is None:
+            continue
+        print(f'  {stage} p50: {previous_latencies["p50"]:.3f} s -> '
+              f'{latencies["p50"]:.3f} s')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the test harness against a synthetic data '
+                    'store.')
+    parser.add_argument('--datasets', type=int, default=200,
+                        help='Number of synthetic datasets.')
+    parser.add_argument('--variables', type=int, default=3,
+                        help='Number of variables per dataset.')
+    parser.add_argument('--times', type=int, default=24,
+                        help='Number of time steps per dataset.')
+    parser.add_argument('--spatial-res', type=float, default=1.0,
+                        help='Spatial resolution in degrees.')
+    parser.add_argument('--time-chunk', type=int, default=1,
+                        help='Chunk size along time.')
+    parser.add_argument('--spatial-chunk', type=int, default=90,
+                        help='Chunk size along lat and lon.')
+    parser.add_argument('--time-periods', nargs='+',
+                        choices=list(TIME_PERIODS.keys()),
+                        default=list(TIME_PERIODS.keys()),
+                        help='Time periods the datasets are drawn from.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the synthetic store.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes.')
+    parser.add_argument('--open-once', action='store_true',
+                        help='Benchmark the --open-once mode.')
+    parser.add_argument('--no-store', action='store_true',
+                        help='Do not append the result to '
+                             f'{RESULTS_FILE}.')
+    args = parser.parse_args(args)
+
+    store_params = dict(num_datasets=args.datasets,
+                        num_variables=args.variables,
+                        num_times=args.times,
+                        spatial_res=args.spatial_res,
+                        time_chunk=args.time_chunk,
+                        spatial_chunk=args.spatial_chunk,
+                        time_periods=args.time_periods,
+                        seed=args.seed)
+    test_options = dict(open_once=args.open_once)
+    config = dict(store_params, workers=args.workers, **test_options)
+
+    cwd = os.getcwd()
+    # the harness writes its outputs relative to the working directory
+    with tempfile.TemporaryDirectory(prefix='cate-e2e-bench-') as work_dir:
+        os.chdir(work_dir)
+        try:
+            num_datasets, sweep_seconds, summary_seconds, metrics_rows = \
+                run_sweep(store_params, args.workers, test_options)
+        finally:
+            os.chdir(cwd)
+
+    peak_rss_per_dataset = [int(row['peak_rss']) for row in metrics_rows
+                            if row.get('peak_rss')]
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': get_git_commit(),
+        'config': config,
+        'datasets': num_datasets,
+        'sweep_seconds': sweep_seconds,
+        'summary_seconds': summary_seconds,
+        'datasets_per_minute': 60 * num_datasets / sweep_seconds,
+        'stage_latencies': get_stage_latencies(metrics_rows),
+        'peak_rss': get_peak_rss(),
+        'max_stage_peak_rss': max(peak_rss_per_dataset, default=None),
+    }
+
+    print(f'{num_datasets} datasets in {sweep_seconds:.1f} s '
+          f'({result["datasets_per_minute"]:.1f} datasets/min), '
+          f'summary in {summary_seconds:.2f} s, '
+          f'peak RSS {result["peak_rss"] / (1024 * 1024):.0f} MB')
+    for stage, latencies in result['stage_latencies'].items():
+        print(f'  {stage:<14} p50 {latencies["p50"]:.3f} s  '
+              f'p95 {latencies["p95"]:.3f} s  max {latencies["max"]:.3f} s')
+    print_comparison(result, read_previous_result(RESULTS_FILE, config))
+
+    if not args.no_store:
+        append_result(RESULTS_FILE, result)
+
+
+if __name__ == '__main__':
+    main()
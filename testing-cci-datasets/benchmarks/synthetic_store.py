@@ -0,0 +1,258 @@
+"""
+Synthetic xcube data store for benchmarking the test harness offline.
+
+The store offers any number of generated data cubes. Their data IDs follow
+the naming of the cci-store, e.g.
+``esacci.SST.day.L3C.SYN.synthetic.synthetic.SYN.1-0.r17``, so the harness
+derives ECV names from them the same way. Dimensions, variables, chunking,
+time periods and bounding boxes are derived reproducibly from a seed and the
+index of a dataset; the data itself is random and generated lazily with dask.
+"""
+import random
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+import xarray as xr
+from cate.core import DATA_STORE_POOL
+from xcube.constants import EXTENSION_POINT_DATA_STORES
+from xcube.core.store import DATASET_TYPE
+from xcube.core.store import DataStore
+from xcube.core.store import DataStoreConfig
+from xcube.core.store import DataStoreError
+from xcube.core.store import DatasetDescriptor
+from xcube.core.store import VariableDescriptor
+from xcube.util.jsonschema import JsonArraySchema
+from xcube.util.jsonschema import JsonDateSchema
+from xcube.util.jsonschema import JsonIntegerSchema
+from xcube.util.jsonschema import JsonNumberSchema
+from xcube.util.jsonschema import JsonObjectSchema
+from xcube.util.jsonschema import JsonStringSchema
+from xcube.util.plugin import get_extension_registry
+
+SYNTHETIC_STORE_ID = 'synthetic'
+SYNTHETIC_STORE_INSTANCE_ID = 'synthetic-store'
+
+ECVS = ['AEROSOL', 'CLOUD', 'FIRE', 'LC', 'OC', 'OZONE', 'SEAICE',
+        'SEALEVEL', 'SOILMOISTURE', 'SST']
+
+# time periods as they appear in the descriptors of the cci-store and are
+# parsed by get_time_range, mapped to a pandas frequency and a name used
+# in the data ID
+TIME_PERIODS = {'1D': ('1D', 'day'),
+                '5D': ('5D', '5-days'),
+                '8D': ('8D', '8-days'),
+                '1M': ('MS', 'mon'),
+                '1Y': ('YS', 'yr')}
+
+
+class SyntheticDataStore(DataStore):
+
+    def __init__(self,
+                 num_datasets=100,
+                 num_variables=3,
+                 num_times=24,
+                 spatial_res=1.0,
+                 time_chunk=1,
+                 spatial_chunk=90,
+                 time_periods=None,
+                 seed=0):
+        self._num_datasets = num_datasets
+        self._num_variables = num_variables
+        self._num_times = num_times
+        self._spatial_res = spatial_res
+        self._time_chunk = time_chunk
+        self._spatial_chunk = spatial_chunk
+        self._time_periods = time_periods or list(TIME_PERIODS.keys())
+        self._seed = seed
+        self._specs = {}
+        for index in range(num_datasets):
+            spec = self._new_spec(index)
+            self._specs[spec['data_id']] = spec
+
+    @classmethod
+    def get_data_store_params_schema(cls):
+        return JsonObjectSchema(
+            properties=dict(
+                num_datasets=JsonIntegerSchema(minimum=1, default=100),
+                num_variables=JsonIntegerSchema(minimum=1, default=3),
+                num_times=JsonIntegerSchema(minimum=1, default=24),
+                spatial_res=JsonNumberSchema(exclusive_minimum=0.0,
+                                             default=1.0),
+                time_chunk=JsonIntegerSchema(minimum=1, default=1),
+                spatial_chunk=JsonIntegerSchema(minimum=1, default=90),
+                time_periods=JsonArraySchema(
+                    items=JsonStringSchema(enum=list(TIME_PERIODS.keys()))),
+                seed=JsonIntegerSchema(default=0),
+            ),
+            additional_properties=False
+        )
+
+    @classmethod
+    def get_data_types(cls):
+        return DATASET_TYPE.alias,
+
+    def get_data_types_for_data(self, data_id):
+        self._get_spec(data_id)
+        return DATASET_TYPE.alias,
+
+    def get_data_ids(self, data_type=None, include_attrs=None):
+        for data_id, spec in self._specs.items():
+            if include_attrs is None:
+                yield data_id
+            else:
+                yield data_id, {'title': spec['title']}
+
+    def has_data(self, data_id, data_type=None):
+        return data_id in self._specs
+
+    def describe_data(self, data_id, data_type=None):
+        spec = self._get_spec(data_id)
+        dims = {'time': spec['num_times'],
+                'lat': spec['height'],
+                'lon': spec['width']}
+        chunks = {'time': self._time_chunk,
+                  'lat': self._spatial_chunk,
+                  'lon': self._spatial_chunk}
+        data_vars = {
+            var_name: VariableDescriptor(var_name,
+                                         dtype='float32',
+                                         dims=('time', 'lat', 'lon'),
+                                         chunks=tuple(chunks.values()),
+                                         attrs={'units': '1'})
+            for var_name in spec['var_names']
+        }
+        times = spec['times']
+        return DatasetDescriptor(
+            data_id,
+            data_type=DATASET_TYPE,
+            crs='WGS84',
+            bbox=spec['bbox'],
+            time_range=(times[0].strftime('%Y-%m-%d'),
+                        times[-1].strftime('%Y-%m-%d')),
+            time_period=spec['time_period'],
+            spatial_res=self._spatial_res,
+            dims=dims,
+            data_vars=data_vars,
+            attrs={'title': spec['title']}
+        )
+
+    def get_data_opener_ids(self, data_id=None, data_type=None):
+        return f'{DATASET_TYPE.alias}:zarr:{SYNTHETIC_STORE_ID}',
+
+    def get_open_data_params_schema(self, data_id=None, opener_id=None):
+        return JsonObjectSchema(
+            properties=dict(
+                variable_names=JsonArraySchema(items=JsonStringSchema()),
+                time_range=JsonDateSchema.new_range(),
+                bbox=JsonArraySchema(items=(JsonNumberSchema(),
+                                            JsonNumberSchema(),
+                                            JsonNumberSchema(),
+                                            JsonNumberSchema())),
+            ),
+            additional_properties=True
+        )
+
+    def open_data(self, data_id, opener_id=None, **open_params):
+        spec = self._get_spec(data_id)
+        dataset = self._new_cube(spec)
+        variable_names = open_params.get('variable_names')
+        if variable_names:
+            dataset = dataset[list(variable_names)]
+        time_range = open_params.get('time_range')
+        if time_range:
+            dataset = dataset.sel(time=slice(time_range[0], time_range[1]))
+        bbox = open_params.get('bbox')
+        if bbox:
+            x_min, y_min, x_max, y_max = bbox
+            dataset = dataset.sel(lon=slice(x_min, x_max),
+                                  lat=slice(y_min, y_max))
+        return dataset
+
+    @classmethod
+    def get_search_params_schema(cls, data_type=None):
+        return JsonObjectSchema()
+
+    def search_data(self, data_type=None, **search_params):
+        for data_id in self._specs:
+            yield self.describe_data(data_id)
+
+    def _get_spec(self, data_id):
+        if data_id not in self._specs:
+            raise DataStoreError(f'Unknown data ID "{data_id}".')
+        return self._specs[data_id]
+
+    def _new_spec(self, index):
+        rng = random.Random(self._seed * 1000003 + index)
+        ecv = ECVS[index % len(ECVS)]
+        time_period = rng.choice(self._time_periods)
+        frequency, frequency_name = TIME_PERIODS[time_period]
+        # bounding boxes aligned to the grid, at least 4 cells wide
+        res = self._spatial_res
+        min_cells = 4
+        lon_cells = int(360 / res)
+        lat_cells = int(180 / res)
+        width = rng.randint(min_cells, lon_cells)
+        height = rng.randint(min_cells, lat_cells)
+        x_min = -180 + rng.randint(0, lon_cells - width) * res
+        y_min = -90 + rng.randint(0, lat_cells - height) * res
+        start = pd.Timestamp('1990-01-01') \
+            + pd.Timedelta(days=rng.randint(0, 20 * 365))
+        data_id = f'esacci.{ecv}.{frequency_name}.L3C.SYN.synthetic.' \
+                  f'synthetic.SYN.1-0.r{index}'
+        return {
+            'data_id': data_id,
+            'index': index,
+            'title': f'Synthetic {ecv} dataset {index}',
+            'time_period': time_period,
+            'times': pd.date_range(start.normalize(),
+                                   periods=self._num_times,
+                                   freq=frequency),
+            'num_times': self._num_times,
+            'bbox': (x_min, y_min, x_min + width * res, y_min + height * res),
+            'width': width,
+            'height': height,
+            'var_names': [f'{ecv.lower()}_var_{i}'
+                          for i in range(self._num_variables)],
+        }
+
+    def _new_cube(self, spec):
+        res = self._spatial_res
+        x_min, y_min, _, _ = spec['bbox']
+        lon = x_min + res / 2 + np.arange(spec['width']) * res
+        lat = y_min + res / 2 + np.arange(spec['height']) * res
+        shape = (spec['num_times'], spec['height'], spec['width'])
+        chunks = (self._time_chunk, self._spatial_chunk, self._spatial_chunk)
+        data_vars = {}
+        for i, var_name in enumerate(spec['var_names']):
+            state = da.random.RandomState(self._seed + spec['index'] * 97 + i)
+            data_vars[var_name] = xr.DataArray(
+                state.random_sample(shape, chunks=chunks).astype('float32'),
+                dims=('time', 'lat', 'lon'),
+                attrs={'units': '1'})
+        return xr.Dataset(data_vars,
+                          coords={'time': spec['times'],
+                                  'lat': lat,
+                                  'lon': lon},
+                          attrs={'title': spec['title']})
+
+
+def register_synthetic_store(store_instance_id=SYNTHETIC_STORE_INSTANCE_ID,
+                             **store_params):
+    """
+    Make the synthetic store available in cate's DATA_STORE_POOL.
+    Must be called in every process which uses the store.
+    """
+    registry = get_extension_registry()
+    if not registry.has_extension(EXTENSION_POINT_DATA_STORES,
+                                  SYNTHETIC_STORE_ID):
+        registry.add_extension(EXTENSION_POINT_DATA_STORES,
+                               SYNTHETIC_STORE_ID,
+                               component=SyntheticDataStore,
+                               description='Synthetic data store for '
+                                           'benchmarks')
+    DATA_STORE_POOL.add_store_config(
+        store_instance_id,
+        DataStoreConfig(SYNTHETIC_STORE_ID,
+                        store_params=store_params,
+                        title='Synthetic data store'))
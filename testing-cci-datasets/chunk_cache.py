@@ -0,0 +1,335 @@
+"""
+Read-through cache of the data chunks and byte ranges read from the remote
+stores, shared by all sweeps of a host.
+
+The sweeps of the nightly matrix read the same chunks of the same subsets
+with every cate version, reruns read them again. The cache sits below the
+stores: it wraps CciOdp.get_data_chunk of xcube-cci, which reads the chunks
+of the cci-store from the ODP, and S3FileSystem._cat_file of s3fs, which
+reads the objects and byte ranges of the cci-zarr-store. The chunks of the
+ODP are keyed by their request (data ID, variables and time range) and chunk
+index together with the fingerprint of the catalog of the run, so they are
+shared by all cate and plugin versions reading the same catalog. The raw
+byte ranges of s3fs are shared by all.
+
+Chunks are stored once per content, in files named by their SHA-256. A
+SQLite index in WAL mode maps the request of a chunk to its content and is
+shared by concurrent processes. Entries expire after CHUNK_CACHE_TTL, so
+data changed in the stores without a change of the catalog is read again
+after a week, and the least recently used entries are evicted once the
+chunks exceed the maximum size.
+
+Hits, misses, bytes saved and bytes fetched are counted per run and written
+to the database after every dataset, so the counts of all workers of a run
+add up.
+"""
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+CHUNK_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                               'cate-e2e', 'chunks')
+# bytes the chunks may occupy before least recently used entries are evicted
+CHUNK_CACHE_MAX_SIZE = 20 * 1024 * 1024 * 1024
+# seconds after which a chunk is read from the store again, even if the
+# catalog did not change
+CHUNK_CACHE_TTL = 7 * 24 * 60 * 60
+# the size of the cache is checked every this many new chunks and after
+# every dataset
+EVICT_INTERVAL = 100
+# share of the maximum size the cache is evicted down to
+EVICT_TARGET = 0.9
+LOCK_TIMEOUT = 60
+
+COUNTER_NAMES = ['hits', 'misses', 'bytes_saved', 'bytes_fetched']
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+CREATE TABLE IF NOT EXISTS counters (
+    run_id TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    bytes_saved INTEGER NOT NULL DEFAULT 0,
+    bytes_fetched INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+# cache used by the patched store functions of this process
+_installed_cache = None
+
+
+def get_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str)
+                          .encode()).hexdigest()
+
+
+class ChunkCache:
+
+    def __init__(self,
+                 cache_dir=CHUNK_CACHE_DIR,
+                 max_size=CHUNK_CACHE_MAX_SIZE,
+                 ttl=CHUNK_CACHE_TTL,
+                 run_id=None,
+                 catalog=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.ttl = ttl
+        self.run_id = run_id
+        # fingerprint of the data ID listing of the store, part of the keys
+        # of the ODP chunks
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._connection = None
+        self._counters = dict.fromkeys(COUNTER_NAMES, 0)
+        # keys of hits, their last use is written with the counters
+        self._used = set()
+        self._puts = 0
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+
+    def __getstate__(self):
+        # sent to the worker processes without connection and counts
+        return dict(cache_dir=self.cache_dir, max_size=self.max_size,
+                    ttl=self.ttl, run_id=self.run_id, catalog=self.catalog)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            connection = sqlite3.connect(
+                os.path.join(self.cache_dir, 'index.sqlite'),
+                timeout=LOCK_TIMEOUT, isolation_level=None,
+                check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _get_object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    def get(self, key):
+        """Cached bytes of *key*, or None on a miss."""
+        with self._lock:
+            try:
+                row = self.connection.execute(
+                    'SELECT digest, created FROM entries WHERE key = ?',
+                    (key,)).fetchone()
+                data = None
+                if row is not None and time.time() - row[1] <= self.ttl:
+                    with open(self._get_object_path(row[0]), 'rb') as f:
+                        data = f.read()
+            except (sqlite3.Error, OSError):
+                # evicted by another process or the index is busy, the
+                # chunk is read from the store
+                data = None
+            if data is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._counters['bytes_saved'] += len(data)
+            self._used.add(key)
+            return data
+
+    def put(self, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._get_object_path(digest)
+        with self._lock:
+            self._counters['bytes_fetched'] += len(data)
+            try:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # written to a temporary file first, so concurrent
+                    # readers never see a partially written chunk
+                    fd, temp_path = tempfile.mkstemp(
+                        dir=os.path.dirname(path), suffix='.tmp')
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                    os.replace(temp_path, path)
+                now = time.time()
+                with self.connection:
+                    self.connection.execute('BEGIN IMMEDIATE')
+                    self.connection.execute(
+                        'INSERT OR IGNORE INTO objects (digest, size) '
+                        'VALUES (?, ?)', (digest, len(data)))
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO entries '
+                        '(key, digest, created, last_used) '
+                        'VALUES (?, ?, ?, ?)', (key, digest, now, now))
+            except (sqlite3.Error, OSError):
+                return
+            self._puts += 1
+            if self._puts % EVICT_INTERVAL == 0:
+                try:
+                    self._evict()
+                except sqlite3.Error:
+                    # another process is evicting
+                    pass
+
+    def get_size(self):
+        return self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def _evict(self):
+        total_size = self.get_size()
+        if total_size <= self.max_size:
+            return
+        removed = []
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            cursor = self.connection.execute(
+                'SELECT key, digest FROM entries ORDER BY last_used')
+            for key, digest in cursor.fetchall():
+                if total_size <= self.max_size * EVICT_TARGET:
+                    break
+                self.connection.execute('DELETE FROM entries WHERE key = ?',
+                                        (key,))
+                # chunks are shared by all requests with the same content
+                if self.connection.execute(
+                        'SELECT 1 FROM entries WHERE digest = ? LIMIT 1',
+                        (digest,)).fetchone() is None:
+                    size = self.connection.execute(
+                        'SELECT size FROM objects WHERE digest = ?',
+                        (digest,)).fetchone()
+                    self.connection.execute(
+                        'DELETE FROM objects WHERE digest = ?', (digest,))
+                    if size is not None:
+                        total_size -= size[0]
+                        removed.append(digest)
+        for digest in removed:
+            try:
+                os.remove(self._get_object_path(digest))
+            except OSError:
+                continue
+
+    def flush(self):
+        """Write the counts and last uses since the last flush."""
+        with self._lock:
+            counters = self._counters
+            used = self._used
+            self._counters = dict.fromkeys(COUNTER_NAMES, 0)
+            self._used = set()
+            try:
+                with self.connection:
+                    self.connection.execute('BEGIN IMMEDIATE')
+                    self.connection.executemany(
+                        'UPDATE entries SET last_used = ? WHERE key = ?',
+                        [(time.time(), key) for key in used])
+                    if self.run_id is not None:
+                        self.connection.execute(
+                            'INSERT OR IGNORE INTO counters (run_id) '
+                            'VALUES (?)', (self.run_id,))
+                        self.connection.execute(
+                            'UPDATE counters SET '
+                            + ', '.join(f'{name} = {name} + ?'
+                                        for name in COUNTER_NAMES)
+                            + ' WHERE run_id = ?',
+                            [counters[name] for name in COUNTER_NAMES]
+                            + [self.run_id])
+                self._evict()
+            except sqlite3.Error:
+                pass
+
+    def reset_counters(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM counters WHERE run_id = ?',
+                                    (self.run_id,))
+
+    def get_counters(self):
+        """Counts of the run of this cache, including the hit rate."""
+        row = self.connection.execute(
+            f'SELECT {", ".join(COUNTER_NAMES)} FROM counters '
+            f'WHERE run_id = ?', (self.run_id,)).fetchone()
+        counters = dict(zip(COUNTER_NAMES, row or [0] * len(COUNTER_NAMES)))
+        requests = counters['hits'] + counters['misses']
+        counters['hit_rate'] = counters['hits'] / requests if requests else None
+        return counters
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _patch_cci_odp():
+    try:
+        from xcube_cci.cciodp import CciOdp
+    except ImportError:
+        return False
+    get_data_chunk = CciOdp.get_data_chunk
+
+    @functools.wraps(get_data_chunk)
+    def cached_get_data_chunk(self, request, dim_indexes):
+        # the request names the data ID and variables of the chunk
+        key = get_key('odp', 'cci-store', _installed_cache.catalog, request,
+                      dim_indexes)
+        data = _installed_cache.get(key)
+        if data is None:
+            data = get_data_chunk(self, request, dim_indexes)
+            if data is not None:
+                _installed_cache.put(key, data)
+        return data
+
+    CciOdp.get_data_chunk = cached_get_data_chunk
+    return True
+
+
+def _patch_s3fs():
+    try:
+        from s3fs import S3FileSystem
+    except ImportError:
+        return False
+    cat_file = S3FileSystem._cat_file
+
+    @functools.wraps(cat_file)
+    async def cached_cat_file(self, path, version_id=None, start=None,
+                              end=None):
+        key = get_key('s3', getattr(self, 'client_kwargs', {}).get(
+                          'endpoint_url'), path,
+                      version_id, start, end)
+        data = _installed_cache.get(key)
+        if data is None:
+            data = await cat_file(self, path, version_id=version_id,
+                                  start=start, end=end)
+            _installed_cache.put(key, data)
+        return data
+
+    S3FileSystem._cat_file = cached_cat_file
+    return True
+
+
+def install_chunk_cache(cache):
+    """
+    Read remote chunks of this process through *cache*. The stores are
+    patched once per process, later calls only replace the cache.
+    Returns the names of the patched readers.
+    """
+    global _installed_cache
+    first = _installed_cache is None
+    _installed_cache = cache
+    if not first:
+        return []
+    patched = []
+    if _patch_cci_odp():
+        patched.append('CciOdp.get_data_chunk')
+    if _patch_s3fs():
+        patched.append('S3FileSystem._cat_file')
+    return patched
@@ -0,0 +1,112 @@
+"""
+Chunk streaming reduction of data variables.
+
+Instead of loading a whole variable into one NumPy array, the variable is
+reduced block by block. Blocks are computed in batches whose total size stays
+below a memory ceiling, every block is reduced to a scalar right away, so at
+no time more than about one batch is held in memory.
+"""
+import time
+
+import dask
+import dask.array as da
+import numpy as np
+
+
+class ChunkReadError(Exception):
+    """Raised if a single block of a variable cannot be read."""
+
+    def __init__(self, block_index, cause):
+        super().__init__(f'Failed reading chunk {block_index}: {cause!r}')
+        self.block_index = block_index
+        self.cause = cause
+
+
+def _as_dask_array(data_array, memory_limit):
+    if isinstance(data_array.data, da.Array):
+        return data_array.data
+    if data_array.ndim == 0:
+        return data_array.chunk().data
+    # variables which are not chunked are split along their first dimension
+    first_dim = data_array.dims[0]
+    bytes_per_step = max(1, data_array.nbytes // max(1, data_array.shape[0]))
+    step = max(1, memory_limit // bytes_per_step)
+    return data_array.chunk({first_dim: step}).data
+
+
+def _reduce_block(block):
+    if np.issubdtype(block.dtype, np.number) \
+            or np.issubdtype(block.dtype, np.bool_):
+        return block.sum(dtype='float64')
+    # values which cannot be summed up are just read
+    return block.size
+
+
+def _iter_batches(data, memory_limit):
+    batch = []
+    batch_bytes = 0
+    # the first block is read on its own, which gives the time to it
+    first = True
+    for block_index in np.ndindex(*data.numblocks):
+        block = data.blocks[block_index]
+        if batch and (first or batch_bytes + block.nbytes > memory_limit):
+            yield batch
+            first = False
+            batch = []
+            batch_bytes = 0
+        batch.append((block_index, block))
+        batch_bytes += block.nbytes
+    if batch:
+        yield batch
+
+
+def stream_reduce(data_array, memory_limit, pass_through=()):
+    """
+    Read all values of *data_array* block by block.
+
+    :param data_array: xarray.DataArray, lazy or in memory
+    :param memory_limit: maximum number of bytes read per batch of blocks.
+        A single block bigger than the limit is read on its own.
+    :param pass_through: exception types which are re-raised immediately,
+        e.g. time outs, instead of being attributed to a block
+    :return: dictionary with the sum of all values, the number of bytes
+        read, the number of chunks touched, the elapsed seconds, the
+        seconds until the first chunk was read and the throughput in MB/s
+    :raise ChunkReadError: if a block cannot be read
+    """
+    start = time.perf_counter()
+    data = _as_dask_array(data_array, memory_limit)
+    total = 0.0
+    bytes_read = 0
+    chunks = 0
+    first_chunk_seconds = None
+    for batch in _iter_batches(data, memory_limit):
+        try:
+            results = dask.compute(*[dask.delayed(_reduce_block)(block)
+                                     for _, block in batch])
+        except pass_through:
+            raise
+        except Exception:
+            # read the blocks of the batch one by one to find the bad one
+            results = []
+            for block_index, block in batch:
+                try:
+                    results.append(
+                        dask.compute(dask.delayed(_reduce_block)(block))[0])
+                except pass_through:
+                    raise
+                except Exception as e:
+                    raise ChunkReadError(block_index, e) from e
+        total += float(sum(results))
+        bytes_read += sum(block.nbytes for _, block in batch)
+        chunks += len(batch)
+        if first_chunk_seconds is None:
+            first_chunk_seconds = time.perf_counter() - start
+    seconds = time.perf_counter() - start
+    return {'sum': total,
+            'bytes_read': bytes_read,
+            'chunks': chunks,
+            'seconds': seconds,
+            'first_chunk_seconds': first_chunk_seconds,
+            'throughput': bytes_read / (1024 * 1024) / seconds
+            if seconds > 0 else 0.0}
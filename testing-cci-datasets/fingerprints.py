@@ -0,0 +1,154 @@
+"""
+Fingerprints of the tested datasets, used by the incremental sweep.
+
+The fingerprint of a dataset is the SHA-256 of its data types, its descriptor
+as returned by describe_data (dimensions, variables, time range, bbox and
+attributes) and the versions of the store, cate and the store plugins. It is
+kept together with the result row of the last test of the dataset.
+
+An incremental sweep describes every dataset, through the metadata cache if
+the run has one, and tests it again only if its fingerprint changed, its
+last test failed or is older than the maximum age. The last result row of
+every other dataset is carried over, with a comment naming the date it was
+tested.
+"""
+import hashlib
+import json
+import sqlite3
+from datetime import timedelta
+
+from xcube.core.store import DATASET_TYPE
+
+from metadata_cache import get_environment_version
+from result_store import is_failed
+
+FINGERPRINT_DB = 'dataset_fingerprints.sqlite'
+# days after which a dataset is tested again, even if it did not change
+MAX_RESULT_AGE_DAYS = 7
+LOCK_TIMEOUT = 60
+
+
+def get_fingerprint(store, store_name, data_id, metadata_cache=None):
+    if metadata_cache is not None:
+        data_types = metadata_cache.get_data_types_for_data(
+            store, store_name, data_id)
+    else:
+        data_types = store.get_data_types_for_data(data_id)
+    data_types = [str(data_type) for data_type in data_types]
+    descriptor = None
+    for data_type in data_types:
+        if DATASET_TYPE.is_super_type_of(data_type):
+            if metadata_cache is not None:
+                descriptor = metadata_cache.describe_data(
+                    store, store_name, data_id, data_type)
+            else:
+                descriptor = store.describe_data(data_id=data_id,
+                                                 data_type=data_type)
+            descriptor = descriptor.to_dict()
+            break
+    key = json.dumps([get_environment_version(store_name), data_types,
+                      descriptor], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_carried_over_comment(tested_date, comment):
+    carried_over = f'Carried over from {tested_date}, dataset unchanged.'
+    return f'{carried_over} {comment}' if comment else carried_over
+
+
+class FingerprintStore:
+
+    def __init__(self, path=FINGERPRINT_DB):
+        self.path = path
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    mode TEXT NOT NULL,
+                    store TEXT NOT NULL,
+                    data_id TEXT NOT NULL,
+                    fingerprint TEXT,
+                    tested_date TEXT NOT NULL,
+                    row TEXT NOT NULL,
+                    PRIMARY KEY (mode, store, data_id)
+                ) WITHOUT ROWID
+            ''')
+            self._connection = connection
+        return self._connection
+
+    def get(self, mode, store_name, data_id):
+        """(fingerprint, tested date, result row) of the last test of a
+        dataset, or None."""
+        record = self.connection.execute(
+            'SELECT fingerprint, tested_date, row FROM fingerprints '
+            'WHERE mode = ? AND store = ? AND data_id = ?',
+            (mode, store_name, data_id)).fetchone()
+        if record is None:
+            return None
+        fingerprint, tested_date, row = record
+        return fingerprint, tested_date, json.loads(row)
+
+    def put_many(self, mode, store_name, records):
+        """Store (data_id, fingerprint, tested date, result row) records."""
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO fingerprints '
+                '(mode, store, data_id, fingerprint, tested_date, row) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(mode, store_name, data_id, fingerprint, tested_date,
+                  json.dumps(row))
+                 for data_id, fingerprint, tested_date, row in records])
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def plan_incremental_sweep(data_ids, store, store_name, mode,
+                           fingerprint_store, today,
+                           max_age_days=MAX_RESULT_AGE_DAYS,
+                           metadata_cache=None):
+    """
+    Split *data_ids* into the datasets to test and the ones whose result is
+    carried over. Datasets are described through *metadata_cache* if given.
+
+    :return: the IDs to test, the carried over rows by ID, the tested date of
+        every carried over dataset and the new fingerprint of every dataset,
+        None if it could not be described
+    """
+    oldest_date = (today - timedelta(days=max_age_days)).isoformat()
+    to_test = []
+    carried_rows = {}
+    tested_dates = {}
+    fingerprints = {}
+    for data_id in data_ids:
+        try:
+            fingerprint = get_fingerprint(store, store_name, data_id,
+                                          metadata_cache)
+        except Exception:
+            # the test reports why the dataset cannot be described
+            fingerprint = None
+        fingerprints[data_id] = fingerprint
+        record = fingerprint_store.get(mode, store_name, data_id)
+        if fingerprint is None or record is None:
+            to_test.append(data_id)
+            continue
+        last_fingerprint, tested_date, row = record
+        if last_fingerprint != fingerprint or is_failed(row) \
+                or tested_date < oldest_date:
+            to_test.append(data_id)
+            continue
+        row = dict(row)
+        row['comment'] = get_carried_over_comment(tested_date,
+                                                  row.get('comment', ''))
+        carried_rows[data_id] = row
+        tested_dates[data_id] = tested_date
+    return to_test, carried_rows, tested_dates, fingerprints
@@ -1,186 +1,249 @@
+import argparse
 import csv
 import json
 import os
 import shutil
-import sys
 from datetime import datetime
 from datetime import timedelta
 
+import pandas as pd
+
+from history_store import HISTORY_DB
+from history_store import HistoryStore
+from instrumentation import percentile
+from result_store import STAGE_COLUMNS
+from result_store import VERIFICATION_FLAGS
+from result_store import open_atomically
+from result_store import write_csv_atomically
+from result_store import write_json_atomically
+from sampler import SAMPLED_DIR
+from sampler import get_sampled_mode
+
 # header for CSV report
 HEADER_ROW = ['ECV-Name', 'Dataset-ID', 'Dataset-Title', 'supported',
               'Data-Type', 'open(1)', 'open_temp(2)', 'open_bbox(3)',
               'cache(4)', 'map(5)', 'comment']
 
-DATE_TODAY = datetime.date(datetime.now())
+# result columns counted in the summary CSV
+SUMMARY_COLUMNS = ['supported', 'open(1)', 'open_temp(2)', 'open_bbox(3)',
+                   'cache(4)', 'map(5)']
 
+# columns of the metrics CSV written by test_cci_data_support.py
+METRICS_COLUMNS = ['wall_time', 'cpu_time', 'bytes_read', 'peak_rss']
 
-def append_dict_as_row(file_name, dict_of_elem, field_names):
-    # Open file in append mode
-    with open(file_name, 'a+', newline='') as write_obj:
-        # Create a writer object from csv module
-        dict_writer = csv.DictWriter(write_obj, fieldnames=field_names)
-        # Add dictionary as wor in the csv
-        dict_writer.writerow(dict_of_elem)
-        write_obj.close()
-
-
-def update_csv(results_csv, header_row, results_for_dataset_collection):
-    if not os.path.isfile(results_csv):
-        with open(results_csv, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(header_row)
-    append_dict_as_row(results_csv, results_for_dataset_collection, header_row)
-
-
-def sort_csv(input_csv):
-    output_csv = f'{input_csv[:-4]}_sorted.csv'
-    with open(input_csv, 'r', newline='') as f_input:
-        csv_input = csv.DictReader(f_input)
-        data = sorted(csv_input, key=lambda row: (row['Dataset-ID']))
-
-    with open(output_csv, 'w', newline='') as f_output:
-        csv_output = csv.DictWriter(f_output, fieldnames=csv_input.fieldnames)
-        csv_output.writeheader()
-        csv_output.writerows(data)
-
-    return output_csv
-
-
-# creating summary csv
-def read_all_result_rows(path, header_row):
-    test_data_sets_list = []
-    with open(path) as csvfile:
-        reader = csv.DictReader(csvfile, fieldnames=header_row, delimiter=',')
-        firstline = True
-        for row in reader:
-            if firstline:  # skip first line
-                firstline = False
-                continue
-            test_data_sets_list.append(row)
-    return test_data_sets_list
-
-
-def get_list_of_ecvs(data_sets):
-    ecvs = []
-    for dataset in data_sets:
-        if dataset['ECV-Name'] in ecvs:
-            continue
-        else:
-            ecvs.append(dataset['ECV-Name'])
-    ecvs.append('ALL_ECVS')
-    return ecvs
+# columns of the throughput CSV written by throughput_probe.py, compared
+# between the stores
+THROUGHPUT_COLUMNS = ['throughput', 'time_to_first_byte', 'open_seconds',
+                      'chunks']
 
+DATE_TODAY = datetime.date(datetime.now())
 
-def get_summary_column(column_name):
-    sep = '('
-    s_column_name = column_name.split(sep, 1)[0]
-    return s_column_name
 
+def read_result_table(results_csv):
+    # all cells as strings, empty cells stay empty strings
+    return pd.read_csv(results_csv, dtype=str, keep_default_na=False)
 
-def update_summary_row(summary_columns, summary_row_new, dataset):
-    for column in summary_columns:
-        summary_column = get_summary_column(column)
-        if 'yes' in dataset[column]:
-            summary_row_new[summary_column] += 1
-        else:
-            if column == 'supported':
-                column_failed = f'not_{summary_column}'
-            else:
-                column_failed = f'{summary_column}_failed'
-            summary_row_new[column_failed] += 1
-    return summary_row_new
-
-
-def count_success_fail(data_sets, ecv):
-    summary_row_new = {}
-    summary_columns = ['supported',
-                       'open(1)',
-                       'open_temp(2)',
-                       'open_bbox(3)',
-                       'cache(4)',
-                       'map(5)']
-    for i in summary_columns:
-        i_short = get_summary_column(i)
-        summary_row_new[i_short] = 0
-        if i_short == 'supported':
-            summary_row_new[f'not_{i_short}'] = 0
-        else:
-            summary_row_new[f'{i_short}_failed'] = 0
-        summary_row_new[f'{i_short}_percentage'] = 0
-
-    if 'ALL_ECVS' not in ecv:
-        for dataset in data_sets:
-            if ecv in dataset['ECV-Name']:
-                summary_row_new = update_summary_row(summary_columns,
-                                                     summary_row_new,
-                                                     dataset)
-        tot_nr_datasets = sum(
-            [summary_row_new['supported'], summary_row_new['not_supported']]
-        )
-    else:
-        for dataset in data_sets:
-            summary_row_new = update_summary_row(summary_columns,
-                                                 summary_row_new,
-                                                 dataset)
-        tot_nr_datasets = len(data_sets)
-
-    for i in summary_columns:
-        i_short = get_summary_column(i)
-        try:
-            summary_row_new[f'{i_short}_percentage'] = \
-                100 * summary_row_new[i_short] / (tot_nr_datasets -
-                                                  summary_row_new[
-                                                      'not_supported'])
-        except ZeroDivisionError:
-            summary_row_new[f'{i_short}_percentage'] = 0.0
 
-    summary_row_new['ecv'] = ecv
+def sort_result_table(table):
+    # stable, so rows with the same id keep their order
+    return table.sort_values('Dataset-ID', kind='stable', ignore_index=True)
 
-    return summary_row_new
 
+def write_table(csv_path, table, header_row):
+    # written with the csv module, in the same dialect as csv.DictWriter
+    with open_atomically(csv_path, '.csv.tmp', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header_row)
+        writer.writerows(table.itertuples(index=False, name=None))
 
-def create_list_of_failed(test_data_sets, failed_csv, header_row):
-    for dataset in test_data_sets:
-        if dataset['supported'] == 'yes' and (dataset['open(1)'] == 'no' or
-                                              dataset['open_temp(2)'] == 'no' or
-                                              dataset['open_bbox(3)'] == 'no' or
-                                              dataset['cache(4)'] == 'no' or
-                                              dataset['map(5)'] == 'no'):
-            update_csv(failed_csv, header_row, dataset)
 
-    sorted_csv = sort_csv(failed_csv)
-    return sorted_csv
+def get_summary_column(column_name):
+    sep = '('
+    s_column_name = column_name.split(sep, 1)[0]
+    return s_column_name
 
 
-def create_json_of_ids_with_verification_flags(data_sets, results_dir):
-    dict_with_verify_flags = {}
-    for dataset in data_sets:
-        data_type = dataset['Data-Type']
-        title = dataset['Dataset-Title']
-        verify_flags = []
-        if 'yes' in dataset['open(1)']:
-            verify_flags.append('open')
-        if 'yes' in dataset['open_temp(2)']:
-            verify_flags.append('constrain_time')
-        if 'yes' in dataset['open_bbox(3)']:
-            verify_flags.append('constrain_region')
-        if 'yes' in dataset['cache(4)']:
-            verify_flags.append('write_zarr')
+def get_passed_table(table):
+    return pd.DataFrame({column: table[column].str.contains('yes',
+                                                            regex=False)
+                         for column in SUMMARY_COLUMNS})
 
-        dict_with_verify_flags[dataset['Dataset-ID']] = \
-            {'data_type': data_type,
-             'verification_flags': verify_flags,
-             'title': title
-             }
 
-    with open(f'{results_dir}/'
-              f'{DATE_TODAY}_DrsID_verification_flags.json',
-              'w') as f:
-        json.dump(dict_with_verify_flags, f, indent=4)
+def new_summary_row(ecv, passed, total):
+    summary_row = {}
+    for column in SUMMARY_COLUMNS:
+        short_column = get_summary_column(column)
+        summary_row[short_column] = passed[column]
+        if short_column == 'supported':
+            summary_row[f'not_{short_column}'] = total - passed[column]
+        else:
+            summary_row[f'{short_column}_failed'] = total - passed[column]
+        summary_row[f'{short_column}_percentage'] = 0
+    for column in SUMMARY_COLUMNS:
+        short_column = get_summary_column(column)
+        try:
+            summary_row[f'{short_column}_percentage'] = \
+                100 * summary_row[short_column] / \
+                (total - summary_row['not_supported'])
+        except ZeroDivisionError:
+            summary_row[f'{short_column}_percentage'] = 0.0
+    summary_row['ecv'] = ecv
+    return summary_row
+
+
+def create_summary_rows(table, passed):
+    # one group-by pass; ECVs keep the order of their first row
+    grouped = passed.astype(int).groupby(table['ECV-Name'], sort=False)
+    passed_per_ecv = grouped.sum()
+    totals_per_ecv = grouped.size()
+    ecv_names = list(passed_per_ecv.index)
+    summary_rows = []
+    for ecv in ecv_names:
+        # an ECV counts the rows of every ECV name containing it
+        members = [name for name in ecv_names if ecv in name]
+        passed_counts = {column: int(passed_per_ecv.loc[members, column].sum())
+                         for column in SUMMARY_COLUMNS}
+        summary_rows.append(new_summary_row(
+            ecv, passed_counts, int(totals_per_ecv.loc[members].sum())))
+    passed_counts = {column: int(passed[column].sum())
+                     for column in SUMMARY_COLUMNS}
+    summary_rows.append(new_summary_row('ALL_ECVS', passed_counts,
+                                        len(table)))
+    return summary_rows
+
+
+def get_failed_table(table):
+    failed = (table['supported'] == 'yes') \
+        & (table[STAGE_COLUMNS] == 'no').any(axis=1)
+    return table[failed]
+
+
+def create_json_of_ids_with_verification_flags(table, passed, results_dir,
+                                               carried_over=None):
+    flag_names = list(VERIFICATION_FLAGS.values())
+    flags = [[flag for flag, flag_passed in zip(flag_names, passed_row)
+              if flag_passed]
+             for passed_row in passed[list(VERIFICATION_FLAGS)].to_numpy()]
+    dict_with_verify_flags = {
+        data_id: {'data_type': data_type,
+                  'verification_flags': verify_flags,
+                  'title': title}
+        for data_id, data_type, verify_flags, title in zip(
+            table['Dataset-ID'], table['Data-Type'], flags,
+            table['Dataset-Title'])
+    }
+    # results carried over by an incremental run name the date of their test
+    for data_id, tested_date in (carried_over or {}).items():
+        if data_id in dict_with_verify_flags:
+            dict_with_verify_flags[data_id]['carried_over_from'] = tested_date
+    write_json_atomically(f'{results_dir}/'
+                          f'{DATE_TODAY}_DrsID_verification_flags.json',
+                          dict_with_verify_flags)
+
+
+def create_metrics_summary(metrics_csv, metrics_summary_csv):
+    values_per_ecv_and_stage = {}
+    with open(metrics_csv, newline='') as f:
+        for row in csv.DictReader(f):
+            for ecv in (row['ECV-Name'], 'ALL_ECVS'):
+                values = values_per_ecv_and_stage.setdefault(
+                    (ecv, row['stage']),
+                    {column: [] for column in METRICS_COLUMNS})
+                for column in METRICS_COLUMNS:
+                    if row.get(column):
+                        values[column].append(float(row[column]))
+
+    header = ['ecv', 'stage', 'count']
+    for column in METRICS_COLUMNS:
+        header.extend([f'{column}_p50', f'{column}_p95', f'{column}_max'])
+    with open(metrics_summary_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=header)
+        writer.writeheader()
+        # ALL_ECVS comes last, like in the summary CSV
+        for ecv, stage in sorted(values_per_ecv_and_stage,
+                                 key=lambda k: (k[0] == 'ALL_ECVS', k)):
+            values = values_per_ecv_and_stage[(ecv, stage)]
+            summary_row = {'ecv': ecv,
+                           'stage': stage,
+                           'count': len(values['wall_time'])}
+            for column in METRICS_COLUMNS:
+                summary_row[f'{column}_p50'] = percentile(values[column], 50)
+                summary_row[f'{column}_p95'] = percentile(values[column], 95)
+                summary_row[f'{column}_max'] = \
+                    max(values[column]) if values[column] else ''
+            writer.writerow(summary_row)
+
+
+def create_throughput_comparison(throughput_csv, comparison_csv):
+    """
+    Compare the stores probed by throughput_probe.py per ECV, by the median
+    of every metric over the datasets both stores could read. The faster
+    store has the higher median throughput, the speedup is the ratio of the
+    medians.
+    """
+    rows_per_pair = {}
+    stores = []
+    with open(throughput_csv, newline='') as f:
+        for row in csv.DictReader(f):
+            rows_per_pair.setdefault(row['pair'], {})[row['store']] = row
+            if row['store'] not in stores:
+                stores.append(row['store'])
+    pairs_per_ecv = {}
+    for rows in rows_per_pair.values():
+        for ecv in (next(iter(rows.values()))['ECV-Name'], 'ALL_ECVS'):
+            pairs_per_ecv.setdefault(ecv, []).append(rows)
+
+    header = ['ecv', 'pairs', 'compared']
+    for store in stores:
+        header.append(f'{store}_failed')
+        header.extend(f'{store}_{column}_p50'
+                      for column in THROUGHPUT_COLUMNS)
+        header.append(f'{store}_faster')
+    header.extend(['faster_store', 'speedup'])
+    comparison_rows = []
+    # ALL_ECVS comes last, like in the summary CSV
+    for ecv in sorted(pairs_per_ecv, key=lambda e: (e == 'ALL_ECVS', e)):
+        pairs = pairs_per_ecv[ecv]
+        compared = [rows for rows in pairs
+                    if all(rows.get(store, {}).get('throughput')
+                           for store in stores)]
+        comparison_row = {'ecv': ecv,
+                          'pairs': len(pairs),
+                          'compared': len(compared)}
+        # datasets a store read faster than all others
+        faster = dict.fromkeys(stores, 0)
+        for rows in compared:
+            throughputs = [float(rows[store]['throughput'])
+                           for store in stores]
+            if throughputs.count(max(throughputs)) == 1:
+                faster[stores[throughputs.index(max(throughputs))]] += 1
+        for store in stores:
+            comparison_row[f'{store}_failed'] = sum(
+                1 for rows in pairs
+                if not rows.get(store, {}).get('throughput'))
+            for column in THROUGHPUT_COLUMNS:
+                comparison_row[f'{store}_{column}_p50'] = percentile(
+                    [float(rows[store][column]) for rows in compared
+                     if rows[store][column]], 50)
+            comparison_row[f'{store}_faster'] = faster[store]
+        medians = sorted((comparison_row[f'{store}_throughput_p50'], store)
+                         for store in stores
+                         if comparison_row[f'{store}_throughput_p50'] != '')
+        comparison_row['faster_store'] = ''
+        comparison_row['speedup'] = ''
+        if len(medians) > 1 and medians[-1][0] > medians[0][0]:
+            comparison_row['faster_store'] = medians[-1][1]
+            if medians[0][0] > 0:
+                comparison_row['speedup'] = \
+                    round(medians[-1][0] / medians[0][0], 2)
+        comparison_rows.append(comparison_row)
+    write_csv_atomically(comparison_csv, header, comparison_rows)
 
 
 def cleanup_result_outputs_older_than_14_days(path_to_check_for_cleanup):
     date_to_be_kept = DATE_TODAY - (timedelta(days=14))
+    if not os.path.isdir(path_to_check_for_cleanup):
+        return
     for item in os.listdir(path_to_check_for_cleanup):
         try:
             date_of_item = datetime.strptime(item[:10], '%Y-%m-%d')
@@ -197,41 +260,92 @@ def cleanup_result_outputs_older_than_14_days(path_to_check_for_cleanup):
                 print(f'Error removing {item}: {e.strerror}')
 
 
-def main():
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Summarize the results of test_cci_data_support.py.')
+    parser.add_argument('store_name', nargs='?', default='cci-store',
+                        help='Name of the tested data store.')
+    parser.add_argument('test_mode', nargs='?', default=None,
+                        help='Test mode of the run to be summarized.')
+    parser.add_argument('--history-db', default=HISTORY_DB,
+                        help='Database keeping the history of all results.')
+    parser.add_argument('--sampled', action='store_true',
+                        help='Summarize the sampled run of the day, made '
+                             'with test_cci_data_support.py --budget.')
+    args = parser.parse_args(args)
     start_time = datetime.now()
-    store_name = 'cci-store'
-    test_mode = None
-    if len(sys.argv) >= 2:
-        store_name = sys.argv[1]
-    if len(sys.argv) == 3:
-        test_mode = sys.argv[2]
+    store_name = args.store_name
+    test_mode = args.test_mode
 
     results_dir = f'{store_name}'
     if test_mode:
         results_dir = f'{test_mode}/{store_name}'
+    history_mode = test_mode
+    if args.sampled:
+        results_dir = f'{results_dir}/{SAMPLED_DIR}'
+        history_mode = get_sampled_mode(test_mode)
 
     support_file_name = f'{DATE_TODAY}_test_{store_name}_data_support'
     results_csv = f'{results_dir}/{support_file_name}.csv'
 
-    results_sorted = sort_csv(results_csv)
-    test_data_sets = read_all_result_rows(results_sorted, HEADER_ROW)
+    # every output is derived from this one table, read and sorted once
+    table = sort_result_table(read_result_table(results_csv))
+    write_table(f'{results_csv[:-4]}_sorted.csv', table, list(table.columns))
+    table.columns = HEADER_ROW
+    passed = get_passed_table(table)
 
-    ecvs = get_list_of_ecvs(test_data_sets)
     failed_csv = f'{results_dir}/{support_file_name}_failed.csv'
-    failed_sorted = create_list_of_failed(test_data_sets,
-                                          failed_csv,
-                                          HEADER_ROW)
+    failed_table = get_failed_table(table)
+    write_table(failed_csv, failed_table, HEADER_ROW)
+    write_table(f'{failed_csv[:-4]}_sorted.csv', failed_table, HEADER_ROW)
 
     summary_csv = f'{results_dir}/{support_file_name}_summary_sorted.csv'
-    for ecv in ecvs:
-        results_summary_row = count_success_fail(test_data_sets, ecv)
-        header_summary = list(results_summary_row.keys())
-        update_csv(summary_csv, header_summary, results_summary_row)
-
-    create_json_of_ids_with_verification_flags(test_data_sets, results_dir)
+    summary_rows = create_summary_rows(table, passed)
+    write_csv_atomically(summary_csv, list(summary_rows[0].keys()),
+                         summary_rows)
+
+    carried_over = None
+    carried_over_json = f'{results_dir}/{support_file_name}_carried_over.json'
+    if os.path.isfile(carried_over_json):
+        with open(carried_over_json) as f:
+            carried_over = json.load(f)
+    create_json_of_ids_with_verification_flags(table, passed, results_dir,
+                                               carried_over)
+
+    sample_json = f'{results_dir}/{support_file_name}_sample.json'
+    if os.path.isfile(sample_json):
+        with open(sample_json) as f:
+            sample = json.load(f)
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Summary of a sampled run: {sample["datasets"]} of '
+              f'{sample["total"]} datasets, budget of '
+              f'{sample["budget_minutes"]} minutes.')
+
+    metrics_csv = f'{results_dir}/{support_file_name}_metrics.csv'
+    if os.path.isfile(metrics_csv):
+        create_metrics_summary(
+            metrics_csv,
+            f'{results_dir}/{support_file_name}_metrics_summary.csv')
+
+    # written by throughput_probe.py for both stores of a test mode
+    mode_dir = test_mode or '.'
+    throughput_csv = f'{mode_dir}/{DATE_TODAY}_store_throughput.csv'
+    if os.path.isfile(throughput_csv):
+        create_throughput_comparison(
+            throughput_csv,
+            f'{throughput_csv[:-4]}_comparison.csv')
+
+    # the results are kept in the history before the files are deleted
+    history = HistoryStore(args.history_db)
+    history.ingest_results_dir(results_dir, mode=history_mode)
+    history.compact()
+    history.close()
 
     cleanup_result_outputs_older_than_14_days(results_dir)
     cleanup_result_outputs_older_than_14_days(f'{results_dir}/error_traceback')
+    if test_mode:
+        # outputs of throughput_probe.py
+        cleanup_result_outputs_older_than_14_days(test_mode)
 
     print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
           f'Test run finished on {DATE_TODAY}.')
@@ -0,0 +1,520 @@
+"""
+Long-term history of the nightly test results.
+
+The dated results CSVs of every test mode and data store are ingested into
+one SQLite database with one row per (date, mode, store, data ID). A results
+CSV is only parsed again if its size or modification time changed, so the
+nightly ingest costs about as much as the new results. The history answers
+which datasets changed their status between runs, which datasets flap and
+which datasets behave differently in two test modes.
+
+Old history is compacted instead of deleted: comments are dropped after
+COMMENT_RETENTION_DAYS, and after DAILY_RETENTION_DAYS only the first and last
+day of every period with unchanged status is kept, which is enough to
+reconstruct all transitions.
+
+The wall times of the dataset stages are ingested from the metrics CSVs and
+kept for TIMING_RETENTION_DAYS, they are the basis of the adaptive timeouts
+of scheduler.py.
+
+Usage:
+
+    python history_store.py ingest development/cci-store stage/cci-store
+    python history_store.py transitions --since 2022-10-01
+    python history_store.py flapping --days 14
+    python history_store.py deltas stage production
+    python history_store.py compact
+"""
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from datetime import timedelta
+
+from result_store import LOCK_TIMEOUT
+from result_store import STAGE_COLUMNS
+
+HISTORY_DB = 'results_history.sqlite'
+# mode of results written without a test mode, e.g. cci-store/
+DEFAULT_MODE = 'default'
+COMMENT_RETENTION_DAYS = 30
+DAILY_RETENTION_DAYS = 90
+TIMING_RETENTION_DAYS = 60
+FLAPPING_DAYS = 14
+FLAPPING_TRANSITIONS = 3
+
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+STATUS_NOT_SUPPORTED = 'not_supported'
+
+RESULTS_CSV_PATTERN = re.compile(
+    r'^(\d{4}-\d{2}-\d{2})_test_(.+)_data_support\.csv$')
+METRICS_CSV_PATTERN = re.compile(
+    r'^(\d{4}-\d{2}-\d{2})_test_(.+)_data_support_metrics\.csv$')
+
+TRANSITION_COLUMNS = ['date', 'mode', 'store', 'data_id', 'ecv',
+                      'previous_date', 'previous_status',
+                      'previous_failed_stages', 'status', 'failed_stages',
+                      'comment']
+FLAPPING_COLUMNS = ['mode', 'store', 'data_id', 'ecv', 'transitions',
+                    'first_date', 'last_date', 'status']
+DELTA_COLUMNS = ['store', 'data_id', 'ecv', 'date', 'mode_a', 'status_a',
+                 'failed_stages_a', 'mode_b', 'status_b', 'failed_stages_b']
+
+# status of a dataset compared to the previous row of the same mode, store
+# and data ID
+_TRANSITIONS_QUERY = '''
+SELECT date, mode, store, data_id, ecv, previous_date, previous_status,
+       previous_failed_stages, status, failed_stages, comment
+FROM (SELECT *,
+             LAG(date) OVER w AS previous_date,
+             LAG(status) OVER w AS previous_status,
+             LAG(failed_stages) OVER w AS previous_failed_stages
+      FROM results
+      WHERE {where}
+      WINDOW w AS (PARTITION BY mode, store, data_id ORDER BY date))
+WHERE previous_status IS NOT NULL
+  AND (status != previous_status OR failed_stages != previous_failed_stages)
+'''
+
+
+def get_status(row):
+    failed_stages = [column.split('(', 1)[0] for column in STAGE_COLUMNS
+                     if row.get(column) == 'no']
+    if row.get('supported') != 'yes':
+        return STATUS_NOT_SUPPORTED, ''
+    if failed_stages:
+        return STATUS_FAILED, ','.join(failed_stages)
+    return STATUS_OK, ''
+
+
+def find_results_csvs(results_dir, pattern=RESULTS_CSV_PATTERN):
+    if not os.path.isdir(results_dir):
+        return
+    for file_name in sorted(os.listdir(results_dir)):
+        match = pattern.match(file_name)
+        if match:
+            yield os.path.join(results_dir, file_name), match.group(1), \
+                match.group(2)
+
+
+def get_mode(results_dir):
+    # results are written to {mode}/{store} or to {store}
+    parent = os.path.dirname(os.path.normpath(results_dir))
+    return os.path.basename(parent) or DEFAULT_MODE
+
+
+def _build_where(table=None, **conditions):
+    # conditions with a value of None are left out
+    prefix = f'{table}.' if table else ''
+    clauses = []
+    parameters = []
+    for column, value in conditions.items():
+        if value is not None:
+            clauses.append(f'{prefix}{column} = ?')
+            parameters.append(value)
+    return ' AND '.join(clauses) or '1', parameters
+
+
+class HistoryStore:
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    date TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    store TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    datasets INTEGER NOT NULL,
+                    PRIMARY KEY (date, mode, store)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS results (
+                    date TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    store TEXT NOT NULL,
+                    data_id TEXT NOT NULL,
+                    ecv TEXT,
+                    status TEXT NOT NULL,
+                    failed_stages TEXT NOT NULL,
+                    comment TEXT,
+                    PRIMARY KEY (date, mode, store, data_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS results_by_dataset
+                    ON results (mode, store, data_id, date);
+                CREATE TABLE IF NOT EXISTS timing_runs (
+                    date TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    store TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    PRIMARY KEY (date, mode, store)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS stage_timings (
+                    mode TEXT NOT NULL,
+                    store TEXT NOT NULL,
+                    data_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    ecv TEXT,
+                    wall_time REAL NOT NULL,
+                    PRIMARY KEY (mode, store, data_id, date, stage)
+                ) WITHOUT ROWID;
+            ''')
+            self._connection = connection
+        return self._connection
+
+    def ingest_results_csv(self, csv_path, mode, store_name, date):
+        """
+        Ingest one results CSV unless it was ingested before and did not
+        change since. Returns whether it was ingested.
+        """
+        stat = os.stat(csv_path)
+        connection = self.connection
+        known = connection.execute(
+            'SELECT size, mtime FROM runs '
+            'WHERE date = ? AND mode = ? AND store = ?',
+            (date, mode, store_name)).fetchone()
+        if known == (stat.st_size, stat.st_mtime):
+            return False
+        with open(csv_path, newline='') as f:
+            rows = {}
+            for row in csv.DictReader(f):
+                # the last row of a dataset wins, like in the JSON summary
+                status, failed_stages = get_status(row)
+                rows[row['Dataset-ID']] = (date, mode, store_name,
+                                           row['Dataset-ID'],
+                                           row.get('ECV-Name'), status,
+                                           failed_stages,
+                                           row.get('comment') or None)
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM results WHERE date = ? AND mode = ? AND store = ?',
+                (date, mode, store_name))
+            connection.executemany(
+                'INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows.values())
+            connection.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (date, mode, store_name, csv_path, stat.st_size,
+                 stat.st_mtime, len(rows)))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return True
+
+    def ingest_metrics_csv(self, csv_path, mode, store_name, date):
+        """
+        Ingest the stage wall times of one metrics CSV unless it was ingested
+        before and did not change since. Returns whether it was ingested.
+        """
+        stat = os.stat(csv_path)
+        connection = self.connection
+        known = connection.execute(
+            'SELECT size, mtime FROM timing_runs '
+            'WHERE date = ? AND mode = ? AND store = ?',
+            (date, mode, store_name)).fetchone()
+        if known == (stat.st_size, stat.st_mtime):
+            return False
+        with open(csv_path, newline='') as f:
+            rows = {}
+            for row in csv.DictReader(f):
+                if not row.get('wall_time'):
+                    continue
+                rows[(row['Dataset-ID'], row['stage'])] = \
+                    (mode, store_name, row['Dataset-ID'], date, row['stage'],
+                     row.get('ECV-Name'), float(row['wall_time']))
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM stage_timings '
+                'WHERE date = ? AND mode = ? AND store = ?',
+                (date, mode, store_name))
+            connection.executemany(
+                'INSERT INTO stage_timings VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows.values())
+            connection.execute(
+                'INSERT OR REPLACE INTO timing_runs VALUES (?, ?, ?, ?, ?, ?)',
+                (date, mode, store_name, csv_path, stat.st_size,
+                 stat.st_mtime))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return True
+
+    def ingest_results_dir(self, results_dir, mode=None):
+        """
+        Ingest all results CSVs of a results directory, which is
+        {mode}/{store} or {store}. Returns the number of ingested files.
+        """
+        mode = mode or get_mode(results_dir)
+        ingested = 0
+        for csv_path, date, store_name in find_results_csvs(results_dir):
+            if self.ingest_results_csv(csv_path, mode, store_name, date):
+                ingested += 1
+        for csv_path, date, store_name in find_results_csvs(
+                results_dir, METRICS_CSV_PATTERN):
+            if self.ingest_metrics_csv(csv_path, mode, store_name, date):
+                ingested += 1
+        return ingested
+
+    def get_stage_timings(self, mode, store_name, since=None):
+        """
+        Yields (data_id, ecv, date, stage, wall_time) of all stage timings
+        of a mode and store, optionally from date *since* on.
+        """
+        query = 'SELECT data_id, ecv, date, stage, wall_time ' \
+                'FROM stage_timings WHERE mode = ? AND store = ?'
+        parameters = [mode, store_name]
+        if since is not None:
+            query += ' AND date >= ?'
+            parameters.append(since)
+        yield from self.connection.execute(query, parameters)
+
+    def get_failed_data_ids(self, mode, store_name, since=None):
+        """IDs of the datasets of a mode and store which failed on any
+        date from *since* on."""
+        query = 'SELECT DISTINCT data_id FROM results ' \
+                'WHERE mode = ? AND store = ? AND status = ?'
+        parameters = [mode, store_name, STATUS_FAILED]
+        if since is not None:
+            query += ' AND date >= ?'
+            parameters.append(since)
+        return {data_id for data_id, in
+                self.connection.execute(query, parameters)}
+
+    def get_transitions(self, since=None, mode=None, store_name=None,
+                        data_id=None):
+        """
+        Rows of datasets whose status or failed stages differ from their
+        previous run in the same mode and store, oldest first.
+        """
+        where, parameters = _build_where(mode=mode, store=store_name,
+                                         data_id=data_id)
+        query = _TRANSITIONS_QUERY.format(where=where)
+        if since is not None:
+            query += ' AND date >= ?'
+            parameters.append(since)
+        query += ' ORDER BY date, mode, store, data_id'
+        for values in self.connection.execute(query, parameters):
+            yield dict(zip(TRANSITION_COLUMNS, values))
+
+    def get_flapping(self, days=FLAPPING_DAYS,
+                     min_transitions=FLAPPING_TRANSITIONS, mode=None,
+                     store_name=None):
+        """
+        Datasets which changed their status at least *min_transitions*
+        times within the last *days* days of the history.
+        """
+        since = self._get_last_date(mode, store_name)
+        if since is None:
+            return
+        since = (datetime.strptime(since, '%Y-%m-%d')
+                 - timedelta(days=days)).strftime('%Y-%m-%d')
+        where, parameters = _build_where(mode=mode, store=store_name)
+        query = f'''
+            SELECT mode, store, data_id, MAX(ecv), COUNT(*), MIN(date),
+                   MAX(date),
+                   (SELECT status FROM results AS latest
+                    WHERE latest.mode = t.mode AND latest.store = t.store
+                      AND latest.data_id = t.data_id
+                    ORDER BY date DESC LIMIT 1)
+            FROM ({_TRANSITIONS_QUERY.format(where=where)} AND date >= ?) AS t
+            GROUP BY mode, store, data_id
+            HAVING COUNT(*) >= ?
+            ORDER BY COUNT(*) DESC, mode, store, data_id
+        '''
+        for values in self.connection.execute(
+                query, parameters + [since, min_transitions]):
+            yield dict(zip(FLAPPING_COLUMNS, values))
+
+    def get_mode_deltas(self, mode_a, mode_b, date=None, store_name=None):
+        """
+        Datasets with a different status in *mode_a* and *mode_b* on *date*,
+        by default the last date both modes were run. Datasets tested in
+        only one of the modes are included with an empty status.
+        """
+        if date is None:
+            date = self._get_last_common_date(mode_a, mode_b, store_name)
+            if date is None:
+                return
+        where, parameters = _build_where(date=date, store=store_name)
+        query = f'''
+            WITH a AS (SELECT * FROM results WHERE {where} AND mode = ?),
+                 b AS (SELECT * FROM results WHERE {where} AND mode = ?)
+            SELECT a.store, a.data_id, a.ecv, a.date, ?, a.status,
+                   a.failed_stages, ?, b.status, b.failed_stages
+            FROM a LEFT JOIN b ON a.store = b.store AND a.data_id = b.data_id
+            WHERE b.status IS NULL OR a.status != b.status
+               OR a.failed_stages != b.failed_stages
+            UNION ALL
+            SELECT b.store, b.data_id, b.ecv, b.date, ?, NULL, NULL, ?,
+                   b.status, b.failed_stages
+            FROM b LEFT JOIN a ON a.store = b.store AND a.data_id = b.data_id
+            WHERE a.status IS NULL
+            ORDER BY 1, 2
+        '''
+        for values in self.connection.execute(
+                query, parameters + [mode_a] + parameters + [mode_b]
+                + [mode_a, mode_b, mode_a, mode_b]):
+            yield dict(zip(DELTA_COLUMNS, values))
+
+    def compact(self, today=None,
+                comment_retention_days=COMMENT_RETENTION_DAYS,
+                daily_retention_days=DAILY_RETENTION_DAYS,
+                timing_retention_days=TIMING_RETENTION_DAYS):
+        """
+        Drop comments of old rows, rows of old runs that neither start
+        nor end a period of unchanged status and old stage timings.
+        """
+        today = today or datetime.now().date()
+        comments_until = (today - timedelta(days=comment_retention_days)) \
+            .isoformat()
+        daily_until = (today - timedelta(days=daily_retention_days)) \
+            .isoformat()
+        timings_until = (today - timedelta(days=timing_retention_days)) \
+            .isoformat()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'UPDATE results SET comment = NULL '
+                'WHERE date < ? AND comment IS NOT NULL', (comments_until,))
+            deleted = connection.execute('''
+                DELETE FROM results
+                WHERE (date, mode, store, data_id) IN (
+                    SELECT date, mode, store, data_id
+                    FROM (SELECT date, mode, store, data_id,
+                                 status || failed_stages AS state,
+                                 LAG(status || failed_stages) OVER w AS prev,
+                                 LEAD(status || failed_stages) OVER w AS next
+                          FROM results
+                          WINDOW w AS (PARTITION BY mode, store, data_id
+                                       ORDER BY date))
+                    WHERE date < ? AND state = prev AND state = next)
+            ''', (daily_until,)).rowcount
+            deleted += connection.execute(
+                'DELETE FROM stage_timings WHERE date < ?',
+                (timings_until,)).rowcount
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        if deleted:
+            connection.execute('VACUUM')
+        return deleted
+
+    def _get_last_date(self, mode=None, store_name=None):
+        where, parameters = _build_where(mode=mode, store=store_name)
+        return self.connection.execute(
+            f'SELECT MAX(date) FROM runs WHERE {where}',
+            parameters).fetchone()[0]
+
+    def _get_last_common_date(self, mode_a, mode_b, store_name=None):
+        where, parameters = _build_where('a', store=store_name)
+        return self.connection.execute(
+            f'SELECT MAX(a.date) FROM runs AS a JOIN runs AS b '
+            f'ON a.date = b.date AND a.store = b.store '
+            f'WHERE a.mode = ? AND b.mode = ? AND {where}',
+            [mode_a, mode_b] + parameters).fetchone()[0]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _write_rows(rows, columns):
+    writer = csv.DictWriter(sys.stdout, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Query the history of the test results.')
+    parser.add_argument('--db', default=HISTORY_DB,
+                        help='Path of the history database.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser(
+        'ingest', help='Ingest new and changed results CSVs.')
+    ingest_parser.add_argument('results_dirs', nargs='+',
+                               help='Results directories, {mode}/{store} '
+                                    'or {store}.')
+
+    transitions_parser = subparsers.add_parser(
+        'transitions', help='Datasets whose status changed.')
+    transitions_parser.add_argument('--since',
+                                    help='First date, as YYYY-MM-DD.')
+    transitions_parser.add_argument('--data-id')
+
+    flapping_parser = subparsers.add_parser(
+        'flapping', help='Datasets changing their status repeatedly.')
+    flapping_parser.add_argument('--days', type=int, default=FLAPPING_DAYS)
+    flapping_parser.add_argument('--min-transitions', type=int,
+                                 default=FLAPPING_TRANSITIONS)
+
+    deltas_parser = subparsers.add_parser(
+        'deltas', help='Datasets with a different status in two modes.')
+    deltas_parser.add_argument('mode_a')
+    deltas_parser.add_argument('mode_b')
+    deltas_parser.add_argument('--date', help='Date, as YYYY-MM-DD, by '
+                                              'default the last common date.')
+
+    subparsers.add_parser('compact', help='Compact old history.')
+
+    for query_parser in (transitions_parser, flapping_parser, deltas_parser):
+        query_parser.add_argument('--store', dest='store_name')
+    for query_parser in (transitions_parser, flapping_parser):
+        query_parser.add_argument('--mode')
+    args = parser.parse_args(args)
+
+    history = HistoryStore(args.db)
+    try:
+        if args.command == 'ingest':
+            for results_dir in args.results_dirs:
+                ingested = history.ingest_results_dir(results_dir)
+                print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                      f'Ingested {ingested} results files of {results_dir}.')
+        elif args.command == 'transitions':
+            _write_rows(history.get_transitions(args.since, args.mode,
+                                                args.store_name,
+                                                args.data_id),
+                        TRANSITION_COLUMNS)
+        elif args.command == 'flapping':
+            _write_rows(history.get_flapping(args.days,
+                                             args.min_transitions,
+                                             args.mode, args.store_name),
+                        FLAPPING_COLUMNS)
+        elif args.command == 'deltas':
+            _write_rows(history.get_mode_deltas(args.mode_a, args.mode_b,
+                                                args.date, args.store_name),
+                        DELTA_COLUMNS)
+        elif args.command == 'compact':
+            deleted = history.compact()
+            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                  f'Compacted history, removed {deleted} rows.')
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Per-stage instrumentation of the dataset tests.
+
+For every stage of a dataset test the start, wall time, CPU time, bytes read
+from the data variables, the peak resident memory and the worker running it
+are recorded. The records are written to a sidecar CSV next to the results
+CSV, one row per dataset and stage. trace_export.py builds a timeline of the
+sweep from them.
+
+Bytes are only counted by the stages reading data variables and the peak
+resident memory is taken from the memory governor of the process, the
+columns are left empty where they are not measured.
+
+psutil is used if available, without it memory is read from /proc.
+"""
+import csv
+import math
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+METRICS_HEADER_ROW = ['ECV-Name', 'Dataset-ID', 'stage', 'wall_time',
+                      'cpu_time', 'bytes_read', 'peak_rss', 'start',
+                      'worker']
+
+# seconds between two samples of the resident memory
+RSS_SAMPLE_INTERVAL = 0.1
+
+
+def get_rss(pid=None):
+    """Resident memory in bytes of the process *pid*, or this process."""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f'/proc/{pid or "self"}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StageMetrics:
+    """Collects the metrics of the stages of one dataset test."""
+
+    def __init__(self, data_id, ecv_name, worker=0, memory_governor=None):
+        self.data_id = data_id
+        self.ecv_name = ecv_name
+        self.worker = worker
+        # samples the resident memory, the peak is not recorded without it
+        self.memory_governor = memory_governor
+        self.rows = []
+        self._current = None
+
+    @contextmanager
+    def measure(self, stage):
+        row = {'ECV-Name': self.ecv_name,
+               'Dataset-ID': self.data_id,
+               'stage': stage,
+               'bytes_read': None,
+               'peak_rss': None,
+               'start': round(time.time(), 6),
+               'worker': self.worker}
+        outer = self._current
+        self._current = row
+        stage_peak = None
+        if self.memory_governor is not None:
+            stage_peak = self.memory_governor.open_stage_peak()
+        cpu_time = time.process_time()
+        wall_time = time.perf_counter()
+        try:
+            yield row
+        finally:
+            row['wall_time'] = round(time.perf_counter() - wall_time, 3)
+            row['cpu_time'] = round(time.process_time() - cpu_time, 3)
+            if stage_peak is not None:
+                row['peak_rss'] = \
+                    self.memory_governor.close_stage_peak(stage_peak)
+            self.rows.append(row)
+            self._current = outer
+
+    def add_bytes_read(self, bytes_read):
+        if self._current is not None:
+            self._current['bytes_read'] = \
+                (self._current['bytes_read'] or 0) + bytes_read
+
+
+def percentile(values, percentage):
+    # linear interpolation between the closest ranks
+    if not values:
+        return ''
+    values = sorted(values)
+    k = (len(values) - 1) * percentage / 100
+    lower = math.floor(k)
+    upper = math.ceil(k)
+    if lower == upper:
+        return values[lower]
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def write_metrics_rows(metrics_csv, rows, header_row=METRICS_HEADER_ROW):
+    if not rows:
+        return
+    write_header = not os.path.isfile(metrics_csv)
+    with open(metrics_csv, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=header_row)
+        if write_header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_metrics_rows(metrics_csv):
+    if not os.path.isfile(metrics_csv):
+        return []
+    with open(metrics_csv, newline='') as f:
+        return list(csv.DictReader(f))
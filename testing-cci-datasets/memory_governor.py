@@ -0,0 +1,162 @@
+"""
+Memory guardrails of the dataset tests.
+
+A single huge dataset can push the test host into swap or make the OOM
+killer end the whole sweep, usually while the processing check reads a
+variable or the cache check writes the subset. The governor samples the
+resident memory of the testing process in the background. If it crosses the
+limit during a guarded stage, the process sends itself SIGUSR1 and the
+handler raises MemoryBudgetExceeded in the main thread, like the SIGALRM of
+the stage timeouts. The stage fails with a "memory budget exceeded" comment
+and the sweep goes on with the next dataset. The peak resident memory of
+every dataset is recorded, and of every stage measured by StageMetrics.
+
+A signal is only handled between two Python instructions, a stage stuck in a
+single large allocation is not interrupted by it. In parallel sweeps the
+pool therefore also watches the memory in use on the whole host and kills
+the worker using the most memory once it crosses the host limit.
+"""
+import os
+import signal
+import threading
+from contextlib import contextmanager
+
+from instrumentation import RSS_SAMPLE_INTERVAL
+from instrumentation import get_rss
+
+# megabytes of resident memory a process testing a dataset may use
+DATASET_MEMORY_LIMIT = 4096
+# share of the physical memory of the host which may be in use before the
+# worker using the most memory is killed
+HOST_MEMORY_SHARE = 0.9
+
+MEMORY_HEADER_ROW = ['ECV-Name', 'Dataset-ID', 'peak_rss', 'memory_limit',
+                     'exceeded_stage']
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def get_total_memory():
+    """Physical memory of the host in bytes, or None if it is unknown."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def get_used_memory():
+    """Memory in use on the host in bytes, or None if it is unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            meminfo = {line.split(':')[0]: int(line.split()[1]) * 1024
+                       for line in f}
+        return meminfo['MemTotal'] - meminfo['MemAvailable']
+    except (OSError, ValueError, IndexError, KeyError):
+        return None
+
+
+def get_host_memory_limit(share=HOST_MEMORY_SHARE):
+    total = get_total_memory()
+    return int(total * share) if total is not None else None
+
+
+class MemoryGovernor(threading.Thread):
+    """Samples the resident memory of this process and aborts a guarded
+    stage which exceeds the limit. Must be started in the main thread."""
+
+    def __init__(self, limit, interval=RSS_SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        # bytes, None for no limit
+        self.limit = limit
+        self.interval = interval
+        self.peak = None
+        # [peak] of every open stage, see open_stage_peak
+        self._stage_peaks = []
+        self.exceeded_stages = []
+        self._stage = None
+        self._signalled = False
+        self._exceeded_rss = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        signal.signal(signal.SIGUSR1, self._on_signal)
+        super().start()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            rss = get_rss()
+            if rss is None:
+                continue
+            if self.peak is None or rss > self.peak:
+                self.peak = rss
+            for stage_peak in list(self._stage_peaks):
+                if stage_peak[0] is None or rss > stage_peak[0]:
+                    stage_peak[0] = rss
+            stage = self._stage
+            if stage is not None and not self._signalled \
+                    and self.limit is not None and rss > self.limit:
+                self._signalled = True
+                self._exceeded_rss = rss
+                os.kill(os.getpid(), signal.SIGUSR1)
+
+    def _on_signal(self, signum, frame):
+        stage = self._stage
+        # the stage may have ended before the signal was handled
+        if stage is None:
+            return
+        self._stage = None
+        self.exceeded_stages.append(stage)
+        raise MemoryBudgetExceeded(
+            f'Memory budget exceeded in stage {stage}: '
+            f'{self._exceeded_rss // (1024 * 1024)} MB resident, the limit '
+            f'is {self.limit // (1024 * 1024)} MB.')
+
+    def open_stage_peak(self):
+        """Starts recording the peak resident memory of a stage, stages may
+        be nested."""
+        stage_peak = [get_rss()]
+        self._stage_peaks.append(stage_peak)
+        return stage_peak
+
+    def close_stage_peak(self, stage_peak):
+        """Peak resident memory in bytes since open_stage_peak."""
+        self._stage_peaks.remove(stage_peak)
+        rss = get_rss()
+        if rss is not None and (stage_peak[0] is None or rss > stage_peak[0]):
+            stage_peak[0] = rss
+        return stage_peak[0]
+
+    def start_dataset(self):
+        self.peak = get_rss()
+        self.exceeded_stages = []
+
+    @contextmanager
+    def guard(self, stage):
+        self._signalled = False
+        self._stage = stage
+        try:
+            yield
+        finally:
+            self._stage = None
+
+    def get_memory_row(self, data_id, ecv_name):
+        return {'ECV-Name': ecv_name,
+                'Dataset-ID': data_id,
+                'peak_rss': self.peak,
+                'memory_limit': self.limit,
+                'exceeded_stage': ' '.join(self.exceeded_stages)}
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+@contextmanager
+def memory_guard(governor, stage):
+    if governor is None:
+        yield
+        return
+    with governor.guard(stage):
+        yield
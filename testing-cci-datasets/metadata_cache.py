@@ -0,0 +1,174 @@
+"""
+On-disk cache for the data types and descriptors of the tested datasets.
+
+Entries are keyed by store name, data ID and the version of the store
+plugin, which produces the metadata, so a new release of the plugin
+invalidates them. Entries are revalidated against the catalog of the store:
+every entry records the fingerprint of the data ID listing it was fetched
+with and is fetched again once the listing changes. CCI data IDs carry the
+version of their product, so a new version of a product changes the listing.
+Every entry is a small JSON file; entries older than the time to live are
+fetched again as well and the least recently used entries are evicted once
+the cache grows beyond its maximum size.
+"""
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+import time
+
+from xcube.core.store import DATASET_TYPE
+from xcube.core.store import DatasetDescriptor
+
+METADATA_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'cate-e2e', 'metadata')
+# seconds after which a cached entry is fetched from the store again, even
+# if the catalog did not change
+METADATA_CACHE_TTL = 7 * 24 * 60 * 60
+# bytes the cache may occupy before least recently used entries are evicted
+METADATA_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+_STORE_PLUGIN_MODULE = 'xcube_cci'
+_VERSIONED_MODULES = ['cate', 'xcube', _STORE_PLUGIN_MODULE]
+
+
+def _get_versions(store_name, module_names):
+    versions = [store_name]
+    for module_name in module_names:
+        try:
+            module = importlib.import_module(f'{module_name}.version')
+        except ImportError:
+            continue
+        version = getattr(module, 'version',
+                          getattr(module, '__version__', None))
+        versions.append(f'{module_name}-{version}')
+    return '_'.join(versions)
+
+
+def get_store_version(store_name):
+    """Store name and version of the store plugin."""
+    return _get_versions(store_name, [_STORE_PLUGIN_MODULE])
+
+
+def get_environment_version(store_name):
+    """Store name and versions of cate, xcube and the store plugin."""
+    return _get_versions(store_name, _VERSIONED_MODULES)
+
+
+def get_catalog_fingerprint(data_ids):
+    """SHA-256 of the data ID listing of a store."""
+    return hashlib.sha256(json.dumps(sorted(data_ids)).encode()).hexdigest()
+
+
+class MetadataCache:
+
+    def __init__(self,
+                 cache_dir=METADATA_CACHE_DIR,
+                 ttl=METADATA_CACHE_TTL,
+                 max_size=METADATA_CACHE_MAX_SIZE,
+                 refresh=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.refresh = refresh
+        # entries already fetched again during this run in refresh mode
+        self._refreshed = set()
+        # fingerprint of the data ID listing of every store
+        self._catalogs = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def set_catalog(self, store_name, data_ids):
+        """
+        Revalidate the entries of *store_name* against its data ID listing,
+        entries fetched with another listing are fetched again.
+        """
+        self._catalogs[store_name] = get_catalog_fingerprint(data_ids)
+
+    def get_data_types_for_data(self, store, store_name, data_id):
+        entry = self._read_entry(store_name, data_id)
+        if entry is not None and 'data_types' in entry:
+            return tuple(entry['data_types'])
+        data_types = tuple(str(data_type) for data_type in
+                           store.get_data_types_for_data(data_id))
+        entry = entry or {}
+        entry['data_types'] = list(data_types)
+        self._write_entry(store_name, data_id, entry)
+        return data_types
+
+    def describe_data(self, store, store_name, data_id, data_type):
+        if not DATASET_TYPE.is_super_type_of(data_type):
+            return store.describe_data(data_id=data_id, data_type=data_type)
+        entry = self._read_entry(store_name, data_id)
+        if entry is not None and 'descriptor' in entry:
+            return DatasetDescriptor.from_dict(entry['descriptor'])
+        data_descriptor = store.describe_data(data_id=data_id,
+                                              data_type=data_type)
+        entry = entry or {}
+        entry['descriptor'] = data_descriptor.to_dict()
+        self._write_entry(store_name, data_id, entry)
+        # the same descriptor as on a hit, so fingerprints of the dataset do
+        # not depend on whether it was cached
+        return DatasetDescriptor.from_dict(entry['descriptor'])
+
+    def _get_path(self, store_name, data_id):
+        key = json.dumps([store_name, data_id,
+                          get_store_version(store_name)])
+        return os.path.join(self.cache_dir,
+                            f'{hashlib.sha1(key.encode()).hexdigest()}.json')
+
+    def _read_entry(self, store_name, data_id):
+        path = self._get_path(store_name, data_id)
+        if self.refresh and path not in self._refreshed:
+            return None
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('created', 0) > self.ttl:
+            return None
+        catalog = self._catalogs.get(store_name)
+        if catalog is not None and entry.get('catalog') != catalog:
+            return None
+        # the modification time marks when an entry was used last
+        os.utime(path)
+        return entry
+
+    def _write_entry(self, store_name, data_id, entry):
+        entry.setdefault('created', time.time())
+        entry['catalog'] = self._catalogs.get(store_name)
+        entry['store_name'] = store_name
+        entry['data_id'] = data_id
+        path = self._get_path(store_name, data_id)
+        # written to a temporary file first, so concurrent readers never
+        # see a partially written entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+        self._refreshed.add(path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total_size += stat.st_size
+        if total_size <= self.max_size:
+            return
+        for _, size, name in sorted(entries):
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total_size -= size
+            if total_size <= self.max_size:
+                break
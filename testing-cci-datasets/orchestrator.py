@@ -0,0 +1,369 @@
+"""
+Runs the sweeps of all test modes and stores of a night concurrently.
+
+Every cell of the mode x store matrix is a run of test_cci_data_support.py in
+the conda env of its mode (cate-env-<mode>), started with ``conda run``. The
+cells share global limits:
+
+* CPU: the number of worker processes of all cells together,
+* memory: the memory all workers may take together, each worker is assumed
+  to take --worker-memory megabytes and is held to it with
+  --dataset-memory-limit,
+* network: the number of datasets read from the remote stores at the same
+  time, every worker reads one dataset at a time.
+
+The smallest of the limits gives the number of workers of the night, which
+are split evenly between the cells. A cell which does not get a worker waits
+until a running cell has finished and hands its workers on. Progress and ETA
+of every cell are read from the run journal of its sweep and printed at a
+fixed interval.
+
+After all sweeps the timelines of all cells are combined into one trace,
+{date}_sweep_trace.json, with a process per cell and a lane per worker. If
+both cci stores are swept, throughput_probe.py compares their read throughput
+in the env of every mode. Then generate_summary.py is run for every cell, one
+after the other, in the env of --summary-mode.
+
+Usage, from the testing-cci-datasets directory:
+
+    python orchestrator.py --modes development stage production \\
+        --stores cci-store cci-zarr-store -- --open-once
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from datetime import timedelta
+
+from run_journal import RunJournal
+from sampler import SAMPLED_DIR
+from trace_export import write_trace
+
+TEST_MODES = ['development', 'stage', 'production']
+CCI_STORES = ['cci-store', 'cci-zarr-store']
+CONDA = os.path.expanduser('~/miniconda3/bin/conda')
+ENV_PREFIX = 'cate-env-'
+SUMMARY_MODE = 'production'
+
+# megabytes of memory a single worker of a sweep is assumed to take
+WORKER_MEMORY = 2048
+# share of the physical memory the sweeps may take together
+MEMORY_SHARE = 0.8
+MAX_CONNECTIONS = 16
+PROGRESS_INTERVAL = 60
+POLL_INTERVAL = 5
+# days the combined timelines of the sweeps are kept, like the results
+SWEEP_TRACE_DAYS = 14
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+date_today = datetime.date(datetime.now())
+
+
+def get_total_memory():
+    """Physical memory in megabytes, or None if it is unknown."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') \
+            // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def get_worker_limit(cpus, memory_limit, worker_memory, max_connections):
+    """Number of workers all cells may run together, and the limiting
+    resource."""
+    limits = {'cpu': cpus, 'network': max_connections}
+    if memory_limit is not None:
+        limits['memory'] = memory_limit // worker_memory
+    resource = min(limits, key=limits.get)
+    return max(1, limits[resource]), resource
+
+
+class Cell:
+
+    def __init__(self, test_mode, store_name, sampled=False):
+        self.test_mode = test_mode
+        self.store_name = store_name
+        self.sampled = sampled
+        self.results_dir = f'{test_mode}/{store_name}'
+        if sampled:
+            self.results_dir = f'{self.results_dir}/{SAMPLED_DIR}'
+        support_file_name = f'{date_today}_test_{store_name}_data_support'
+        self.journal = RunJournal(
+            f'{self.results_dir}/{support_file_name}_journal.jsonl')
+        self.metrics_csv = \
+            f'{self.results_dir}/{support_file_name}_metrics.csv'
+        self.log_path = f'{self.results_dir}/{date_today}_orchestrator.log'
+        self.workers = 0
+        self.process = None
+        self.log = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def name(self):
+        return f'{self.test_mode}/{self.store_name}'
+
+    @property
+    def env(self):
+        return f'{ENV_PREFIX}{self.test_mode}'
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def done(self):
+        return self.process is not None and self.process.poll() is not None
+
+    def start(self, conda, workers, test_args):
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.workers = workers
+        self.start_time = datetime.now()
+        command = [conda, 'run', '-n', self.env, '--no-capture-output',
+                   'python', os.path.join(TEST_DIRECTORY,
+                                          'test_cci_data_support.py'),
+                   self.store_name, self.test_mode,
+                   '--workers', str(workers), *test_args]
+        self.log = open(self.log_path, 'a')
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Starting {self.name} in {self.env} with {workers} workers, '
+              f'output goes to {self.log_path}')
+        self.process = subprocess.Popen(command, cwd=TEST_DIRECTORY,
+                                        stdout=self.log,
+                                        stderr=subprocess.STDOUT)
+
+    def finish(self):
+        self.end_time = datetime.now()
+        self.log.close()
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'{self.name} finished with exit code '
+              f'{self.process.returncode} after '
+              f'{self.end_time - self.start_time}')
+
+    def terminate(self):
+        if self.running:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.log is not None and not self.log.closed:
+            self.log.close()
+
+    def get_progress(self):
+        """
+        Datasets done, total, in flight and done before a resume in the
+        current run of the cell, from the records after the last run record
+        of its journal.
+        """
+        total = done = resumed = 0
+        in_flight = set()
+        for record in self.journal.read():
+            if record['event'] == 'run':
+                total, resumed = record['total'], record['finished']
+                done = resumed
+                in_flight = set()
+            elif record['event'] == 'start':
+                in_flight.add(record['data_id'])
+            elif record['event'] == 'finish':
+                done += 1
+                in_flight.discard(record['data_id'])
+        return done, total, len(in_flight), resumed
+
+    def get_progress_line(self):
+        if self.process is None:
+            return f'{self.name}: waiting for workers'
+        if self.done:
+            return f'{self.name}: finished with exit code ' \
+                   f'{self.process.returncode}'
+        done, total, in_flight, resumed = self.get_progress()
+        if total == 0:
+            return f'{self.name}: listing datasets'
+        line = f'{self.name}: {done}/{total} datasets, {in_flight} in flight'
+        elapsed = datetime.now() - self.start_time
+        # the rate of this run only, datasets done before a resume took no
+        # time in it
+        if done > resumed:
+            eta = elapsed / (done - resumed) * (total - done)
+            line = f'{line}, ETA {eta - eta % timedelta(seconds=1)}'
+        return line
+
+
+def run_cells(cells, conda, worker_limit, test_args,
+              progress_interval=PROGRESS_INTERVAL):
+    waiting = list(cells)
+    running = []
+    last_progress = time.monotonic()
+    try:
+        while True:
+            for cell in [cell for cell in running if cell.done]:
+                cell.finish()
+                running.remove(cell)
+            if not waiting and not running:
+                break
+            free = worker_limit - sum(cell.workers for cell in running)
+            # free workers are split between the waiting cells, a cell
+            # starts as soon as it gets at least one
+            while waiting and free > 0:
+                workers = max(1, free // len(waiting))
+                cell = waiting.pop(0)
+                cell.start(conda, workers, test_args)
+                running.append(cell)
+                free -= workers
+            if time.monotonic() - last_progress >= progress_interval:
+                for cell in cells:
+                    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                          f'{cell.get_progress_line()}')
+                last_progress = time.monotonic()
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        for cell in running:
+            cell.terminate()
+        raise
+
+
+def remove_old_sweep_traces(days=SWEEP_TRACE_DAYS):
+    oldest = (date_today - timedelta(days=days)).isoformat()
+    for file_name in os.listdir('.'):
+        if file_name.endswith('_sweep_trace.json') \
+                and file_name[:10] < oldest:
+            os.remove(file_name)
+
+
+def run_throughput_probes(modes, conda):
+    failed = []
+    for test_mode in modes:
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Probing the throughput of the stores in {test_mode}')
+        command = [conda, 'run', '-n', f'{ENV_PREFIX}{test_mode}',
+                   '--no-capture-output', 'python',
+                   os.path.join(TEST_DIRECTORY, 'throughput_probe.py'),
+                   test_mode]
+        completed = subprocess.run(command, cwd=TEST_DIRECTORY)
+        if completed.returncode != 0:
+            failed.append(test_mode)
+    return failed
+
+
+def run_summaries(cells, conda, summary_mode):
+    env = f'{ENV_PREFIX}{summary_mode}'
+    failed = []
+    for cell in cells:
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Generating summary of {cell.name}')
+        command = [conda, 'run', '-n', env, '--no-capture-output', 'python',
+                   os.path.join(TEST_DIRECTORY, 'generate_summary.py'),
+                   cell.store_name, cell.test_mode]
+        if cell.sampled:
+            command.append('--sampled')
+        completed = subprocess.run(command, cwd=TEST_DIRECTORY)
+        if completed.returncode != 0:
+            failed.append(cell)
+    return failed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Run the sweeps of several test modes and stores '
+                    'concurrently, each in the conda env of its mode.')
+    parser.add_argument('--modes', nargs='+', default=TEST_MODES,
+                        help='Test modes to run. Defaults to '
+                             f'{" ".join(TEST_MODES)}.')
+    parser.add_argument('--stores', nargs='+', default=CCI_STORES,
+                        help='Stores to test in every mode. Defaults to '
+                             f'{" ".join(CCI_STORES)}.')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count(),
+                        help='Number of worker processes of all sweeps '
+                             'together. Defaults to the number of CPUs.')
+    parser.add_argument('--memory-limit', type=int, default=None,
+                        help='Megabytes of memory all sweeps may take '
+                             f'together. Defaults to {MEMORY_SHARE:.0%} of '
+                             'the physical memory.')
+    parser.add_argument('--worker-memory', type=int, default=WORKER_MEMORY,
+                        help='Megabytes of memory a single worker is '
+                             f'assumed to take. Defaults to {WORKER_MEMORY}.')
+    parser.add_argument('--max-connections', type=int,
+                        default=MAX_CONNECTIONS,
+                        help='Number of datasets read from the remote stores '
+                             'at the same time by all sweeps together. '
+                             f'Defaults to {MAX_CONNECTIONS}.')
+    parser.add_argument('--conda', default=CONDA,
+                        help=f'conda executable. Defaults to {CONDA}.')
+    parser.add_argument('--summary-mode', default=SUMMARY_MODE,
+                        help='Test mode whose env runs generate_summary.py. '
+                             f'Defaults to {SUMMARY_MODE}.')
+    parser.add_argument('--no-summary', action='store_true',
+                        help='Do not run generate_summary.py after the '
+                             'sweeps.')
+    parser.add_argument('--no-throughput-probe', action='store_true',
+                        help='Do not compare the read throughput of the cci '
+                             'stores with throughput_probe.py after the '
+                             'sweeps.')
+    parser.add_argument('--progress-interval', type=int,
+                        default=PROGRESS_INTERVAL,
+                        help='Seconds between two progress reports. '
+                             f'Defaults to {PROGRESS_INTERVAL}.')
+    parser.add_argument('test_args', nargs=argparse.REMAINDER,
+                        help='Arguments after "--" are passed to every run of '
+                             'test_cci_data_support.py.')
+    args = parser.parse_args(args)
+    test_args = args.test_args
+    if test_args and test_args[0] == '--':
+        test_args = test_args[1:]
+    # the workers are counted with --worker-memory, a limit passed after "--"
+    # comes later and wins
+    test_args = ['--dataset-memory-limit', str(args.worker_memory),
+                 *test_args]
+
+    memory_limit = args.memory_limit
+    if memory_limit is None:
+        total_memory = get_total_memory()
+        if total_memory is not None:
+            memory_limit = int(total_memory * MEMORY_SHARE)
+    worker_limit, resource = get_worker_limit(args.cpus, memory_limit,
+                                              args.worker_memory,
+                                              args.max_connections)
+    # sweeps with a time budget write to the directory of sampled runs
+    sampled = any(arg == '--budget' or arg.startswith('--budget=')
+                  for arg in test_args)
+    cells = [Cell(test_mode, store_name, sampled) for test_mode in args.modes
+             for store_name in args.stores]
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+          f'Running {len(cells)} sweeps with {worker_limit} workers '
+          f'together, limited by {resource}.')
+
+    start_time = datetime.now()
+    run_cells(cells, args.conda, worker_limit, test_args,
+              args.progress_interval)
+    failed = [cell for cell in cells if cell.process.returncode != 0]
+    traced = [cell for cell in cells if os.path.isfile(cell.metrics_csv)]
+    if traced:
+        trace_json = f'{date_today}_sweep_trace.json'
+        write_trace(trace_json, [cell.metrics_csv for cell in traced],
+                    [cell.name for cell in traced])
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Timeline of all sweeps written to {trace_json}.')
+    remove_old_sweep_traces()
+    for cell in failed:
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Sweep {cell.name} failed, see {cell.log_path}')
+    if not args.no_throughput_probe \
+            and set(CCI_STORES) <= set(args.stores):
+        # the probe is a diagnostic, its failure does not fail the night
+        for test_mode in run_throughput_probes(args.modes, args.conda):
+            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                  f'Throughput probe of {test_mode} failed')
+    if not args.no_summary:
+        failed += run_summaries([cell for cell in cells if cell not in failed],
+                                args.conda, args.summary_mode)
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+          f'All sweeps took {datetime.now() - start_time}')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Transactional store for the result rows of a test run.
+
+Rows are kept in a SQLite database in WAL mode, which several processes may
+write to at the same time. Rows are buffered and inserted in batches, each
+batch in one transaction. The store exports the CSV layout of the results,
+so consumers of the results CSV are not affected.
+"""
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+
+# number of buffered rows which triggers an insert
+BATCH_SIZE = 50
+# seconds a writer waits for a lock held by another process
+LOCK_TIMEOUT = 60
+
+STAGE_COLUMNS = ['open(1)', 'open_temp(2)', 'open_bbox(3)', 'cache(4)',
+                 'map(5)']
+
+# result columns and the verification flags set when they passed
+VERIFICATION_FLAGS = {'open(1)': 'open',
+                      'open_temp(2)': 'constrain_time',
+                      'open_bbox(3)': 'constrain_region',
+                      'cache(4)': 'write_zarr'}
+
+
+def is_failed(row):
+    return row['supported'] == 'yes' \
+        and any(row[column] == 'no' for column in STAGE_COLUMNS)
+
+
+@contextlib.contextmanager
+def open_atomically(path, suffix, newline=None):
+    # the new file replaces the old one at once, readers never see
+    # a partially written file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                     suffix=suffix)
+    try:
+        with os.fdopen(fd, 'w', newline=newline) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+
+
+def write_csv_atomically(csv_path, header_row, rows):
+    with open_atomically(csv_path, '.csv.tmp', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=header_row,
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_json_atomically(json_path, obj):
+    with open_atomically(json_path, '.json.tmp') as f:
+        # one write instead of one per JSON token
+        f.write(json.dumps(obj, indent=4))
+
+
+class ResultStore:
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._connection = None
+        self._connection_pid = None
+        self._buffer = []
+
+    def __getstate__(self):
+        # connections and buffered rows are not shared with other processes
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_connection_pid'] = None
+        state['_buffer'] = []
+        return state
+
+    @property
+    def connection(self):
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                               'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                               'data_id TEXT NOT NULL, '
+                               'ecv TEXT, '
+                               'row TEXT NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_data_id '
+                               'ON results (data_id)')
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def add_row(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self._execute_in_transaction(
+            'INSERT INTO results (data_id, ecv, row) VALUES (?, ?, ?)',
+            [(row['Dataset-ID'], row.get('ECV-Name'), json.dumps(row))
+             for row in self._buffer])
+        self._buffer = []
+
+    def _execute_in_transaction(self, statement, parameters=None):
+        connection = self.connection
+        # takes the write lock right away instead of upgrading later,
+        # which could fail with concurrent writers
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if parameters is not None:
+                connection.executemany(statement, parameters)
+            else:
+                connection.execute(statement)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        self._buffer = []
+        self._execute_in_transaction('DELETE FROM results')
+
+    def replace_rows(self, rows):
+        self.clear()
+        for row in rows:
+            self.add_row(row)
+        self.flush()
+
+    def get_rows(self):
+        self.flush()
+        for (row,) in self.connection.execute(
+                'SELECT row FROM results ORDER BY seq'):
+            yield json.loads(row)
+
+    def export_csv(self, csv_path, header_row):
+        write_csv_atomically(csv_path, header_row, self.get_rows())
+
+    def close(self):
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,85 @@
+"""
+Journal of a dataset sweep, used to resume an interrupted run.
+
+The journal is a JSON lines file. Every record is appended and flushed to
+disk before the run continues, so after a crash the journal holds every
+record up to the last completed write; a truncated last line is ignored
+when reading. The result row of a dataset is journaled right after it has
+been added to the result store. On resume the store is rebuilt from the
+finished rows of the journal, which drops the rows of interrupted datasets,
+and the results CSV is exported from the store at the end of the run, so it
+has neither duplicated nor partial rows.
+"""
+import json
+import os
+from datetime import datetime
+
+
+class RunJournal:
+
+    def __init__(self, path):
+        self.path = path
+
+    def _append(self, record):
+        record['time'] = datetime.now().isoformat()
+        line = json.dumps(record) + '\n'
+        # several worker processes may append concurrently, a single write
+        # of a short line in append mode is not interleaved
+        with open(self.path, 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def start_run(self, store_name, test_mode, total, finished=0):
+        self._append({'event': 'run',
+                      'store_name': store_name,
+                      'test_mode': test_mode,
+                      'total': total,
+                      'finished': finished})
+
+    def start(self, data_id):
+        self._append({'event': 'start', 'data_id': data_id})
+
+    def stage(self, data_id, stage, result):
+        self._append({'event': 'stage', 'data_id': data_id,
+                      'stage': stage, 'result': result})
+
+    def finish(self, data_id, summary_row):
+        self._append({'event': 'finish', 'data_id': data_id,
+                      'row': summary_row})
+
+    def read(self):
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # last line of a run which died while writing it
+                    continue
+        return records
+
+    def get_finished_rows(self):
+        # in the order in which the rows were added to the result store
+        finished_rows = {}
+        for record in self.read():
+            if record['event'] == 'finish':
+                finished_rows[record['data_id']] = record['row']
+        return finished_rows
+
+    def get_in_flight(self):
+        in_flight = []
+        for record in self.read():
+            if record['event'] == 'start':
+                in_flight.append(record['data_id'])
+            elif record['event'] == 'finish' \
+                    and record['data_id'] in in_flight:
+                in_flight.remove(record['data_id'])
+        return in_flight
+
@@ -0,0 +1,77 @@
+"""
+Time-budgeted sample of the datasets of a store, for a quick signal instead
+of the full sweep.
+
+The sample is stratified by ECV: the ECVs take turns, in a random order, and
+each adds its next dataset as long as the expected time of the sample stays
+within the budget. Within an ECV, datasets which failed recently come first,
+then the fastest ones according to the median wall time of earlier runs.
+Datasets without timings are expected to take as long as the median dataset
+of their ECV, or UNKNOWN_DATASET_SECONDS.
+"""
+import random
+from collections import deque
+
+from history_store import DEFAULT_MODE
+
+# days of results in which a failure moves a dataset up in the sample
+SAMPLE_HISTORY_DAYS = 7
+# expected seconds of a dataset without timings of its own or of its ECV
+UNKNOWN_DATASET_SECONDS = 120
+# sampled runs are written to this sub-directory of the results directory
+SAMPLED_DIR = 'sampled'
+
+
+def get_sampled_mode(test_mode):
+    """Mode under which the results of sampled runs are kept in the
+    history, apart from the full sweeps."""
+    return f'{test_mode or DEFAULT_MODE}-sampled'
+
+
+def sample_data_ids(data_ids, ecvs, budget, schedule=None,
+                    failed_data_ids=(), workers=1, rng=None):
+    """
+    Stratified sample of *data_ids* expected to be tested within *budget*
+    seconds by *workers* workers.
+
+    :param ecvs: ECV of every dataset
+    :param schedule: SweepSchedule with the expected seconds of the datasets
+    :param failed_data_ids: IDs of datasets which failed recently
+    :return: the sampled IDs in the order of *data_ids* and their expected
+        seconds in total
+    """
+    rng = rng or random.Random()
+
+    def get_expected_seconds(data_id, ecv):
+        expected = None
+        if schedule is not None:
+            expected = schedule.get_expected_seconds(data_id, ecv)
+        return UNKNOWN_DATASET_SECONDS if expected is None else expected
+
+    candidates = {}
+    for data_id, ecv in zip(data_ids, ecvs):
+        candidates.setdefault(ecv, []).append(
+            (data_id not in failed_data_ids,
+             get_expected_seconds(data_id, ecv), rng.random(), data_id))
+    ecv_order = list(candidates)
+    rng.shuffle(ecv_order)
+    queues = {ecv: deque(sorted(candidates[ecv])) for ecv in ecv_order}
+
+    capacity = budget * workers
+    expected_total = 0
+    sampled = set()
+    while queues:
+        for ecv in list(queues):
+            queue = queues[ecv]
+            # datasets which do not fit anymore are dropped, the remaining
+            # capacity only shrinks
+            while queue:
+                _, seconds, _, data_id = queue.popleft()
+                if expected_total + seconds <= capacity:
+                    sampled.add(data_id)
+                    expected_total += seconds
+                    break
+            if not queue:
+                del queues[ecv]
+    return [data_id for data_id in data_ids if data_id in sampled], \
+        expected_total
@@ -0,0 +1,180 @@
+"""
+Scheduling of the dataset sweep based on the stage timings of earlier runs.
+
+The wall times of every dataset and stage are taken from the history store.
+From them the schedule derives
+
+* the order of the sweep: datasets expected to take longest are handed out
+  first, so the last datasets of a parallel run are short ones and the tail
+  of the run stays short. Datasets without timings are expected to take as
+  long as the median dataset of their ECV, or are handed out first if their
+  ECV is unknown as well.
+* a timeout budget per dataset and stage: TIMEOUT_FACTOR times the p95 of
+  the stage in earlier runs, but at least MIN_STAGE_TIMEOUT or
+  MIN_DATASET_TIMEOUT and at most the global caps. Stages with fewer than
+  MIN_RUNS timings keep the default timeout. A dataset killed at its
+  timeout is recorded with the timeout as its wall time, a lower bound of
+  the time it needs, so a budget cut short grows again.
+
+Every budget which differs from the default comes with a reason, which is
+written to the schedule report and to the comment of a timed out stage.
+"""
+import csv
+import math
+import statistics
+from datetime import datetime
+from datetime import timedelta
+
+from instrumentation import percentile
+
+TIMEOUT_FACTOR = 3
+MIN_RUNS = 3
+MIN_STAGE_TIMEOUT = 30
+MAX_STAGE_TIMEOUT = 900
+MIN_DATASET_TIMEOUT = 120
+MAX_DATASET_TIMEOUT = 3600
+# days of timings the schedule is based on
+SCHEDULE_HISTORY_DAYS = 30
+
+# stages of test_open_ds which run under a timeout
+SCHEDULED_STAGES = ['open', 'open_temp', 'open_bbox', 'processing',
+                    'visualization', 'write']
+DATASET_STAGE = 'dataset'
+# stages left out of the total of a dataset, the traceback of a failed
+# stage is written as part of that stage
+CHILD_STAGES = {'traceback'}
+# stage recorded for a dataset killed at its timeout, its stages are lost
+# with the worker
+TIMED_OUT_STAGE = 'timed_out'
+
+SCHEDULE_HEADER_ROW = ['Dataset-ID', 'stage', 'expected', 'timeout',
+                       'default_timeout', 'reason']
+
+
+class SweepSchedule:
+
+    def __init__(self, timings, default_stage_timeouts,
+                 default_dataset_timeout, factor=TIMEOUT_FACTOR,
+                 min_runs=MIN_RUNS):
+        """
+        :param timings: iterable of (data_id, ecv, date, stage, wall_time)
+        :param default_stage_timeouts: dict of the default timeout of every
+            scheduled stage, None for no timeout
+        :param default_dataset_timeout: default timeout of a whole dataset
+        """
+        self.default_stage_timeouts = default_stage_timeouts
+        self.default_dataset_timeout = default_dataset_timeout
+        self.factor = factor
+        self.min_runs = min_runs
+        self._stage_times = {}
+        self._ecvs = {}
+        totals = {}
+        for data_id, ecv, date, stage, wall_time in timings:
+            self._stage_times.setdefault(data_id, {}) \
+                .setdefault(stage, []).append(wall_time)
+            self._ecvs[data_id] = ecv
+            if stage in CHILD_STAGES:
+                continue
+            totals[(data_id, date)] = totals.get((data_id, date), 0) \
+                + wall_time
+        for (data_id, date), total in totals.items():
+            self._stage_times[data_id].setdefault(DATASET_STAGE, []) \
+                .append(total)
+        expected_per_ecv = {}
+        for data_id, ecv in self._ecvs.items():
+            expected_per_ecv.setdefault(ecv, []).append(
+                self._get_known_expected(data_id))
+        self._expected_per_ecv = {ecv: statistics.median(values)
+                                  for ecv, values in expected_per_ecv.items()}
+
+    def _get_known_expected(self, data_id):
+        return statistics.median(self._stage_times[data_id][DATASET_STAGE])
+
+    def get_expected_seconds(self, data_id, ecv=None):
+        """
+        Median wall time of the dataset in earlier runs, of the datasets of
+        its ECV if it has no timings, or None.
+        """
+        if data_id in self._stage_times:
+            return self._get_known_expected(data_id)
+        return self._expected_per_ecv.get(ecv)
+
+    def order(self, data_ids, ecvs=None):
+        """
+        Indices of *data_ids*, longest expected dataset first. Datasets
+        without any expectation come first, keeping their order.
+        """
+        ecvs = ecvs or [None] * len(data_ids)
+        expected = [self.get_expected_seconds(data_id, ecv)
+                    for data_id, ecv in zip(data_ids, ecvs)]
+        return sorted(range(len(data_ids)),
+                      key=lambda i: -math.inf if expected[i] is None
+                      else -expected[i])
+
+    def _get_budget(self, data_id, stage, default, minimum, cap):
+        values = self._stage_times.get(data_id, {}).get(stage, [])
+        if len(values) < self.min_runs:
+            return default, ''
+        p95 = percentile(values, 95)
+        budget = max(math.ceil(self.factor * p95), minimum)
+        basis = f'{self.factor} x p95 of {p95:.1f} s over {len(values)} runs'
+        if budget > cap:
+            budget = cap
+            basis = f'{basis}, capped at {cap} s'
+        if default is None:
+            return budget, f'limited to {budget} s: {basis}'
+        if budget > default:
+            return budget, f'extended from {default} s to {budget} s: {basis}'
+        if budget < default:
+            return budget, f'cut short from {default} s to {budget} s: ' \
+                           f'{basis}'
+        return default, ''
+
+    def get_stage_timeouts(self, data_id):
+        """
+        Dict of (timeout, reason) for every scheduled stage of a dataset.
+        """
+        return {stage: self._get_budget(data_id, stage,
+                                        self.default_stage_timeouts.get(stage),
+                                        MIN_STAGE_TIMEOUT, MAX_STAGE_TIMEOUT)
+                for stage in SCHEDULED_STAGES}
+
+    def get_dataset_timeout(self, data_id):
+        """(timeout, reason) of a whole dataset."""
+        return self._get_budget(data_id, DATASET_STAGE,
+                                self.default_dataset_timeout,
+                                MIN_DATASET_TIMEOUT, MAX_DATASET_TIMEOUT)
+
+    def get_report_rows(self, data_ids):
+        """Rows of the schedule report, one per adjusted budget."""
+        for data_id in data_ids:
+            budgets = dict(self.get_stage_timeouts(data_id))
+            budgets[DATASET_STAGE] = self.get_dataset_timeout(data_id)
+            for stage, (timeout, reason) in budgets.items():
+                if not reason:
+                    continue
+                values = self._stage_times[data_id][stage]
+                if stage == DATASET_STAGE:
+                    default = self.default_dataset_timeout
+                else:
+                    default = self.default_stage_timeouts.get(stage)
+                yield {'Dataset-ID': data_id,
+                       'stage': stage,
+                       'expected': round(statistics.median(values), 3),
+                       'timeout': timeout,
+                       'default_timeout': default,
+                       'reason': reason}
+
+
+def load_schedule(history, mode, store_name, default_stage_timeouts,
+                  default_dataset_timeout, days=SCHEDULE_HISTORY_DAYS):
+    since = (datetime.now().date() - timedelta(days=days)).isoformat()
+    return SweepSchedule(history.get_stage_timings(mode, store_name, since),
+                         default_stage_timeouts, default_dataset_timeout)
+
+
+def write_schedule_report(schedule_csv, schedule, data_ids):
+    with open(schedule_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SCHEDULE_HEADER_ROW)
+        writer.writeheader()
+        writer.writerows(schedule.get_report_rows(data_ids))
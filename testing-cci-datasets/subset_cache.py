@@ -0,0 +1,110 @@
+"""
+Cache check of the subset which was already opened and read for processing.
+
+Instead of fetching the subset from the remote store a second time with
+open_dataset(..., force_local=True), the subset is persisted in memory while
+it is processed, written to zarr with parallel chunk writes, reopened and
+compared to the persisted data. Targets of the write are
+
+* ``memory``: an in-memory zarr store,
+* ``tmpfs``: a zarr directory in /dev/shm, or the temp directory if there
+  is no /dev/shm,
+* ``local``: the local data store of cate, like open_dataset does.
+
+The target ``remote`` keeps the original check with open_dataset. It is
+used as well for subsets too large to be persisted, which would otherwise be
+read from the store again for writing and for the comparison.
+"""
+import os
+import shutil
+import tempfile
+
+import dask
+import xarray as xr
+import zarr
+
+CACHE_TARGET_REMOTE = 'remote'
+CACHE_TARGET_MEMORY = 'memory'
+CACHE_TARGET_TMPFS = 'tmpfs'
+CACHE_TARGET_LOCAL = 'local'
+CACHE_TARGETS = [CACHE_TARGET_REMOTE, CACHE_TARGET_MEMORY, CACHE_TARGET_TMPFS,
+                 CACHE_TARGET_LOCAL]
+
+# threads writing chunks concurrently
+WRITE_THREADS = 4
+TMPFS_DIR = '/dev/shm'
+
+
+class SubsetCacheError(Exception):
+    pass
+
+
+def materialize_subset(dataset, memory_limit):
+    """
+    The subset with its data persisted in memory, so that processing and
+    writing read it only once from the store, or None for subsets larger
+    than *memory_limit* bytes.
+    """
+    if dataset.nbytes > memory_limit:
+        return None
+    return dataset.persist()
+
+
+def _prepare_for_zarr(dataset):
+    dataset = dataset.copy()
+    # encodings of the remote store may not fit the chunks of the subset
+    for variable in dataset.variables.values():
+        variable.encoding = {}
+    # zarr needs regular chunks
+    try:
+        return dataset.chunk({dim: 'auto' for dim in dataset.dims})
+    except (NotImplementedError, ValueError):
+        return dataset.chunk({dim: -1 for dim in dataset.dims})
+
+
+def _get_tmpfs_dir():
+    if os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK):
+        return TMPFS_DIR
+    return tempfile.gettempdir()
+
+
+def verify_written_subset(dataset, written):
+    if dict(written.sizes) != dict(dataset.sizes):
+        raise SubsetCacheError(f'Written subset has sizes '
+                               f'{dict(written.sizes)} instead of '
+                               f'{dict(dataset.sizes)}.')
+    for var_name in dataset.data_vars:
+        if var_name not in written.data_vars:
+            raise SubsetCacheError(f'Variable {var_name} is missing in the '
+                                   f'written subset.')
+        if not written[var_name].equals(dataset[var_name]):
+            raise SubsetCacheError(f'Values of variable {var_name} differ '
+                                   f'in the written subset.')
+
+
+def write_subset(dataset, cache_target, local_ds_id, lds=None,
+                 threads=WRITE_THREADS):
+    """
+    Write *dataset* to *cache_target*, reopen and verify it. Data written
+    to the local store is left there for the caller to delete.
+    """
+    prepared = _prepare_for_zarr(dataset)
+    with dask.config.set(scheduler='threads', num_workers=threads):
+        if cache_target == CACHE_TARGET_MEMORY:
+            store = zarr.storage.MemoryStore()
+            prepared.to_zarr(store, mode='w')
+            verify_written_subset(dataset, xr.open_zarr(store))
+        elif cache_target == CACHE_TARGET_TMPFS:
+            tmpfs_dir = tempfile.mkdtemp(prefix='cate-e2e-',
+                                         dir=_get_tmpfs_dir())
+            try:
+                path = os.path.join(tmpfs_dir, local_ds_id)
+                prepared.to_zarr(path, mode='w')
+                verify_written_subset(dataset, xr.open_zarr(path))
+            finally:
+                shutil.rmtree(tmpfs_dir, ignore_errors=True)
+        elif cache_target == CACHE_TARGET_LOCAL:
+            lds.write_data(prepared, data_id=local_ds_id, replace=True)
+            verify_written_subset(dataset, lds.open_data(local_ds_id))
+        else:
+            raise ValueError(f'Unknown cache target "{cache_target}".')
@@ -0,0 +1,159 @@
+"""
+Chunk-aligned selection of the subsets requested by the dataset tests.
+
+A subset which straddles chunk boundaries makes the store transfer every
+chunk it touches, although only a few cells are used. The planner reads the
+chunking of the requested variables from the opened cube, or the descriptor
+if the cube has none, and picks a time window and a region which fall into a
+single chunk of every variable. The choice is randomized with a seeded
+random.Random, so a run can be reproduced, and stays inside the bbox of the
+descriptor.
+"""
+import itertools
+import math
+
+import pandas as pd
+
+# number of time steps and of cells along x and y of a subset
+TIME_STEPS = 3
+SPATIAL_CELLS = 2
+# cells kept between a region and the chunk border, so that stores which
+# widen a region by half a cell still stay in the chunk
+SPATIAL_MARGIN = 1
+
+
+def get_spatial_names(dataset):
+    for x_name, y_name in (('lon', 'lat'), ('longitude', 'latitude'),
+                           ('x', 'y')):
+        if x_name in dataset.coords and y_name in dataset.coords:
+            return x_name, y_name
+    raise ValueError(f'Could not find spatial coordinates in '
+                     f'{list(dataset.coords)}.')
+
+
+def get_time_name(dataset):
+    for time_name in ('time', 't'):
+        if time_name in dataset.coords:
+            return time_name
+    return None
+
+
+def _get_chunk_sizes(dataset, var_name, dim, data_descriptor=None):
+    variable = dataset[var_name]
+    if dim not in variable.dims:
+        return None
+    axis = variable.dims.index(dim)
+    size = variable.shape[axis]
+    if variable.chunks is not None:
+        return variable.chunks[axis]
+    chunk_size = None
+    if variable.encoding.get('chunks'):
+        chunk_size = variable.encoding['chunks'][axis]
+    elif data_descriptor is not None and data_descriptor.data_vars \
+            and var_name in data_descriptor.data_vars:
+        var_descriptor = data_descriptor.data_vars[var_name]
+        if var_descriptor.chunks and var_descriptor.dims \
+                and dim in var_descriptor.dims:
+            chunk_size = \
+                var_descriptor.chunks[list(var_descriptor.dims).index(dim)]
+    if not chunk_size:
+        return None
+    return (chunk_size,) * (size // chunk_size) \
+        + ((size % chunk_size,) if size % chunk_size else ())
+
+
+def get_chunk_boundaries(dataset, var_names, dim, data_descriptor=None):
+    """
+    Sorted indices along *dim* at which a chunk of any of the variables
+    starts, including 0 and the size of *dim*.
+    """
+    size = dataset.sizes[dim]
+    boundaries = {0, size}
+    for var_name in var_names:
+        chunk_sizes = _get_chunk_sizes(dataset, var_name, dim,
+                                       data_descriptor)
+        if chunk_sizes is not None:
+            boundaries.update(itertools.accumulate(chunk_sizes))
+    return sorted(boundary for boundary in boundaries if boundary <= size)
+
+
+def pick_window(boundaries, length, margin, rng):
+    """
+    Start and end index of a window of *length* cells between two
+    consecutive boundaries, *margin* cells away from them if possible.
+    """
+    cells = [(start, end) for start, end in zip(boundaries, boundaries[1:])
+             if end > start]
+    fitting = [(start, end) for start, end in cells
+               if end - start >= length + 2 * margin]
+    if fitting:
+        start, end = rng.choice(fitting)
+        window_start = rng.randint(start + margin, end - margin - length)
+        return window_start, window_start + length
+    # no chunk is large enough, the window is cut to the largest one
+    start, end = max(cells, key=lambda cell: cell[1] - cell[0])
+    length = min(length, end - start)
+    window_start = rng.randint(start, end - length)
+    return window_start, window_start + length
+
+
+def format_time(time_value):
+    # cftime dates are formatted directly, they may be out of the bounds
+    # of pandas timestamps
+    if not hasattr(time_value, 'strftime'):
+        time_value = pd.Timestamp(time_value)
+    if (time_value.hour, time_value.minute, time_value.second) == (0, 0, 0):
+        return time_value.strftime('%Y-%m-%d')
+    return time_value.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def plan_time_range(dataset, var_names, rng, data_descriptor=None):
+    time_name = get_time_name(dataset)
+    if time_name is None or time_name not in dataset.dims \
+            or dataset.sizes[time_name] == 0:
+        return None
+    boundaries = get_chunk_boundaries(dataset, var_names, time_name,
+                                      data_descriptor)
+    start, end = pick_window(boundaries, TIME_STEPS, 0, rng)
+    times = dataset[time_name].values
+    return format_time(times[start]), format_time(times[end - 1])
+
+
+def plan_region(dataset, var_names, rng, data_descriptor=None):
+    try:
+        x_name, y_name = get_spatial_names(dataset)
+    except ValueError:
+        return None
+    if x_name not in dataset.dims or y_name not in dataset.dims \
+            or dataset.sizes[x_name] == 0 or dataset.sizes[y_name] == 0:
+        return None
+    corners = []
+    for name in (x_name, y_name):
+        boundaries = get_chunk_boundaries(dataset, var_names, name,
+                                          data_descriptor)
+        start, end = pick_window(boundaries, SPATIAL_CELLS, SPATIAL_MARGIN,
+                                 rng)
+        values = dataset[name].values[start:end]
+        corners.append((float(values.min()), float(values.max())))
+    # rounded outwards, so the region keeps the selected cells
+    (x_min, x_max), (y_min, y_max) = \
+        [(math.floor(low * 1e5) / 1e5, math.ceil(high * 1e5) / 1e5)
+         for low, high in corners]
+    if data_descriptor is not None and data_descriptor.bbox is not None:
+        bbox_x_min, bbox_y_min, bbox_x_max, bbox_y_max = \
+            (float(value) for value in data_descriptor.bbox)
+        x_min, x_max = max(x_min, bbox_x_min), min(x_max, bbox_x_max)
+        y_min, y_max = max(y_min, bbox_y_min), min(y_max, bbox_y_max)
+        if x_min > x_max or y_min > y_max:
+            return None
+    return [x_min, y_min, x_max, y_max]
+
+
+def plan_subset(dataset, var_names, rng, data_descriptor=None):
+    """
+    Time range and region of a subset of *dataset* which falls into one
+    chunk of each of *var_names*. Either is None if the cube lacks the
+    coordinates to plan it.
+    """
+    return plan_time_range(dataset, var_names, rng, data_descriptor), \
+        plan_region(dataset, var_names, rng, data_descriptor)
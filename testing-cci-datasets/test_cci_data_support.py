@@ -1,16 +1,20 @@
+import argparse
 import csv
 import json
+import math
 import os
 import random
 import shutil
 import signal
 import sys
+import time
 import traceback
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
 from datetime import timedelta
 
 import nest_asyncio
-import numpy as np
 import pandas as pd
 from cate.core import DATA_STORE_POOL
 from cate.core.ds import DataAccessError
@@ -18,6 +22,55 @@ from cate.ops.io import open_dataset
 from xcube.core.store import DATASET_TYPE
 from xcube.core.store import DataStoreError
 
+from chunk_reduction import ChunkReadError
+from chunk_reduction import stream_reduce
+from chunk_cache import CHUNK_CACHE_DIR
+from chunk_cache import CHUNK_CACHE_MAX_SIZE
+from chunk_cache import ChunkCache
+from chunk_cache import install_chunk_cache
+from fingerprints import FINGERPRINT_DB
+from fingerprints import MAX_RESULT_AGE_DAYS
+from fingerprints import FingerprintStore
+from fingerprints import plan_incremental_sweep
+from history_store import DEFAULT_MODE
+from history_store import HISTORY_DB
+from history_store import HistoryStore
+from instrumentation import METRICS_HEADER_ROW
+from instrumentation import StageMetrics
+from instrumentation import read_metrics_rows
+from instrumentation import write_metrics_rows
+from memory_governor import DATASET_MEMORY_LIMIT
+from memory_governor import HOST_MEMORY_SHARE
+from memory_governor import MEMORY_HEADER_ROW
+from memory_governor import MemoryBudgetExceeded
+from memory_governor import MemoryGovernor
+from memory_governor import get_host_memory_limit
+from memory_governor import memory_guard
+from metadata_cache import METADATA_CACHE_DIR
+from metadata_cache import METADATA_CACHE_TTL
+from metadata_cache import MetadataCache
+from metadata_cache import get_catalog_fingerprint
+from result_store import ResultStore
+from result_store import write_csv_atomically
+from result_store import write_json_atomically
+from run_journal import RunJournal
+from sampler import SAMPLE_HISTORY_DAYS
+from sampler import SAMPLED_DIR
+from sampler import get_sampled_mode
+from sampler import sample_data_ids
+from scheduler import TIMED_OUT_STAGE
+from scheduler import load_schedule
+from scheduler import write_schedule_report
+from subset_cache import CACHE_TARGETS
+from subset_cache import CACHE_TARGET_REMOTE
+from subset_cache import SubsetCacheError
+from subset_cache import materialize_subset
+from subset_cache import write_subset
+from subset_planner import get_spatial_names
+from subset_planner import plan_subset
+from trace_export import write_trace
+from worker_pool import run_pool
+
 nest_asyncio.apply()
 
 # header for CSV report
@@ -52,6 +105,20 @@ not_supported_list = [['sinusoidal',
 
 # time out in order to cancel datasets which are taking longer than a certain time
 TIMEOUT_TIME = 120
+# time out for a whole dataset when running with several workers,
+# covers all stages of test_open_ds
+DATASET_TIMEOUT_TIME = 8 * TIMEOUT_TIME
+# timeouts of the stages of test_open_ds unless the schedule of a run sets
+# others, stages which are not listed have no timeout
+DEFAULT_STAGE_TIMEOUTS = {'processing': TIMEOUT_TIME,
+                          'visualization': TIMEOUT_TIME,
+                          'write': TIMEOUT_TIME}
+# percentage of datasets for which the constrained open_dataset calls are
+# still verified against the store when subsets are derived from one handle
+CONSTRAINT_SAMPLE_PERCENTAGE = 10
+# maximum number of bytes held in memory while reading a variable
+# for the processing check
+PROCESSING_MEMORY_LIMIT = 256 * 1024 * 1024
 
 date_today = datetime.date(datetime.now())
 
@@ -60,10 +127,27 @@ class TimeOutException(Exception):
     pass
 
 
-def alarm_handler(signum, frame):
-    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
-          f'ALARM signal received')
-    raise TimeOutException(f'Time out after {TIMEOUT_TIME} seconds.')
+def start_alarm(timeout, reason=''):
+    # no alarm for a timeout of None
+    def alarm_handler(signum, frame):
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'ALARM signal received')
+        if reason:
+            raise TimeOutException(f'Time out after {timeout} seconds, '
+                                   f'timeout {reason}.')
+        raise TimeOutException(f'Time out after {timeout} seconds.')
+
+    signal.signal(signal.SIGALRM, alarm_handler)
+    signal.alarm(math.ceil(timeout) if timeout else 0)
+
+
+@contextmanager
+def stage_alarm(timeout, reason=''):
+    start_alarm(timeout, reason)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
 
 
 # Utility functions
@@ -124,7 +208,7 @@ def get_time_range(data_descriptor, data):
     return None
 
 
-def get_region(data_descriptor):
+def get_region(data_descriptor, rng=random):
     if data_descriptor.bbox is None:
         return None
     bbox_minx = data_descriptor.bbox[0]
@@ -138,8 +222,8 @@ def get_region(data_descriptor):
     maxx = float(bbox_maxx) - spatial_res * 2.
     miny = float(bbox_miny)
     maxy = float(bbox_maxy) - spatial_res * 2.
-    indx = random.uniform(minx, maxx)
-    indy = random.uniform(miny, maxy)
+    indx = rng.uniform(minx, maxx)
+    indy = rng.uniform(miny, maxy)
     if indx == maxx:
         if indx > 0:
             indx = indx - 1
@@ -161,9 +245,38 @@ def get_region(data_descriptor):
     return region
 
 
-def check_for_processing(dataset, summary_row, time_range):
-    signal.signal(signal.SIGALRM, alarm_handler)
-    signal.alarm(TIMEOUT_TIME)
+def is_in_constraint_sample(data_id, sample_percentage):
+    # the sample changes from day to day but is the same for all runs of a day
+    return zlib.crc32(f'{date_today}{data_id}'.encode()) % 100 \
+        < sample_percentage
+
+
+def derive_subset(dataset, time_range=None, region=None):
+    # derives the subset lazily from an opened dataset instead of asking the
+    # store for it with another open_dataset call
+    subset = dataset
+    if time_range is not None:
+        time_name = 'time' if 'time' in dataset.coords else 't'
+        subset = subset.sel({time_name: slice(time_range[0], time_range[1])})
+    if region is not None:
+        x_name, y_name = get_spatial_names(subset)
+        x_min, y_min, x_max, y_max = region
+        y_slice = slice(y_min, y_max)
+        if subset[y_name].size > 1 \
+                and subset[y_name].values[0] > subset[y_name].values[-1]:
+            y_slice = slice(y_max, y_min)
+        subset = subset.sel({x_name: slice(x_min, x_max), y_name: y_slice})
+    empty_dims = [dim for dim, size in subset.sizes.items() if size == 0]
+    if len(empty_dims) > 0:
+        raise ValueError(f'Subset for time range {time_range} and region '
+                         f'{region} is empty along {empty_dims}.')
+    return subset
+
+
+def check_for_processing(dataset, summary_row, time_range,
+                         memory_limit=PROCESSING_MEMORY_LIMIT, metrics=None,
+                         timeout=TIMEOUT_TIME, timeout_reason=''):
+    start_alarm(timeout, timeout_reason)
     try:
         try:
             var = list(dataset.data_vars)[0]
@@ -173,7 +286,16 @@ def check_for_processing(dataset, summary_row, time_range):
                         f'{list(dataset.data_vars)}: {sys.exc_info()[:2]}'
             return summary_row, comment_1
         try:
-            np.sum(dataset[var].values)
+            stats = stream_reduce(dataset[var], memory_limit,
+                                  pass_through=(TimeOutException,
+                                                MemoryBudgetExceeded))
+            if metrics is not None:
+                metrics.add_bytes_read(stats['bytes_read'])
+            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                  f'Read {stats["bytes_read"]} bytes of variable {var} '
+                  f'from {stats["chunks"]} chunks in '
+                  f'{stats["seconds"]:.2f} seconds '
+                  f'({stats["throughput"]:.2f} MB/s).')
             try:
                 first = dataset.time.values[0].strftime("%Y-%m-%d %H:%M:%S")
                 last = dataset.time.values[-1].strftime("%Y-%m-%d %H:%M:%S")
@@ -193,12 +315,21 @@ def check_for_processing(dataset, summary_row, time_range):
                   f'and last {last}.')
             summary_row['open_bbox(3)'] = 'yes'
             comment_1 = ''
+        except ChunkReadError as e:
+            summary_row['open_bbox(3)'] = 'no'
+            comment_1 = f'Failed reading chunk {e.block_index} of ' \
+                        f'dataset[{var}]: {sys.exc_info()[:2]}'
+        except (TimeOutException, MemoryBudgetExceeded):
+            raise
         except:
             summary_row['open_bbox(3)'] = 'no'
-            comment_1 = f'Failed executing np.sum(dataset[{var}]): {sys.exc_info()[:2]}'
+            comment_1 = f'Failed reducing dataset[{var}]: {sys.exc_info()[:2]}'
     except TimeOutException:
         summary_row['open_bbox(3)'] = 'no'
         comment_1 = sys.exc_info()[:2]
+    except MemoryBudgetExceeded as e:
+        summary_row['open_bbox(3)'] = 'no'
+        comment_1 = str(e)
     signal.alarm(0)
 
     return summary_row, comment_1
@@ -206,32 +337,49 @@ def check_for_processing(dataset, summary_row, time_range):
 
 def check_write_to_disc(summary_row, comment_2, data_id, time_range, variables,
                         region, lds,
-                        store_name):
-    signal.signal(signal.SIGALRM, alarm_handler)
-    signal.alarm(TIMEOUT_TIME)
+                        store_name, local_namespace=None,
+                        timeout=TIMEOUT_TIME, timeout_reason='',
+                        cache_target=CACHE_TARGET_REMOTE, dataset=None):
     if comment_2 is not None:
         return summary_row, comment_2
+    start_alarm(timeout, timeout_reason)
 
-    # needed for when tests run in parallel
+    # needed for when tests run in parallel or in several modes at once
     local_ds_id = f'local.{data_id}.zarr'
-    print(f'Saving data locally as "{local_ds_id}"')
+    if local_namespace is not None:
+        local_ds_id = f'local.{local_namespace}.{data_id}.zarr'
     try:
-        local_ds = open_dataset(ds_id=data_id,
-                                data_store_id=store_name,
-                                time_range=time_range,
-                                var_names=variables,
-                                region=region,
-                                local_ds_id=local_ds_id,
-                                force_local=True)
-        local_ds.close()
+        if cache_target != CACHE_TARGET_REMOTE and dataset is not None:
+            # the subset opened for processing is written, it is not
+            # fetched from the remote store again
+            print(f'Writing subset to {cache_target} cache as '
+                  f'"{local_ds_id}"')
+            write_subset(dataset, cache_target, local_ds_id, lds)
+        else:
+            print(f'Saving data locally as "{local_ds_id}"')
+            local_ds = open_dataset(ds_id=data_id,
+                                    data_store_id=store_name,
+                                    time_range=time_range,
+                                    var_names=variables,
+                                    region=region,
+                                    local_ds_id=local_ds_id,
+                                    force_local=True)
+            local_ds.close()
         summary_row['cache(4)'] = 'yes'
         comment_2 = ''
+    except SubsetCacheError as e:
+        summary_row['cache(4)'] = 'no'
+        comment_2 = f'{local_ds_id}: Verifying the subset written to the ' \
+                    f'{cache_target} cache failed: {e}'
     except DataAccessError:
         summary_row['cache(4)'] = 'no'
         comment_2 = f'{local_ds_id}: Failed saving to disc with: {sys.exc_info()[:2]}'
     except TimeOutException:
         summary_row['cache(4)'] = 'no'
         comment_2 = sys.exc_info()[:2]
+    except MemoryBudgetExceeded as e:
+        summary_row['cache(4)'] = 'no'
+        comment_2 = f'{local_ds_id}: {e}'
     except:
         summary_row['cache(4)'] = 'no'
         comment_2 = f'Failed saving to disc with: {sys.exc_info()[:2]}'
@@ -266,15 +414,16 @@ def _all_tests_no(summary_row,
     elif comment_spatial is not None and comment_spatial != 'not_tested':
         summary_row['comment'] \
             = f'(1) Dataset can open without spatial subset only; (2) {comment_spatial}'
-    update_csv(results_csv, header_row, summary_row)
+    if results_csv is not None:
+        update_csv(results_csv, header_row, summary_row)
 
 
-def check_for_visualization(cube, summary_row, variables):
+def check_for_visualization(cube, summary_row, variables,
+                            timeout=TIMEOUT_TIME, timeout_reason=''):
     var_with_lat_lon_right_order = []
     vars = []
     comment_3 = None
-    signal.signal(signal.SIGALRM, alarm_handler)
-    signal.alarm(TIMEOUT_TIME)
+    start_alarm(timeout, timeout_reason)
     try:
         for var in cube.data_vars:
             vars.append(var)
@@ -319,17 +468,47 @@ def check_for_support(data_id):
     return supported, reason
 
 
-def test_open_ds(data_id, store, lds, results_csv, store_name):
+def _journal_stage(journal, data_id, stage, summary_row):
+    if journal is not None:
+        journal.stage(data_id, stage, summary_row.get(stage, 'no'))
+
+
+def get_ecv_name(data_id, store_name):
+    return data_id.split('-')[1] \
+        if store_name == 'cci-zarr-store' else data_id.split('.')[1]
+
+
+def test_open_ds(data_id, store, lds, results_csv, store_name,
+                 local_namespace=None, open_once=False,
+                 constraint_sample=CONSTRAINT_SAMPLE_PERCENTAGE,
+                 processing_memory_limit=PROCESSING_MEMORY_LIMIT,
+                 metadata_cache=None, journal=None, metrics=None,
+                 stage_timeouts=None, subset_seed=None,
+                 cache_target=CACHE_TARGET_REMOTE, memory_governor=None):
     comment_temporal = None
     comment_spatial = None
-    ecv_name = data_id.split('-')[1] \
-        if store_name == 'cci-zarr-store' else data_id.split('.')[1]
+    ecv_name = get_ecv_name(data_id, store_name)
     summary_row = {'ECV-Name': ecv_name,
                    'Dataset-ID': data_id,
                    'supported': 'yes'}
+    if metrics is None:
+        metrics = StageMetrics(data_id, ecv_name,
+                               memory_governor=memory_governor)
+    # (timeout, reason) of every stage
+    if stage_timeouts is None:
+        stage_timeouts = {stage: (timeout, '')
+                          for stage, timeout in DEFAULT_STAGE_TIMEOUTS.items()}
+
+    def get_stage_timeout(stage):
+        return stage_timeouts.get(stage, (None, ''))
 
     data_type = None
-    data_types_for_data = store.get_data_types_for_data(data_id)
+    with metrics.measure('data_types'):
+        if metadata_cache is not None:
+            data_types_for_data = metadata_cache.get_data_types_for_data(
+                store, store_name, data_id)
+        else:
+            data_types_for_data = store.get_data_types_for_data(data_id)
 
     for data_type_for_data in data_types_for_data:
         if DATASET_TYPE.is_super_type_of(data_type_for_data):
@@ -340,32 +519,41 @@ def test_open_ds(data_id, store, lds, results_csv, store_name):
                     f'only available data types "{data_types_for_data}" ' \
                     f'were found.'
         _all_tests_no(summary_row, results_csv, general_comment=comment_1)
-        return
+        return summary_row
     summary_row['Data-Type'] = data_type
 
     try:
-        data_descriptor = store.describe_data(data_id=data_id,
-                                              data_type=data_type)
+        with metrics.measure('describe'):
+            if metadata_cache is not None:
+                data_descriptor = metadata_cache.describe_data(
+                    store, store_name, data_id, data_type)
+            else:
+                data_descriptor = store.describe_data(data_id=data_id,
+                                                      data_type=data_type)
     except (DataStoreError, KeyError):
         summary_row['Dataset-Title'] = data_id
         comment_1 = f'Failed getting data description while executing ' \
                     f'store.describe_data(data_id=data_id, ' \
                     f'data_type=data_type) with: {sys.exc_info()[:2]}'
         _all_tests_no(summary_row, results_csv, general_comment=comment_1)
-        return
+        return summary_row
     summary_row['Dataset-Title'] = data_descriptor.attrs.get('title', data_id)
 
     supported, reason = check_for_support(data_id)
     if not supported:
         summary_row['supported'] = 'no'
         _all_tests_no(summary_row, results_csv, general_comment=reason)
-        return
+        return summary_row
 
+    # variables and subsets are chosen reproducibly for a seed, by default
+    # the same on one day
+    seed = date_today if subset_seed is None else subset_seed
+    rng = random.Random(f'{seed}:{data_id}')
     var_list = []
     if data_descriptor.data_vars is not None:
         if len(data_descriptor.data_vars) > 3:
             while len(var_list) < 1:
-                for var in random.choices(
+                for var in rng.choices(
                         list(data_descriptor.data_vars.keys()), k=2):
                     var_list.append(var)
         else:
@@ -375,10 +563,12 @@ def test_open_ds(data_id, store, lds, results_csv, store_name):
         print(
             f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Opening cube for '
             f'data_id {data_id} with {var_list}.')
-        dataset = open_dataset(ds_id=data_id,
-                               data_store_id=store_name,
-                               var_names=var_list,
-                               force_local=False)
+        with metrics.measure('open'), \
+                stage_alarm(*get_stage_timeout('open')):
+            dataset = open_dataset(ds_id=data_id,
+                                   data_store_id=store_name,
+                                   var_names=var_list,
+                                   force_local=False)
         vars_in_dataset = []
         for var in var_list:
             if var in dataset.data_vars:
@@ -386,9 +576,24 @@ def test_open_ds(data_id, store, lds, results_csv, store_name):
         if len(vars_in_dataset) == 0:
             comment_1 = f'Requested variables {var_list} for subset are not in dataset.'
             _all_tests_no(summary_row, results_csv, general_comment=comment_1)
-            return
+            return summary_row
         summary_row['open(1)'] = 'yes'
-        time_range = get_time_range(data_descriptor, dataset)
+        _journal_stage(journal, data_id, 'open(1)', summary_row)
+        opened_dataset = dataset
+        # subsets are planned to fall into one chunk of every variable
+        try:
+            time_range, region = plan_subset(dataset, vars_in_dataset, rng,
+                                             data_descriptor)
+        except Exception:
+            # the dataset was opened, the subset is chosen like before
+            # the planner instead of failing the dataset
+            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                  f'Could not plan chunk-aligned subset of {data_id}, '
+                  f'using the time range and region of the descriptor: '
+                  f'{sys.exc_info()[:2]}')
+            time_range, region = None, None
+        if time_range is None:
+            time_range = get_time_range(data_descriptor, dataset)
         if time_range is None:
             comment_temporal = 'Dataset has no time coordinate.'
     except:
@@ -396,21 +601,36 @@ def test_open_ds(data_id, store, lds, results_csv, store_name):
                                                      data_id,
                                                      None,
                                                      var_list,
-                                                     None)
+                                                     None,
+                                                     metrics=metrics)
         _all_tests_no(summary_row, results_csv,
                       general_comment=traceback_file_url)
-        return
+        return summary_row
+
+    # In open-once mode the subsets are derived from the cube opened above,
+    # only a sample of datasets still verifies the constrained store calls.
+    derive_subsets = open_once and \
+        not is_in_constraint_sample(data_id, constraint_sample)
 
     if time_range is not None:
         try:
-            print(
-                f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Opening cube for '
-                f'data_id {data_id} with {var_list} and time range {time_range}.')
-            dataset = open_dataset(ds_id=data_id,
-                                   data_store_id=store_name,
-                                   time_range=time_range,
-                                   var_names=var_list,
-                                   force_local=False)
+            with metrics.measure('open_temp'), \
+                    stage_alarm(*get_stage_timeout('open_temp')):
+                if derive_subsets:
+                    print(
+                        f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Deriving subset for '
+                        f'data_id {data_id} with {var_list} and time range {time_range}.')
+                    dataset = derive_subset(opened_dataset,
+                                            time_range=time_range)
+                else:
+                    print(
+                        f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Opening cube for '
+                        f'data_id {data_id} with {var_list} and time range {time_range}.')
+                    dataset = open_dataset(ds_id=data_id,
+                                           data_store_id=store_name,
+                                           time_range=time_range,
+                                           var_names=var_list,
+                                           force_local=False)
             vars_in_dataset = []
             for var in var_list:
                 if var in dataset.data_vars:
@@ -422,22 +642,33 @@ def test_open_ds(data_id, store, lds, results_csv, store_name):
         except:
             comment_temporal = generate_traceback_file(store_name, data_id,
                                                        time_range, var_list,
-                                                       None, '_temp')
+                                                       None, '_temp',
+                                                       metrics)
+        _journal_stage(journal, data_id, 'open_temp(2)', summary_row)
 
-    region = get_region(data_descriptor)
+    if region is None:
+        region = get_region(data_descriptor, rng)
 
     if region is None:
         comment_spatial = 'Could not determine region subset.'
     else:
         try:
-            print(
-                f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Opening cube for data_id '
-                f'{data_id} with {var_list} and region {region}.')
-            dataset = open_dataset(ds_id=data_id,
-                                   data_store_id=store_name,
-                                   var_names=var_list,
-                                   region=region,
-                                   force_local=False)
+            with metrics.measure('open_bbox'), \
+                    stage_alarm(*get_stage_timeout('open_bbox')):
+                if derive_subsets:
+                    print(
+                        f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Deriving subset for data_id '
+                        f'{data_id} with {var_list} and region {region}.')
+                    dataset = derive_subset(opened_dataset, region=region)
+                else:
+                    print(
+                        f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] Opening cube for data_id '
+                        f'{data_id} with {var_list} and region {region}.')
+                    dataset = open_dataset(ds_id=data_id,
+                                           data_store_id=store_name,
+                                           var_names=var_list,
+                                           region=region,
+                                           force_local=False)
             vars_in_dataset = []
             for var in var_list:
                 if var in dataset.data_vars:
@@ -449,49 +680,110 @@ def test_open_ds(data_id, store, lds, results_csv, store_name):
         except ValueError:
             comment_spatial = generate_traceback_file(store_name, data_id, None,
                                                       var_list, region,
-                                                      '_spatial')
+                                                      '_spatial', metrics)
         except IndexError:
             print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
                   f'Index error happening at stage 2. for {data_id}')
             comment_spatial = generate_traceback_file(store_name, data_id, None,
                                                       var_list, region,
-                                                      '_spatial')
+                                                      '_spatial', metrics)
         except:
             comment_spatial = generate_traceback_file(store_name, data_id, None,
                                                       var_list, region,
-                                                      '_spatial')
+                                                      '_spatial', metrics)
+        _journal_stage(journal, data_id, 'open_bbox(3)', summary_row)
 
     if comment_temporal is not None or comment_spatial is not None:
         _all_tests_no(summary_row,
                       results_csv,
                       comment_temporal=comment_temporal,
                       comment_spatial=comment_spatial)
-        return
+        return summary_row
 
-    dataset = open_dataset(ds_id=data_id,
-                           data_store_id=store_name,
-                           var_names=var_list,
-                           time_range=time_range,
-                           region=region,
-                           force_local=False)
+    with metrics.measure('open_subset'):
+        if derive_subsets:
+            dataset = derive_subset(opened_dataset, time_range=time_range,
+                                    region=region)
+        else:
+            dataset = open_dataset(ds_id=data_id,
+                                   data_store_id=store_name,
+                                   var_names=var_list,
+                                   time_range=time_range,
+                                   region=region,
+                                   force_local=False)
 
     print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
           f'Checking dataset for data_id {data_id} for processing.')
-    summary_row, comment_1 = check_for_processing(dataset, summary_row,
-                                                  time_range)
+    # the checks report an exceeded memory budget themselves, the stage
+    # fails as well if it is exceeded in between
+    # subsets which are not persisted are cached from the remote store,
+    # writing them would read them from the store twice more
+    write_target = CACHE_TARGET_REMOTE
+    processing_timeout, processing_reason = get_stage_timeout('processing')
+    with metrics.measure('processing'):
+        try:
+            with memory_guard(memory_governor, 'processing'):
+                if cache_target != CACHE_TARGET_REMOTE:
+                    # read once, processing and the cache check use the data
+                    # in memory
+                    persist_start = time.monotonic()
+                    try:
+                        with stage_alarm(processing_timeout,
+                                         processing_reason):
+                            persisted = materialize_subset(
+                                dataset, processing_memory_limit)
+                        if persisted is not None:
+                            dataset = persisted
+                            write_target = cache_target
+                    except MemoryBudgetExceeded:
+                        raise
+                    except Exception:
+                        # the processing check reports why reading failed
+                        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                              f'Could not persist subset of {data_id}: '
+                              f'{sys.exc_info()[:2]}')
+                    if processing_timeout:
+                        # persisting and processing share the budget of
+                        # the stage, at least a second is left for the
+                        # alarm
+                        processing_timeout = max(math.ceil(
+                            processing_timeout
+                            - (time.monotonic() - persist_start)), 1)
+                        processing_reason = \
+                            f'{processing_reason or "of the stage"}, ' \
+                            f'left after persisting the subset'
+                summary_row, comment_1 = check_for_processing(
+                    dataset, summary_row, time_range, processing_memory_limit,
+                    metrics, processing_timeout, processing_reason)
+        except MemoryBudgetExceeded as e:
+            signal.alarm(0)
+            summary_row['open_bbox(3)'] = 'no'
+            comment_1 = str(e)
+    _journal_stage(journal, data_id, 'open_bbox(3)', summary_row)
     print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
           f'Checking dataset for data_id {data_id} for visualization.')
-    summary_row, comment_3 = check_for_visualization(dataset, summary_row,
-                                                     var_list)
+    with metrics.measure('visualization'):
+        summary_row, comment_3 = check_for_visualization(
+            dataset, summary_row, var_list,
+            *get_stage_timeout('visualization'))
+    _journal_stage(journal, data_id, 'map(5)', summary_row)
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+          f'Checking dataset {data_id} for writing to disk.')
+    with metrics.measure('write'):
+        try:
+            with memory_guard(memory_governor, 'write'):
+                summary_row, comment_2 = check_write_to_disc(
+                    summary_row, None, data_id, time_range, var_list, region,
+                    lds, store_name, local_namespace,
+                    *get_stage_timeout('write'), write_target, dataset)
+        except MemoryBudgetExceeded as e:
+            signal.alarm(0)
+            summary_row['cache(4)'] = 'no'
+            comment_2 = str(e)
+    _journal_stage(journal, data_id, 'cache(4)', summary_row)
     print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
           f'Closing dataset for data_id {data_id}')
     dataset.close()
-    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
-          f'Checking dataset {data_id} for writing to disk.')
-    summary_row, comment_2 = check_write_to_disc(summary_row, None, data_id,
-                                                 time_range,
-                                                 var_list, region, lds,
-                                                 store_name)
 
     if comment_1 and (comment_1 == comment_3):
         summary_row['comment'] = f'{comment_1}'
@@ -506,16 +798,20 @@ def test_open_ds(data_id, store, lds, results_csv, store_name):
         if comment_3:
             comment_3 = f'(3) {comment_3}; '
         summary_row['comment'] = f'{comment_1} {comment_2} {comment_3}'
-    update_csv(results_csv, header_row, summary_row)
+    if results_csv is not None:
+        update_csv(results_csv, header_row, summary_row)
+    return summary_row
 
 
 def generate_traceback_file(store_name, data_id, time_range, var_list, region,
-                            suffix=''):
-    if not os.path.exists(f'{store_name}/error_traceback'):
-        os.mkdir(f'{store_name}/error_traceback/')
+                            suffix='', metrics=None):
+    if metrics is not None:
+        with metrics.measure('traceback'):
+            return generate_traceback_file(store_name, data_id, time_range,
+                                           var_list, region, suffix)
     dir_for_traceback = f'{store_name}/error_traceback/{date_today}'
-    if not os.path.exists(dir_for_traceback):
-        os.mkdir(dir_for_traceback)
+    # several workers may get here at the same time
+    os.makedirs(dir_for_traceback, exist_ok=True)
     traceback_file = f'{dir_for_traceback}/{data_id}{suffix}.txt'
     with open(traceback_file, 'a') as trace_f:
         trace_f.write(
@@ -529,31 +825,524 @@ def generate_traceback_file(store_name, data_id, time_range, var_list, region,
     return traceback_file_url
 
 
-def main():
-    store_name = 'cci-store'
-    test_mode = None
-    if len(sys.argv) >= 2:
-        store_name = sys.argv[1]
-    if len(sys.argv) == 3:
-        test_mode = sys.argv[2]
+# memory governor of this process, started with its first dataset
+_memory_governor = None
+
+
+def get_memory_governor(memory_limit):
+    global _memory_governor
+    if _memory_governor is None:
+        _memory_governor = MemoryGovernor(memory_limit)
+        _memory_governor.start()
+    return _memory_governor
+
+
+def _sweep_task(data_id, store_name, test_options, stage_timeouts=None,
+                chunk_cache=None, memory_limit=None, worker_id=None):
+    # runs inside a worker process of run_pool, results are written
+    # by the parent process
+    if chunk_cache is not None:
+        install_chunk_cache(chunk_cache)
+    memory_governor = get_memory_governor(memory_limit)
+    memory_governor.start_dataset()
+    journal = test_options.get('journal')
+    if journal is not None:
+        journal.start(data_id)
+    store = DATA_STORE_POOL.get_store(store_name)
+    lds = DATA_STORE_POOL.get_store('local')
+    ecv_name = get_ecv_name(data_id, store_name)
+    metrics = StageMetrics(data_id, ecv_name, worker_id, memory_governor)
+    local_namespace = test_options.get('local_namespace')
+    test_options = dict(test_options, local_namespace=f'worker{worker_id}'
+                        if local_namespace is None
+                        else f'{local_namespace}.worker{worker_id}')
+    summary_row = test_open_ds(data_id, store, lds, None, store_name,
+                               metrics=metrics, stage_timeouts=stage_timeouts,
+                               memory_governor=memory_governor,
+                               **test_options)
+    if chunk_cache is not None:
+        chunk_cache.flush()
+    return summary_row, metrics.rows, \
+        [memory_governor.get_memory_row(data_id, ecv_name)]
+
+
+def _failed_sweep_row(data_id, store_name, comment):
+    summary_row = {'ECV-Name': get_ecv_name(data_id, store_name),
+                   'Dataset-ID': data_id,
+                   'Dataset-Title': data_id,
+                   'supported': 'yes'}
+    _all_tests_no(summary_row, None, general_comment=comment)
+    return summary_row
+
+
+def write_result_row(result_store, summary_row, journal=None,
+                     metrics_csv=None, metrics_rows=(), memory_csv=None,
+                     memory_rows=()):
+    if metrics_csv is not None:
+        write_metrics_rows(metrics_csv, metrics_rows)
+    if memory_csv is not None:
+        write_metrics_rows(memory_csv, memory_rows, MEMORY_HEADER_ROW)
+    result_store.add_row(summary_row)
+    if journal is not None:
+        journal.finish(summary_row['Dataset-ID'], summary_row)
+
+
+def run_sequential_sweep(data_ids, store, lds, result_store, store_name,
+                         test_options=None, journal=None, metrics_csv=None,
+                         schedule=None, chunk_cache=None, memory_csv=None,
+                         memory_limit=None):
+    test_options = test_options or {}
+    if chunk_cache is not None:
+        install_chunk_cache(chunk_cache)
+    memory_governor = get_memory_governor(memory_limit)
+    for data_id in data_ids:
+        if journal is not None:
+            journal.start(data_id)
+        ecv_name = get_ecv_name(data_id, store_name)
+        metrics = StageMetrics(data_id, ecv_name,
+                               memory_governor=memory_governor)
+        memory_governor.start_dataset()
+        stage_timeouts = None
+        if schedule is not None:
+            stage_timeouts = schedule.get_stage_timeouts(data_id)
+        summary_row = test_open_ds(data_id, store, lds, None, store_name,
+                                   journal=journal, metrics=metrics,
+                                   stage_timeouts=stage_timeouts,
+                                   memory_governor=memory_governor,
+                                   **test_options)
+        if chunk_cache is not None:
+            chunk_cache.flush()
+        write_result_row(result_store, summary_row, journal,
+                         metrics_csv, metrics.rows, memory_csv,
+                         [memory_governor.get_memory_row(data_id, ecv_name)])
+
+
+def run_parallel_sweep(data_ids, result_store, store_name, workers,
+                       dataset_timeout=DATASET_TIMEOUT_TIME,
+                       test_options=None, journal=None, metrics_csv=None,
+                       worker_initializer=None, initargs=(), schedule=None,
+                       chunk_cache=None, memory_csv=None, memory_limit=None,
+                       host_memory_limit=None):
+    # Rows are stored in the order of data_ids as soon as all rows before
+    # them are done, so the CSV is identical to the one of a sequential run.
+    # With a schedule, datasets are handed out longest expected first.
+    data_ids = list(data_ids)
+    timeouts = [(dataset_timeout, '')] * len(data_ids)
+    order = None
+    stage_timeouts = [None] * len(data_ids)
+    if schedule is not None:
+        timeouts = [schedule.get_dataset_timeout(data_id)
+                    for data_id in data_ids]
+        order = schedule.order(data_ids, [get_ecv_name(data_id, store_name)
+                                          for data_id in data_ids])
+        stage_timeouts = [schedule.get_stage_timeouts(data_id)
+                          for data_id in data_ids]
+    finished_rows = {}
+    next_index = 0
+
+    def write_finished_rows():
+        nonlocal next_index
+        while next_index in finished_rows:
+            summary_row, metrics_rows, memory_rows = \
+                finished_rows.pop(next_index)
+            write_result_row(result_store, summary_row, journal,
+                             metrics_csv, metrics_rows, memory_csv,
+                             memory_rows)
+            next_index += 1
+
+    def on_result(index, result):
+        finished_rows[index] = result
+        write_finished_rows()
+
+    def on_failure(index, reason):
+        data_id = data_ids[index]
+        reason = reason.strip()
+        timeout, timeout_reason = timeouts[index]
+        if timeout_reason and reason.startswith('Time out'):
+            reason = f'{reason[:-1]}, timeout {timeout_reason}.'
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Testing {data_id} failed: {reason}')
+        memory_row = {'ECV-Name': get_ecv_name(data_id, store_name),
+                      'Dataset-ID': data_id,
+                      'memory_limit': memory_limit,
+                      'exceeded_stage':
+                          'host' if reason.startswith('Memory budget') else ''}
+        metrics_rows = []
+        if timeout and reason.startswith('Time out'):
+            # censored at the timeout, otherwise the schedule would keep
+            # the budget of a dataset which only failed fast so far
+            metrics_rows.append({'ECV-Name': get_ecv_name(data_id,
+                                                          store_name),
+                                 'Dataset-ID': data_id,
+                                 'stage': TIMED_OUT_STAGE,
+                                 'wall_time': timeout})
+        finished_rows[index] = (_failed_sweep_row(data_id, store_name,
+                                                  reason),
+                                metrics_rows, [memory_row])
+        write_finished_rows()
+
+    test_options = dict(test_options or {}, journal=journal)
+    run_pool([(data_id, store_name, test_options, stage_timeouts[index],
+               chunk_cache, memory_limit)
+              for index, data_id in enumerate(data_ids)],
+             _sweep_task,
+             workers,
+             [timeout for timeout, _ in timeouts],
+             on_result,
+             on_failure,
+             initializer=worker_initializer,
+             initargs=initargs,
+             order=order,
+             memory_limit=host_memory_limit)
+
+
+def sample_run(data_ids, store_name, test_mode, args, sample_json):
+    history = HistoryStore(args.history_db)
+    since = (date_today - timedelta(days=SAMPLE_HISTORY_DAYS)).isoformat()
+    schedule = load_schedule(history, test_mode or DEFAULT_MODE, store_name,
+                             DEFAULT_STAGE_TIMEOUTS, args.dataset_timeout)
+    failed_data_ids = set()
+    for mode in (test_mode or DEFAULT_MODE, get_sampled_mode(test_mode)):
+        failed_data_ids |= history.get_failed_data_ids(mode, store_name,
+                                                       since)
+    history.close()
+    seed = date_today if args.subset_seed is None else args.subset_seed
+    ecvs = [get_ecv_name(data_id, store_name) for data_id in data_ids]
+    sampled_data_ids, expected_seconds = sample_data_ids(
+        data_ids, ecvs, args.budget * 60, schedule, failed_data_ids,
+        args.workers, random.Random(f'{seed}:sample'))
+    sampled = set(sampled_data_ids)
+    datasets_per_ecv = {}
+    for data_id, ecv in zip(data_ids, ecvs):
+        counts = datasets_per_ecv.setdefault(ecv, {'sampled': 0, 'total': 0})
+        counts['total'] += 1
+        counts['sampled'] += data_id in sampled
+    # marks the run as sampled for generate_summary.py
+    write_json_atomically(sample_json,
+                          {'sampled': True,
+                           'budget_minutes': args.budget,
+                           'expected_minutes': round(expected_seconds
+                                                     / args.workers / 60, 1),
+                           'datasets': len(sampled_data_ids),
+                           'total': len(data_ids),
+                           'recently_failed': len(sampled & failed_data_ids),
+                           'ecvs': datasets_per_ecv})
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+          f'Sampled {len(sampled_data_ids)} of {len(data_ids)} datasets '
+          f'of {len(datasets_per_ecv)} ECVs for a budget of {args.budget} '
+          f'minutes, expected to take '
+          f'{expected_seconds / args.workers / 60:.1f} minutes.')
+    return sampled_data_ids
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Test opening, subsetting, caching and visualizing '
+                    'all datasets of a data store.')
+    parser.add_argument('store_name', nargs='?', default='cci-store',
+                        help='Name of the data store to be tested.')
+    parser.add_argument('test_mode', nargs='?', default=None,
+                        help='Test mode, e.g. "development", "stage" or '
+                             '"production". Results are written to a '
+                             'sub-directory of this name.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes testing datasets '
+                             'concurrently. Defaults to 1, which tests the '
+                             'datasets one by one in this process.')
+    parser.add_argument('--dataset-timeout', type=int,
+                        default=DATASET_TIMEOUT_TIME,
+                        help='Seconds after which a worker testing a single '
+                             'dataset is killed. Only used if --workers is '
+                             f'greater than 1. Defaults to '
+                             f'{DATASET_TIMEOUT_TIME}.')
+    parser.add_argument('--open-once', action='store_true',
+                        help='Open each dataset only once and derive the '
+                             'temporal and spatial subsets from that lazy '
+                             'handle by coordinate selection.')
+    parser.add_argument('--constraint-sample', type=int,
+                        default=CONSTRAINT_SAMPLE_PERCENTAGE,
+                        help='With --open-once, percentage of datasets for '
+                             'which the subsets are still opened through '
+                             'the store to verify its time range and region '
+                             f'constraints. Defaults to '
+                             f'{CONSTRAINT_SAMPLE_PERCENTAGE}.')
+    parser.add_argument('--processing-memory-limit', type=int,
+                        default=PROCESSING_MEMORY_LIMIT // (1024 * 1024),
+                        help='Maximum number of megabytes held in memory '
+                             'while reading a variable block by block for '
+                             'the processing check. Defaults to '
+                             f'{PROCESSING_MEMORY_LIMIT // (1024 * 1024)}.')
+    parser.add_argument('--dataset-memory-limit', type=int,
+                        default=DATASET_MEMORY_LIMIT,
+                        help='Megabytes of resident memory the process '
+                             'testing a dataset may use. The processing or '
+                             'cache check exceeding it fails with "memory '
+                             'budget exceeded" and the run goes on. 0 for no '
+                             f'limit. Defaults to {DATASET_MEMORY_LIMIT}.')
+    parser.add_argument('--host-memory-limit', type=int, default=None,
+                        help='Megabytes of memory in use on the host above '
+                             'which the worker using the most memory is '
+                             'killed and its dataset fails. Only used if '
+                             '--workers is greater than 1. 0 for no limit. '
+                             f'Defaults to {HOST_MEMORY_SHARE:.0%} of the '
+                             'physical memory.')
+    parser.add_argument('--no-metadata-cache', action='store_true',
+                        help='Always ask the store for data types and '
+                             'descriptors instead of using the on-disk '
+                             'metadata cache.')
+    parser.add_argument('--refresh-metadata', action='store_true',
+                        help='Fetch data types and descriptors from the '
+                             'store again and update the metadata cache.')
+    parser.add_argument('--metadata-cache-dir', default=METADATA_CACHE_DIR,
+                        help='Directory of the metadata cache. Defaults to '
+                             f'{METADATA_CACHE_DIR}.')
+    parser.add_argument('--metadata-ttl', type=float,
+                        default=METADATA_CACHE_TTL / 3600,
+                        help='Hours after which cached metadata is fetched '
+                             'again, even if the catalog of the store did '
+                             'not change. Defaults to '
+                             f'{METADATA_CACHE_TTL / 3600:.0f}.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run of today: '
+                             'datasets finished according to the run journal '
+                             'are skipped, the stored results are rebuilt '
+                             'from the journal.')
+    parser.add_argument('--subset-seed', type=int, default=None,
+                        help='Seed of the random choice of the time range '
+                             'and region of the subsets. Defaults to the '
+                             'date of today.')
+    parser.add_argument('--cache-target', choices=CACHE_TARGETS,
+                        default=CACHE_TARGET_REMOTE,
+                        help='Target of the cache check. "remote" caches '
+                             'the subset with open_dataset(..., '
+                             'force_local=True), which fetches it again. '
+                             '"memory", "tmpfs" and "local" write the subset '
+                             'read for processing to an in-memory zarr '
+                             'store, a zarr in /dev/shm or the local data '
+                             'store and verify it by reopening it.')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='Minutes the run may take. Instead of all '
+                             'datasets, a sample stratified by ECV which is '
+                             'expected to finish within the budget is '
+                             'tested, favoring datasets which failed '
+                             f'within the last {SAMPLE_HISTORY_DAYS} days '
+                             'and fast ones. Results are written to the '
+                             f'sub-directory "{SAMPLED_DIR}".')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Test only datasets whose descriptor or store '
+                             'version changed, which failed last time or '
+                             'whose last test is older than '
+                             '--max-result-age days. The last results of '
+                             'all other datasets are carried over.')
+    parser.add_argument('--max-result-age', type=int,
+                        default=MAX_RESULT_AGE_DAYS,
+                        help='Days after which an incremental run tests a '
+                             'dataset again, even if it did not change. '
+                             f'Defaults to {MAX_RESULT_AGE_DAYS}.')
+    parser.add_argument('--fingerprint-db', default=FINGERPRINT_DB,
+                        help='Database with the fingerprints and last '
+                             'results of the datasets for incremental runs. '
+                             f'Defaults to {FINGERPRINT_DB}.')
+    parser.add_argument('--no-chunk-cache', action='store_true',
+                        help='Read every chunk from the remote store instead '
+                             'of the chunk cache shared by all runs.')
+    parser.add_argument('--chunk-cache-dir', default=CHUNK_CACHE_DIR,
+                        help='Directory of the chunk cache. Defaults to '
+                             f'{CHUNK_CACHE_DIR}.')
+    parser.add_argument('--chunk-cache-size', type=float,
+                        default=CHUNK_CACHE_MAX_SIZE / 1024 ** 3,
+                        help='Gigabytes the chunk cache may occupy. Defaults '
+                             f'to {CHUNK_CACHE_MAX_SIZE / 1024 ** 3:.0f}.')
+    parser.add_argument('--history-db', default=HISTORY_DB,
+                        help='Database with the history of earlier runs, '
+                             'see history_store.py. Defaults to '
+                             f'{HISTORY_DB}.')
+    parser.add_argument('--fixed-timeouts', action='store_true',
+                        help='Use the default timeouts for every dataset '
+                             'and keep the order of the store instead of '
+                             'scheduling from the history of earlier runs.')
+    args = parser.parse_args(args)
+    store_name = args.store_name
+    test_mode = args.test_mode
 
     results_dir = f'{store_name}'
     if test_mode:
         results_dir = f'{test_mode}/{store_name}'
+    if args.budget is not None:
+        # kept apart, so the results of the full sweep of the day stay
+        results_dir = f'{results_dir}/{SAMPLED_DIR}'
 
     if not os.path.exists(results_dir):
-        os.mkdir(results_dir)
+        os.makedirs(results_dir)
     support_file_name = f'{date_today}_test_{store_name}_data_support'
-    results_csv = f'{store_name}/{support_file_name}.csv'
-    if test_mode:
-        results_csv = f'{results_dir}/{support_file_name}.csv'
+    results_csv = f'{results_dir}/{support_file_name}.csv'
     store = DATA_STORE_POOL.get_store(store_name)
-    data_ids = store.get_data_ids()
+    data_ids = list(store.get_data_ids())
     lds = DATA_STORE_POOL.get_store('local')
+    catalog = get_catalog_fingerprint(data_ids)
+
+    metadata_cache = None
+    if not args.no_metadata_cache:
+        metadata_cache = MetadataCache(args.metadata_cache_dir,
+                                       ttl=args.metadata_ttl * 3600,
+                                       refresh=args.refresh_metadata)
+        # cached metadata is used as long as the catalog is unchanged
+        metadata_cache.set_catalog(store_name, data_ids)
+
+    if args.budget is not None:
+        data_ids = sample_run(data_ids, store_name, test_mode, args,
+                              f'{results_dir}/{support_file_name}'
+                              f'_sample.json')
+
+    metrics_csv = f'{results_dir}/{support_file_name}_metrics.csv'
+    memory_csv = f'{results_dir}/{support_file_name}_memory.csv'
+    result_store = ResultStore(f'{results_dir}/{support_file_name}.sqlite')
+    journal = RunJournal(f'{results_dir}/{support_file_name}_journal.jsonl')
+    finished_rows = {}
+    if args.resume:
+        finished_rows = journal.get_finished_rows()
+        for data_id in journal.get_in_flight():
+            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                  f'Testing {data_id} was interrupted, testing it again.')
+        # drops rows of interrupted datasets
+        result_store.replace_rows(finished_rows.values())
+        if os.path.isfile(metrics_csv):
+            write_csv_atomically(metrics_csv, METRICS_HEADER_ROW,
+                                 [row for row in
+                                  read_metrics_rows(metrics_csv)
+                                  if row['Dataset-ID'] in finished_rows])
+        if os.path.isfile(memory_csv):
+            write_csv_atomically(memory_csv, MEMORY_HEADER_ROW,
+                                 [row for row in read_metrics_rows(memory_csv)
+                                  if row['Dataset-ID'] in finished_rows])
+        data_ids = [data_id for data_id in data_ids
+                    if data_id not in finished_rows]
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Resuming run, {len(finished_rows)} datasets are done, '
+              f'{len(data_ids)} remain.')
+    else:
+        journal.clear()
+        result_store.clear()
+        for csv_path in (metrics_csv, memory_csv):
+            if os.path.isfile(csv_path):
+                os.remove(csv_path)
+    journal.start_run(store_name, test_mode,
+                      len(finished_rows) + len(data_ids), len(finished_rows))
+
+    fingerprint_store = None
+    fingerprint_mode = test_mode or DEFAULT_MODE
+    if args.budget is not None:
+        fingerprint_mode = get_sampled_mode(test_mode)
+    carried_over_json = \
+        f'{results_dir}/{support_file_name}_carried_over.json'
+    if args.incremental:
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Describing {len(data_ids)} datasets to find changed ones.')
+        fingerprint_store = FingerprintStore(args.fingerprint_db)
+        data_ids, carried_rows, tested_dates, fingerprints = \
+            plan_incremental_sweep(data_ids, store, store_name,
+                                   fingerprint_mode, fingerprint_store,
+                                   date_today, args.max_result_age,
+                                   metadata_cache)
+        carried_over = {}
+        if args.resume and os.path.isfile(carried_over_json):
+            with open(carried_over_json) as f:
+                carried_over = json.load(f)
+        carried_over.update(tested_dates)
+        # date of the test of every carried over dataset, for
+        # generate_summary.py
+        write_json_atomically(carried_over_json, carried_over)
+        for row in carried_rows.values():
+            write_result_row(result_store, row, journal)
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Carried over the results of {len(carried_rows)} unchanged '
+              f'datasets, testing {len(data_ids)}.')
+    elif not args.resume and os.path.isfile(carried_over_json):
+        os.remove(carried_over_json)
+
+    test_options = dict(open_once=args.open_once,
+                        constraint_sample=args.constraint_sample,
+                        processing_memory_limit=
+                        args.processing_memory_limit * 1024 * 1024,
+                        metadata_cache=metadata_cache,
+                        subset_seed=args.subset_seed,
+                        cache_target=args.cache_target,
+                        # runs of several modes share the local store
+                        local_namespace=test_mode or DEFAULT_MODE)
+
+    schedule = None
+    if not args.fixed_timeouts:
+        history = HistoryStore(args.history_db)
+        schedule = load_schedule(history, test_mode or DEFAULT_MODE,
+                                 store_name, DEFAULT_STAGE_TIMEOUTS,
+                                 args.dataset_timeout)
+        history.close()
+        schedule_csv = f'{results_dir}/{support_file_name}_schedule.csv'
+        write_schedule_report(schedule_csv, schedule, data_ids)
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Timeouts adjusted from the history of earlier runs are '
+              f'listed in {schedule_csv}.')
+
+    chunk_cache = None
+    if not args.no_chunk_cache:
+        chunk_cache = ChunkCache(args.chunk_cache_dir,
+                                 max_size=int(args.chunk_cache_size
+                                              * 1024 ** 3),
+                                 run_id=f'{test_mode or DEFAULT_MODE}/'
+                                        f'{store_name}/{date_today}',
+                                 catalog=catalog)
+        if not args.resume:
+            chunk_cache.reset_counters()
+
+    memory_limit = args.dataset_memory_limit * 1024 * 1024 or None
+    host_memory_limit = get_host_memory_limit() \
+        if args.host_memory_limit is None \
+        else args.host_memory_limit * 1024 * 1024 or None
 
     start_time = datetime.now()
-    for i, data_id in enumerate(data_ids):
-        test_open_ds(data_id, store, lds, results_csv, store_name)
+    if args.workers > 1:
+        run_parallel_sweep(data_ids, result_store, store_name, args.workers,
+                           dataset_timeout=args.dataset_timeout,
+                           test_options=test_options, journal=journal,
+                           metrics_csv=metrics_csv, schedule=schedule,
+                           chunk_cache=chunk_cache, memory_csv=memory_csv,
+                           memory_limit=memory_limit,
+                           host_memory_limit=host_memory_limit)
+    else:
+        run_sequential_sweep(data_ids, store, lds, result_store, store_name,
+                             test_options=test_options, journal=journal,
+                             metrics_csv=metrics_csv, schedule=schedule,
+                             chunk_cache=chunk_cache, memory_csv=memory_csv,
+                             memory_limit=memory_limit)
+    if fingerprint_store is not None:
+        tested = set(data_ids)
+        fingerprint_store.put_many(
+            fingerprint_mode, store_name,
+            [(row['Dataset-ID'], fingerprints.get(row['Dataset-ID']),
+              date_today.isoformat(), row)
+             for row in result_store.get_rows()
+             if row['Dataset-ID'] in tested])
+        fingerprint_store.close()
+    result_store.export_csv(results_csv, header_row)
+    result_store.close()
+    if os.path.isfile(metrics_csv):
+        trace_json = f'{results_dir}/{support_file_name}_trace.json'
+        write_trace(trace_json, [metrics_csv],
+                    [f'{test_mode or DEFAULT_MODE}/{store_name}'])
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Timeline of the run written to {trace_json}.')
+    if chunk_cache is not None:
+        counters = chunk_cache.get_counters()
+        chunk_cache.close()
+        write_json_atomically(
+            f'{results_dir}/{support_file_name}_chunk_cache.json', counters)
+        hit_rate = 'n/a' if counters['hit_rate'] is None \
+            else f'{counters["hit_rate"]:.1%}'
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Chunk cache: {counters["hits"]} hits, '
+              f'{counters["misses"]} misses ({hit_rate} hit rate), '
+              f'{counters["bytes_saved"] / 1024 ** 2:.1f} MB saved, '
+              f'{counters["bytes_fetched"] / 1024 ** 2:.1f} MB fetched.')
 
     print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
           f'Test run finished on {date_today}.')
@@ -0,0 +1,82 @@
+import random
+
+from sampler import UNKNOWN_DATASET_SECONDS
+from sampler import sample_data_ids
+from scheduler import SweepSchedule
+
+
+def new_schedule(expected_seconds):
+    """Schedule with one run of every dataset of {data_id: (ecv, seconds)}"""
+    timings = [(data_id, ecv, '2026-10-01', 'open', seconds)
+               for data_id, (ecv, seconds) in expected_seconds.items()]
+    return SweepSchedule(timings, {}, None)
+
+
+def test_budget_cutoff():
+    sampled, expected = sample_data_ids(
+        ['a', 'b', 'c', 'd'], ['SST'] * 4, 2.5 * UNKNOWN_DATASET_SECONDS,
+        rng=random.Random(0))
+    assert len(sampled) == 2
+    assert expected == 2 * UNKNOWN_DATASET_SECONDS
+
+
+def test_budget_is_shared_by_workers():
+    data_ids = ['a', 'b', 'c', 'd']
+    sampled, expected = sample_data_ids(
+        data_ids, ['SST'] * 4, 2 * UNKNOWN_DATASET_SECONDS, workers=2,
+        rng=random.Random(0))
+    assert sampled == data_ids
+    assert expected == 4 * UNKNOWN_DATASET_SECONDS
+
+
+def test_nothing_fits():
+    assert sample_data_ids(['a', 'b'], ['SST', 'CLOUD'],
+                           UNKNOWN_DATASET_SECONDS - 1) == ([], 0)
+
+
+def test_ecvs_take_turns():
+    data_ids = ['sst-1', 'sst-2', 'sst-3', 'cloud-1', 'ozone-1']
+    ecvs = ['SST', 'SST', 'SST', 'CLOUD', 'OZONE']
+    for seed in range(10):
+        sampled, _ = sample_data_ids(data_ids, ecvs,
+                                     3 * UNKNOWN_DATASET_SECONDS,
+                                     rng=random.Random(seed))
+        assert sorted(ecvs[data_ids.index(data_id)]
+                      for data_id in sampled) == ['CLOUD', 'OZONE', 'SST']
+
+
+def test_recently_failed_and_fastest_first():
+    schedule = new_schedule({'slow': ('SST', 100), 'fast': ('SST', 10),
+                             'failed': ('SST', 200)})
+    sampled, expected = sample_data_ids(
+        ['slow', 'fast', 'failed'], ['SST'] * 3, 210, schedule=schedule,
+        failed_data_ids={'failed'}, rng=random.Random(0))
+    assert sampled == ['fast', 'failed']
+    assert expected == 210
+
+
+def test_unknown_dataset_expected_like_its_ecv():
+    schedule = new_schedule({'sst-1': ('SST', 10), 'sst-2': ('SST', 30)})
+    sampled, expected = sample_data_ids(
+        ['sst-1', 'sst-new'], ['SST', 'SST'], 30, schedule=schedule,
+        rng=random.Random(0))
+    assert sampled == ['sst-1', 'sst-new']
+    assert expected == 30
+
+
+def test_dataset_which_does_not_fit_dropped():
+    schedule = new_schedule({'sst-1': ('SST', 50), 'sst-2': ('SST', 60),
+                             'cloud-1': ('CLOUD', 40)})
+    sampled, expected = sample_data_ids(
+        ['sst-1', 'sst-2', 'cloud-1'], ['SST', 'SST', 'CLOUD'], 100,
+        schedule=schedule, rng=random.Random(0))
+    assert sampled == ['sst-1', 'cloud-1']
+    assert expected == 90
+
+
+def test_reproducible_for_a_seed():
+    data_ids = [f'ds-{i}' for i in range(20)]
+    ecvs = [f'ECV-{i % 5}' for i in range(20)]
+    budget = 7 * UNKNOWN_DATASET_SECONDS
+    assert sample_data_ids(data_ids, ecvs, budget, rng=random.Random(42)) \
+        == sample_data_ids(data_ids, ecvs, budget, rng=random.Random(42))
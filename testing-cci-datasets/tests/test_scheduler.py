@@ -0,0 +1,106 @@
+from scheduler import MAX_DATASET_TIMEOUT
+from scheduler import MAX_STAGE_TIMEOUT
+from scheduler import MIN_DATASET_TIMEOUT
+from scheduler import MIN_RUNS
+from scheduler import MIN_STAGE_TIMEOUT
+from scheduler import TIMED_OUT_STAGE
+from scheduler import SweepSchedule
+
+DEFAULT_STAGE_TIMEOUTS = {'open': 60, 'open_temp': 60, 'open_bbox': 60,
+                          'processing': 60, 'visualization': 60,
+                          'write': None}
+DEFAULT_DATASET_TIMEOUT = 600
+
+
+def get_timings(data_id, ecv, stage, wall_times):
+    return [(data_id, ecv, f'2026-10-{day:02d}', stage, wall_time)
+            for day, wall_time in enumerate(wall_times, 1)]
+
+
+def new_schedule(timings):
+    return SweepSchedule(timings, DEFAULT_STAGE_TIMEOUTS,
+                         DEFAULT_DATASET_TIMEOUT)
+
+
+def test_default_timeout_below_min_runs():
+    schedule = new_schedule(
+        get_timings('ds', 'SST', 'open', [1] * (MIN_RUNS - 1)))
+    assert schedule.get_stage_timeouts('ds')['open'] == (60, '')
+    assert schedule.get_dataset_timeout('ds') == (DEFAULT_DATASET_TIMEOUT, '')
+
+
+def test_timeout_from_min_runs_on():
+    schedule = new_schedule(
+        get_timings('ds', 'SST', 'open', [10] * MIN_RUNS))
+    timeout, reason = schedule.get_stage_timeouts('ds')['open']
+    assert timeout == 30
+    assert reason.startswith('cut short from 60 s to 30 s')
+
+
+def test_timeout_equal_to_default_has_no_reason():
+    schedule = new_schedule(
+        get_timings('ds', 'SST', 'open', [20] * MIN_RUNS))
+    assert schedule.get_stage_timeouts('ds')['open'] == (60, '')
+
+
+def test_stage_timeout_clamped():
+    schedule = new_schedule(
+        get_timings('fast', 'SST', 'open', [1] * MIN_RUNS)
+        + get_timings('slow', 'SST', 'open', [1000] * MIN_RUNS))
+    assert schedule.get_stage_timeouts('fast')['open'][0] == MIN_STAGE_TIMEOUT
+    timeout, reason = schedule.get_stage_timeouts('slow')['open']
+    assert timeout == MAX_STAGE_TIMEOUT
+    assert f'capped at {MAX_STAGE_TIMEOUT} s' in reason
+
+
+def test_dataset_timeout_clamped():
+    schedule = new_schedule(
+        get_timings('fast', 'SST', 'open', [1] * MIN_RUNS)
+        + get_timings('slow', 'SST', 'open', [2000] * MIN_RUNS))
+    assert schedule.get_dataset_timeout('fast')[0] == MIN_DATASET_TIMEOUT
+    assert schedule.get_dataset_timeout('slow')[0] == MAX_DATASET_TIMEOUT
+
+
+def test_stage_without_default_is_limited():
+    schedule = new_schedule(
+        get_timings('ds', 'SST', 'write', [100] * MIN_RUNS))
+    timeout, reason = schedule.get_stage_timeouts('ds')['write']
+    assert timeout == 300
+    assert reason.startswith('limited to 300 s')
+
+
+def test_traceback_left_out_of_dataset_total():
+    schedule = new_schedule(
+        get_timings('ds', 'SST', 'open', [4, 6, 5])
+        + get_timings('ds', 'SST', 'traceback', [100, 100, 100]))
+    assert schedule.get_expected_seconds('ds') == 5
+
+
+def test_order_falls_back_to_ecv_median():
+    schedule = new_schedule(
+        get_timings('sst-1', 'SST', 'open', [10])
+        + get_timings('sst-2', 'SST', 'open', [30])
+        + get_timings('sst-3', 'SST', 'open', [50])
+        + get_timings('cloud-1', 'CLOUD', 'open', [40]))
+    data_ids = ['sst-1', 'sst-new', 'cloud-1', 'other-new', 'sst-3']
+    ecvs = ['SST', 'SST', 'CLOUD', 'OZONE', 'SST']
+    assert schedule.get_expected_seconds('sst-new', 'SST') == 30
+    assert schedule.get_expected_seconds('other-new', 'OZONE') is None
+    # unknown ECV first, then the longest expected
+    assert [data_ids[i] for i in schedule.order(data_ids, ecvs)] == \
+        ['other-new', 'sst-3', 'cloud-1', 'sst-new', 'sst-1']
+
+
+def test_order_keeps_datasets_without_expectation_in_place():
+    assert new_schedule([]).order(['a', 'b', 'c']) == [0, 1, 2]
+
+
+def test_timed_out_run_extends_cut_budget():
+    timings = get_timings('ds', 'SST', 'open', [1] * MIN_RUNS)
+    schedule = new_schedule(timings)
+    assert schedule.get_dataset_timeout('ds')[0] == MIN_DATASET_TIMEOUT
+    # killed at the timeout, its stages are lost with the worker
+    schedule = new_schedule(
+        timings + [('ds', 'SST', '2026-10-30', TIMED_OUT_STAGE,
+                    MIN_DATASET_TIMEOUT)])
+    assert schedule.get_dataset_timeout('ds')[0] > MIN_DATASET_TIMEOUT
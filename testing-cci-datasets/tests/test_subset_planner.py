@@ -0,0 +1,39 @@
+import random
+
+from subset_planner import pick_window
+
+
+def test_window_inside_one_chunk_with_margin():
+    boundaries = [0, 10, 20, 25]
+    chunks = list(zip(boundaries, boundaries[1:]))
+    for seed in range(50):
+        start, end = pick_window(boundaries, 3, 1, random.Random(seed))
+        assert end - start == 3
+        assert any(chunk_start + 1 <= start and end <= chunk_end - 1
+                   for chunk_start, chunk_end in chunks)
+
+
+def test_chunks_without_room_for_margin_skipped():
+    # only the chunk from 3 to 8 fits 2 cells with a margin of 1
+    for seed in range(20):
+        start, end = pick_window([0, 3, 8, 10], 2, 1, random.Random(seed))
+        assert 4 <= start and end <= 7
+
+
+def test_empty_chunks_ignored():
+    assert pick_window([0, 0, 4, 4], 2, 1, random.Random(0)) == (1, 3)
+
+
+def test_window_larger_than_a_chunk_cut_to_largest():
+    for seed in range(10):
+        assert pick_window([0, 2, 5, 6], 10, 1, random.Random(seed)) == (2, 5)
+
+
+def test_margin_dropped_if_no_chunk_fits():
+    assert pick_window([0, 3], 3, 1, random.Random(0)) == (0, 3)
+
+
+def test_reproducible_for_a_seed():
+    boundaries = list(range(0, 1000, 50))
+    assert pick_window(boundaries, 3, 1, random.Random(7)) == \
+        pick_window(boundaries, 3, 1, random.Random(7))
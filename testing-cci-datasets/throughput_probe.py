@@ -0,0 +1,387 @@
+"""
+Read throughput of the datasets served by both cci-store and cci-zarr-store.
+
+The sweeps only tell whether a dataset can be read through a store, not how
+fast. This probe pairs the datasets of the two stores, reads the same subset
+of every pair from both stores and records for each store:
+
+* the seconds it takes to open the dataset,
+* the time to first byte, the seconds until the first chunk is read,
+* the number of chunks and bytes read, the seconds and the throughput in MB/s.
+
+The ids of the stores follow different conventions, e.g.
+esacci.SEALEVEL.mon.L4.MSLA.multi-sensor.multi-platform.MERGED.2-0.r1 and
+ESACCI-SEALEVEL-L4-MSLA-MERGED-1993-2015-fv02.zarr. Datasets are paired by
+the words of their ids, ignoring years and versions, within the same ECV.
+Pairs which are not found that way are given with --pairs-csv.
+
+The subset is the same for both stores and from night to night: the first
+time steps where the time ranges of both datasets overlap and a square of
+cells in the center of their common region, of the first variable both
+datasets have. The stores are read one after the other, which one first
+alternates from pair to pair. The chunk cache of the sweeps is not used.
+
+The rows are written to {date}_store_throughput.csv in the directory of the
+test mode. generate_summary.py compares the stores per ECV.
+
+Usage, from the testing-cci-datasets directory:
+
+    python throughput_probe.py production
+"""
+import argparse
+import csv
+import math
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from cate.core import DATA_STORE_POOL
+from cate.ops.io import open_dataset
+
+from chunk_reduction import ChunkReadError
+from chunk_reduction import stream_reduce
+from instrumentation import write_metrics_rows
+from subset_planner import format_time
+from subset_planner import get_spatial_names
+from subset_planner import get_time_name
+from test_cci_data_support import PROCESSING_MEMORY_LIMIT
+from test_cci_data_support import TIMEOUT_TIME
+from test_cci_data_support import TimeOutException
+from test_cci_data_support import check_for_support
+from test_cci_data_support import derive_subset
+from test_cci_data_support import get_ecv_name
+from test_cci_data_support import stage_alarm
+
+CCI_STORE = 'cci-store'
+CCI_ZARR_STORE = 'cci-zarr-store'
+PROBED_STORES = [CCI_STORE, CCI_ZARR_STORE]
+
+THROUGHPUT_HEADER_ROW = ['ECV-Name', 'pair', 'store', 'Dataset-ID',
+                         'variable', 'time_range', 'region', 'shape',
+                         'open_seconds', 'time_to_first_byte', 'chunks',
+                         'bytes_read', 'seconds', 'throughput', 'comment']
+
+# number of time steps and of cells along x and y of the subset
+SUBSET_TIME_STEPS = 4
+SUBSET_CELLS = 256
+# share of the words of a cci-store id which must be found in the
+# cci-zarr-store id of its pair
+MIN_PAIR_SCORE = 0.75
+
+date_today = datetime.date(datetime.now())
+
+# words of the ids which do not tell products apart, cci-zarr-store ids
+# mostly leave out the time period and platform
+_IGNORED_WORDS = {'ESACCI', 'ZARR', 'R1', 'MULTI', 'SENSOR', 'PLATFORM',
+                  'UNSPECIFIED', 'SATELLITE', 'ORBIT', 'FREQUENCY',
+                  'CLIMATOLOGY', 'DAY', 'MON', 'MONTHLY', 'YR'}
+# words spelled differently in cci-zarr-store ids
+_WORD_ALIASES = {'GHRSST': 'SST', 'GEOGRAPHIC': 'GEO'}
+
+
+def get_words(data_id):
+    words = set()
+    for word in re.split(r'[-._()\s]+', data_id.upper()):
+        # years and versions
+        if not word or re.fullmatch(r'(F?V)?\d+', word):
+            continue
+        if word not in _IGNORED_WORDS:
+            words.add(_WORD_ALIASES.get(word, word))
+    return words
+
+
+def get_version(data_id):
+    """Version of a data id as a tuple of numbers without trailing zeros"""
+    if data_id.endswith('.zarr'):
+        match = re.search(r'-f?v([\d.]+)\.zarr$', data_id)
+        version = match.group(1) if match else ''
+    else:
+        version = data_id.split('.')[-2]
+    numbers = [int(number) for number in re.findall(r'\d+', version)]
+    while numbers and numbers[-1] == 0:
+        numbers.pop()
+    return tuple(numbers)
+
+
+def pair_data_ids(cci_data_ids, zarr_data_ids, min_score=MIN_PAIR_SCORE):
+    """
+    Pairs of a cci-store and a cci-zarr-store data id of the same product.
+
+    :return: list of (cci-store id, cci-zarr-store id, score), the score is
+        the share of the words of the cci-store id found in the
+        cci-zarr-store id, which names its product in more detail
+    """
+    candidates = []
+    cci_words = {data_id: get_words(data_id) for data_id in cci_data_ids
+                 if check_for_support(data_id)[0]}
+    for zarr_data_id in zarr_data_ids:
+        zarr_words = get_words(zarr_data_id)
+        for cci_data_id, words in cci_words.items():
+            ecv_name = get_ecv_name(cci_data_id, CCI_STORE).upper()
+            if ecv_name not in zarr_words:
+                continue
+            score = len(words & zarr_words) / len(words)
+            if score >= min_score:
+                # ties go to the id with the fewest other words, then to
+                # the same version, then to the latest id
+                candidates.append((score,
+                                   len(words & zarr_words)
+                                   / len(words | zarr_words),
+                                   get_version(cci_data_id)
+                                   == get_version(zarr_data_id),
+                                   cci_data_id, zarr_data_id))
+    pairs = []
+    paired = set()
+    for score, _, _, cci_data_id, zarr_data_id in sorted(candidates,
+                                                         reverse=True):
+        if cci_data_id in paired or zarr_data_id in paired:
+            continue
+        paired.update((cci_data_id, zarr_data_id))
+        pairs.append((cci_data_id, zarr_data_id, score))
+    return sorted(pairs)
+
+
+def read_pairs_csv(pairs_csv):
+    with open(pairs_csv, newline='') as f:
+        return [(row[CCI_STORE], row[CCI_ZARR_STORE], 1.0)
+                for row in csv.DictReader(f)]
+
+
+def get_common_variable(reference, other):
+    """First variable of *reference* which *other* has as well, with at
+    least two dimensions in both"""
+    for var_name in reference.data_vars:
+        if var_name in other.data_vars and reference[var_name].ndim >= 2 \
+                and other[var_name].ndim >= 2:
+            return var_name
+    raise ValueError(f'No common variable in {list(reference.data_vars)} '
+                     f'and {list(other.data_vars)}.')
+
+
+def _get_common_values(reference, other, name):
+    # values of a coordinate of reference within the range of other
+    values = reference[name].values
+    other_values = other[name].values
+    try:
+        values = values[(values >= other_values.min())
+                        & (values <= other_values.max())]
+    except TypeError:
+        raise ValueError(f'Coordinates {name} of the stores cannot be '
+                         f'compared.')
+    if len(values) == 0:
+        raise ValueError(f'Coordinates {name} of the stores do not '
+                         f'overlap.')
+    return np.sort(values)
+
+
+def plan_probe_subset(reference, other, time_steps=SUBSET_TIME_STEPS,
+                      cells=SUBSET_CELLS):
+    """
+    Time range and region of the subset read from both datasets of a pair:
+    the first *time_steps* time steps of *reference* within the time range
+    of *other* and *cells* x *cells* cells in the center of the common
+    region. Either is None if *reference* lacks the coordinates.
+
+    :raise ValueError: if the coordinates of the datasets do not overlap
+    """
+    time_range = None
+    time_name = get_time_name(reference)
+    if time_name is not None:
+        if get_time_name(other) != time_name:
+            raise ValueError(f'Only one store has the time coordinate '
+                             f'{time_name}.')
+        times = _get_common_values(reference, other, time_name)
+        time_range = format_time(times[0]), \
+            format_time(times[min(time_steps, len(times)) - 1])
+    try:
+        spatial_names = get_spatial_names(reference)
+    except ValueError:
+        return time_range, None
+    try:
+        other_spatial_names = get_spatial_names(other)
+    except ValueError:
+        other_spatial_names = None
+    if other_spatial_names != spatial_names:
+        raise ValueError(f'The stores have different spatial coordinates, '
+                         f'{spatial_names} and {other_spatial_names}.')
+    corners = []
+    for name in spatial_names:
+        values = _get_common_values(reference, other, name)
+        start = max(0, (len(values) - cells) // 2)
+        window = values[start:start + cells]
+        corners.append((float(window[0]), float(window[-1])))
+    # rounded outwards, so the region keeps the selected cells
+    (x_min, x_max), (y_min, y_max) = \
+        [(math.floor(low * 1e5) / 1e5, math.ceil(high * 1e5) / 1e5)
+         for low, high in corners]
+    return time_range, [x_min, y_min, x_max, y_max]
+
+
+def _read_subset(dataset, var_name, time_range, region, memory_limit,
+                 timeout, row):
+    try:
+        with stage_alarm(timeout):
+            subset = derive_subset(dataset[[var_name]], time_range, region)
+            stats = stream_reduce(subset[var_name], memory_limit,
+                                  pass_through=(TimeOutException,))
+    except TimeOutException as e:
+        row['comment'] = str(e)
+        return
+    except ChunkReadError as e:
+        row['comment'] = f'Failed reading chunk {e.block_index} of ' \
+                         f'dataset[{var_name}]: {e.cause!r}'
+        return
+    except Exception:
+        row['comment'] = f'Failed reading subset of dataset[{var_name}]: ' \
+                         f'{sys.exc_info()[:2]}'
+        return
+    row['shape'] = 'x'.join(str(size) for size in subset[var_name].shape)
+    row['time_to_first_byte'] = round(stats['first_chunk_seconds'], 3) \
+        if stats['first_chunk_seconds'] is not None else ''
+    row['chunks'] = stats['chunks']
+    row['bytes_read'] = stats['bytes_read']
+    row['seconds'] = round(stats['seconds'], 3)
+    row['throughput'] = round(stats['throughput'], 3)
+
+
+def probe_pair(cci_data_id, zarr_data_id, time_steps=SUBSET_TIME_STEPS,
+               cells=SUBSET_CELLS, memory_limit=PROCESSING_MEMORY_LIMIT,
+               timeout=TIMEOUT_TIME, zarr_first=False):
+    """
+    Open the datasets of a pair and read the same subset from both.
+
+    :param zarr_first: read from cci-zarr-store first
+    :return: the rows of cci-store and cci-zarr-store
+    """
+    ecv_name = get_ecv_name(cci_data_id, CCI_STORE)
+    data_ids = {CCI_STORE: cci_data_id, CCI_ZARR_STORE: zarr_data_id}
+    rows = {store_name: {'ECV-Name': ecv_name,
+                         'pair': cci_data_id,
+                         'store': store_name,
+                         'Dataset-ID': data_id}
+            for store_name, data_id in data_ids.items()}
+    order = PROBED_STORES[::-1] if zarr_first else PROBED_STORES
+    datasets = {}
+    for store_name in order:
+        row = rows[store_name]
+        start = time.perf_counter()
+        try:
+            with stage_alarm(timeout):
+                datasets[store_name] = open_dataset(
+                    ds_id=data_ids[store_name], data_store_id=store_name,
+                    force_local=False)
+        except TimeOutException as e:
+            row['comment'] = str(e)
+            continue
+        except Exception:
+            row['comment'] = f'Failed opening dataset: {sys.exc_info()[:2]}'
+            continue
+        row['open_seconds'] = round(time.perf_counter() - start, 3)
+
+    if len(datasets) < len(PROBED_STORES):
+        for row in rows.values():
+            row.setdefault('comment', 'Not read, the dataset of the other '
+                                      'store could not be opened.')
+    else:
+        try:
+            var_name = get_common_variable(datasets[CCI_STORE],
+                                           datasets[CCI_ZARR_STORE])
+            time_range, region = plan_probe_subset(datasets[CCI_STORE],
+                                                   datasets[CCI_ZARR_STORE],
+                                                   time_steps, cells)
+        except ValueError as e:
+            for row in rows.values():
+                row['comment'] = str(e)
+        else:
+            for store_name in order:
+                row = rows[store_name]
+                row['variable'] = var_name
+                row['time_range'] = ' '.join(time_range or ())
+                row['region'] = ' '.join(str(value)
+                                         for value in region or ())
+                _read_subset(datasets[store_name], var_name, time_range,
+                             region, memory_limit, timeout, row)
+    for dataset in datasets.values():
+        dataset.close()
+    return [rows[store_name] for store_name in PROBED_STORES]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Compare the read throughput of cci-store and '
+                    'cci-zarr-store for the datasets both serve.')
+    parser.add_argument('test_mode', nargs='?', default=None,
+                        help='Test mode, e.g. "development", "stage" or '
+                             '"production". Results are written to the '
+                             'directory of this name.')
+    parser.add_argument('--pairs-csv', default=None,
+                        help=f'CSV with columns {CCI_STORE} and '
+                             f'{CCI_ZARR_STORE} of pairs of datasets, which '
+                             f'replace the pairs found for their ids.')
+    parser.add_argument('--time-steps', type=int, default=SUBSET_TIME_STEPS,
+                        help='Number of time steps of the subset. Defaults '
+                             f'to {SUBSET_TIME_STEPS}.')
+    parser.add_argument('--cells', type=int, default=SUBSET_CELLS,
+                        help='Number of cells along x and y of the subset. '
+                             f'Defaults to {SUBSET_CELLS}.')
+    parser.add_argument('--memory-limit', type=int,
+                        default=PROCESSING_MEMORY_LIMIT // (1024 * 1024),
+                        help='Maximum number of megabytes held in memory '
+                             'while reading the subset. Defaults to '
+                             f'{PROCESSING_MEMORY_LIMIT // (1024 * 1024)}.')
+    parser.add_argument('--timeout', type=int, default=TIMEOUT_TIME,
+                        help='Seconds after which opening or reading a '
+                             'dataset of a store is given up. Defaults to '
+                             f'{TIMEOUT_TIME}.')
+    args = parser.parse_args(args)
+
+    results_dir = args.test_mode or '.'
+    os.makedirs(results_dir, exist_ok=True)
+    throughput_csv = f'{results_dir}/{date_today}_store_throughput.csv'
+    data_ids = {store_name: list(DATA_STORE_POOL.get_store(store_name)
+                                 .get_data_ids())
+                for store_name in PROBED_STORES}
+    pairs = pair_data_ids(data_ids[CCI_STORE], data_ids[CCI_ZARR_STORE])
+    if args.pairs_csv:
+        given_pairs = read_pairs_csv(args.pairs_csv)
+        given_data_ids = {data_id for pair in given_pairs
+                          for data_id in pair[:2]}
+        pairs = [pair for pair in pairs
+                 if pair[0] not in given_data_ids
+                 and pair[1] not in given_data_ids] + given_pairs
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+          f'Found {len(pairs)} datasets in both {CCI_STORE} and '
+          f'{CCI_ZARR_STORE}.')
+
+    if os.path.isfile(throughput_csv):
+        os.remove(throughput_csv)
+    start_time = datetime.now()
+    for index, (cci_data_id, zarr_data_id, score) in enumerate(pairs):
+        print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+              f'Probing {cci_data_id} and {zarr_data_id} '
+              f'({score:.0%} of the words match).')
+        rows = probe_pair(cci_data_id, zarr_data_id, args.time_steps,
+                          args.cells, args.memory_limit * 1024 * 1024,
+                          args.timeout, zarr_first=index % 2 == 1)
+        write_metrics_rows(throughput_csv, rows, THROUGHPUT_HEADER_ROW)
+        for row in rows:
+            if row.get('comment'):
+                result = row['comment']
+            else:
+                result = f'{row["throughput"]} MB/s, time to first ' \
+                         f'byte {row["time_to_first_byte"]} seconds'
+            print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+                  f'{row["store"]}: {result}')
+
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+          f'Throughput of {len(pairs)} datasets written to '
+          f'{throughput_csv}.')
+    print(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] '
+          f'Probe took {datetime.now() - start_time}')
+
+
+if __name__ == '__main__':
+    main()
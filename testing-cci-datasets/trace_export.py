@@ -0,0 +1,145 @@
+"""
+Timeline of the sweeps in the Chrome trace event format.
+
+Every stage of a dataset test is a row of the metrics CSV of its sweep, with
+the time it started and the worker which ran it. From these rows a trace is
+built which Perfetto (ui.perfetto.dev), chrome://tracing and speedscope load
+directly:
+
+* every sweep is a process, named after its test mode and store,
+* every worker of a sweep is a thread, one lane per worker,
+* every dataset is a span on the lane of its worker, from the start of its
+  first stage to the end of its last one, with the spans of its stages
+  (describe, open, open_temp, ..., write, traceback) nested in it.
+
+Gaps in a lane are idle time of its worker, the longest spans at the end of
+a sweep are its tail.
+
+Usage, to combine the sweeps of both stores of a test mode:
+
+    cd production
+    python ../trace_export.py \\
+        cci-store/2022-10-19_test_cci-store_data_support_metrics.csv \\
+        cci-zarr-store/2022-10-19_test_cci-zarr-store_data_support_metrics.csv \\
+        -o trace.json
+"""
+import argparse
+import json
+import os
+
+from instrumentation import read_metrics_rows
+from result_store import open_atomically
+
+# arguments of the stage spans, taken from the metrics columns
+SPAN_ARGS = ['cpu_time', 'bytes_read', 'peak_rss']
+
+
+def get_sweep_name(metrics_csv):
+    """test mode/store of a metrics CSV in the results directory layout"""
+    results_dir = os.path.dirname(os.path.abspath(metrics_csv))
+    parts = results_dir.split(os.sep)
+    return '/'.join(parts[-2:])
+
+
+def _get_worker(row):
+    return int(row['worker']) if row.get('worker') not in (None, '') else 0
+
+
+def get_trace_events(metrics_rows, pid, sweep_name, origin):
+    """Trace events of the stages of one sweep, *origin* is the time in
+    seconds the timestamps are relative to."""
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+               'args': {'name': sweep_name}},
+              {'name': 'process_sort_index', 'ph': 'M', 'pid': pid,
+               'args': {'sort_index': pid}}]
+    spans = []
+    # last stage span of every lane
+    last_spans = {}
+    rows = [row for row in metrics_rows
+            if row.get('start') and row.get('wall_time')]
+    for row in sorted(rows, key=lambda r: (_get_worker(r), float(r['start']))):
+        # whole microseconds, so the dataset span ends exactly with its
+        # last stage
+        start = round((float(row['start']) - origin) * 1e6)
+        end = start + round(float(row['wall_time']) * 1e6)
+        worker = _get_worker(row)
+        args = {column: float(row[column]) for column in SPAN_ARGS
+                if row.get(column)}
+        last_span = last_spans.get(worker)
+        if last_span is not None and \
+                start < last_span['ts'] + last_span['dur'] < end:
+            # wall times are rounded to milliseconds, consecutive stages
+            # must not overlap
+            last_span['dur'] = start - last_span['ts']
+        span = {'name': row['stage'], 'cat': 'stage', 'ph': 'X',
+                'pid': pid, 'tid': worker,
+                'ts': start, 'dur': end - start, 'args': args}
+        spans.append((row, span))
+        last_spans[worker] = span
+    # consecutive stages of a dataset on a lane, a dataset may be tested
+    # again by a later run writing to the same metrics CSV
+    datasets = []
+    for row, span in spans:
+        events.append(span)
+        end = span['ts'] + span['dur']
+        dataset = datasets[-1] if datasets else None
+        if dataset is not None and dataset['tid'] == span['tid'] \
+                and dataset['name'] == row['Dataset-ID']:
+            dataset['dur'] = max(dataset['dur'], end - dataset['ts'])
+            continue
+        datasets.append({'name': row['Dataset-ID'], 'cat': 'dataset',
+                         'ph': 'X', 'pid': pid, 'tid': span['tid'],
+                         'ts': span['ts'], 'dur': span['dur'],
+                         'args': {'ECV-Name': row.get('ECV-Name')}})
+    events.extend(datasets)
+    for worker in sorted(last_spans):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                       'tid': worker, 'args': {'name': f'worker {worker}'}})
+        events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': pid,
+                       'tid': worker, 'args': {'sort_index': worker}})
+    return events
+
+
+def write_trace(trace_json, metrics_csvs, sweep_names=None):
+    """
+    Write the trace of the sweeps of *metrics_csvs* to *trace_json*.
+
+    :param sweep_names: names of the sweeps, by default test mode/store
+        from the path of their metrics CSV
+    :return: the number of spans of stages
+    """
+    sweep_names = sweep_names or [get_sweep_name(metrics_csv)
+                                  for metrics_csv in metrics_csvs]
+    sweeps = [(name, read_metrics_rows(metrics_csv))
+              for name, metrics_csv in zip(sweep_names, metrics_csvs)]
+    starts = [float(row['start']) for _, rows in sweeps for row in rows
+              if row.get('start')]
+    origin = min(starts, default=0)
+    events = []
+    for pid, (name, rows) in enumerate(sweeps, 1):
+        events.extend(get_trace_events(rows, pid, name, origin))
+    with open_atomically(trace_json, '.json.tmp') as f:
+        # traces of a night get large, no indentation
+        json.dump({'traceEvents': events,
+                   'displayTimeUnit': 'ms',
+                   'otherData': {'origin': origin}}, f,
+                  separators=(',', ':'))
+    return len(starts)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Export the stages of sweeps as a Chrome trace.')
+    parser.add_argument('metrics_csvs', nargs='+',
+                        help='Metrics CSVs written by '
+                             'test_cci_data_support.py.')
+    parser.add_argument('-o', '--output', default='trace.json',
+                        help='Trace JSON to write. Defaults to trace.json.')
+    args = parser.parse_args(args)
+    spans = write_trace(args.output, args.metrics_csvs)
+    print(f'Wrote {spans} stage spans of {len(args.metrics_csvs)} sweeps to '
+          f'{args.output}.')
+
+
+if __name__ == '__main__':
+    main()
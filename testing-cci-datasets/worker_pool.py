@@ -0,0 +1,189 @@
+"""
+Process pool used to run the dataset sweep concurrently.
+
+Every worker is a separate process that receives one task at a time through
+its own pipe. The parent process keeps a wall clock deadline for every task
+and kills the worker once it is exceeded, so a read hanging in C code can
+neither block the sweep nor depend on ``signal.SIGALRM``, which only works
+in the main thread. A killed or crashed worker is replaced by a fresh one.
+With a host memory limit, the parent also kills the worker using the most
+memory once the memory in use on the host exceeds the limit.
+"""
+import multiprocessing
+import time
+import traceback
+from multiprocessing.connection import wait
+
+from instrumentation import get_rss
+from memory_governor import get_used_memory
+
+# how often (in seconds) the parent checks the deadlines of running tasks
+POLL_INTERVAL = 1.0
+# seconds after killing a worker for memory before the next one may be
+# killed, the memory of the killed worker has to be released first
+MEMORY_KILL_GRACE = 10.0
+
+
+class _Worker:
+
+    def __init__(self, context, worker_id, target, initializer, initargs):
+        self.worker_id = worker_id
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop,
+                                       args=(child_conn, worker_id, target,
+                                             initializer, initargs),
+                                       name=f'sweep-worker-{worker_id}')
+        self.process.start()
+        child_conn.close()
+        self.index = None
+        self.timeout = None
+        self.deadline = None
+
+    @property
+    def idle(self):
+        return self.index is None
+
+    def submit(self, index, args, timeout):
+        self.index = index
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.conn.send((index, args))
+
+    def release(self):
+        self.index = None
+        self.timeout = None
+        self.deadline = None
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+def _worker_loop(conn, worker_id, target, initializer, initargs):
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        index, args = task
+        try:
+            result = ('ok', target(*args, worker_id=worker_id))
+        except Exception:
+            result = ('error', traceback.format_exc())
+        conn.send((index, result))
+    conn.close()
+
+
+def run_pool(tasks, target, workers, timeout, on_result, on_failure,
+             initializer=None, initargs=(), start_method='spawn', order=None,
+             memory_limit=None):
+    """
+    Run ``target(*args, worker_id=...)`` for every ``args`` in *tasks*
+    on *workers* processes.
+
+    Tasks are handed out one at a time as soon as a worker becomes idle,
+    so the total run time is bounded by the slowest tasks rather than by
+    the sum of all of them.
+
+    :param tasks: list of argument tuples, one per task
+    :param target: picklable, module level function executed by the workers
+    :param workers: number of worker processes
+    :param timeout: wall clock seconds a single task may take, a list with
+        the seconds of every task, or None
+    :param on_result: called as ``on_result(index, result)`` for every task
+        that returned normally
+    :param on_failure: called as ``on_failure(index, reason)`` for every
+        task that raised, timed out or whose worker died
+    :param initializer: picklable, module level function called as
+        ``initializer(*initargs)`` in every new worker before its first task
+    :param initargs: arguments of *initializer*
+    :param start_method: multiprocessing start method of the workers
+    :param order: indices of the tasks in the order they are handed out,
+        by default the order of *tasks*
+    :param memory_limit: bytes of memory in use on the host above which the
+        worker using the most resident memory is killed, or None
+    """
+    context = multiprocessing.get_context(start_method)
+    if not isinstance(timeout, (list, tuple)):
+        timeout = [timeout] * len(tasks)
+    if order is None:
+        order = range(len(tasks))
+    pending = [(index, tasks[index]) for index in order]
+    pending.reverse()
+    pool = [_Worker(context, worker_id, target, initializer, initargs)
+            for worker_id in range(min(workers, len(tasks)))]
+    next_memory_kill = 0
+
+    def replace_worker(i, reason):
+        worker = pool[i]
+        index = worker.index
+        worker.kill()
+        pool[i] = _Worker(context, worker.worker_id, target, initializer,
+                          initargs)
+        on_failure(index, reason)
+
+    try:
+        while pending or any(not worker.idle for worker in pool):
+            for worker in pool:
+                if worker.idle and pending:
+                    index, args = pending.pop()
+                    worker.submit(index, args, timeout[index])
+
+            busy = {worker.conn: worker for worker in pool if not worker.idle}
+            for conn in wait(list(busy.keys()), timeout=POLL_INTERVAL):
+                worker = busy[conn]
+                try:
+                    index, (status, payload) = conn.recv()
+                except EOFError:
+                    continue
+                worker.release()
+                if status == 'ok':
+                    on_result(index, payload)
+                else:
+                    on_failure(index, payload)
+
+            now = time.monotonic()
+            for i, worker in enumerate(pool):
+                if worker.idle:
+                    continue
+                if worker.deadline is not None and now > worker.deadline:
+                    reason = f'Time out after {worker.timeout} seconds.'
+                elif not worker.process.is_alive():
+                    reason = f'Worker process died with exit code ' \
+                             f'{worker.process.exitcode}.'
+                else:
+                    continue
+                replace_worker(i, reason)
+
+            if memory_limit is not None and now >= next_memory_kill:
+                used = get_used_memory()
+                busy = [i for i, worker in enumerate(pool) if not worker.idle]
+                if used is not None and used > memory_limit and busy:
+                    rss = {i: get_rss(pool[i].process.pid) or 0 for i in busy}
+                    i = max(busy, key=rss.get)
+                    replace_worker(
+                        i, f'Memory budget exceeded on the host: '
+                           f'{used // (1024 * 1024)} MB in use, the limit is '
+                           f'{memory_limit // (1024 * 1024)} MB, the worker '
+                           f'used {rss[i] // (1024 * 1024)} MB.')
+                    next_memory_kill = now + MEMORY_KILL_GRACE
+    finally:
+        for worker in pool:
+            worker.stop()
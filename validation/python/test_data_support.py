@@ -1,12 +1,37 @@
+import functools
+import json
+import os
 import random
-import string
+import tempfile
+import time
+import uuid
+from datetime import datetime
 from cate.core.ds import DATA_STORE_REGISTRY
 from cate.core import ds
 import pytest
 
-data_store = DATA_STORE_REGISTRY.get_data_store('esa_cci_odp')
-data_sets = data_store.query()
-lds = DATA_STORE_REGISTRY.get_data_store('local')
+# Dataset IDs and file lists are cached on disk, so collecting the tests does not query the store and
+# the file list of a dataset is only fetched by the first test that needs it.
+# Set CATE_VALIDATION_REFRESH=1 to fetch everything from the store again.
+CACHE_DIR = os.environ.get('CATE_VALIDATION_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'cate-e2e', 'validation'))
+CACHE_TTL = 24 * 60 * 60  # seconds
+REFRESH = os.environ.get('CATE_VALIDATION_REFRESH') == '1'
+
+
+@functools.lru_cache()
+def get_data_store():
+    return DATA_STORE_REGISTRY.get_data_store('esa_cci_odp')
+
+
+@functools.lru_cache()
+def get_local_data_store():
+    return DATA_STORE_REGISTRY.get_data_store('local')
+
+
+@functools.lru_cache()
+def get_data_sets():
+    return {data_set.id: data_set for data_set in get_data_store().query()}
 
 
 # Utility functions
@@ -22,14 +47,53 @@ def hr_size(size):
     return f"{size:.2f} {units[i]}"
 
 
+def read_cache(name):
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+    if REFRESH or not os.path.exists(path) or time.time() - os.path.getmtime(path) > CACHE_TTL:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(name, value):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # written to a temporary file first, xdist workers may read and write the same entry
+    fd, temp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(value, f)
+    os.replace(temp_path, os.path.join(CACHE_DIR, f"{name}.json"))
+
+
+def get_dataset_ids():
+    dataset_ids = read_cache('dataset_ids')
+    if dataset_ids is None:
+        dataset_ids = list(get_data_sets())
+        write_cache('dataset_ids', dataset_ids)
+    return dataset_ids
+
+
+def get_file_list(data_set):
+    """Start time, end time and size of every file of the dataset"""
+    name = f"files_{data_set.id}"
+    file_list = read_cache(name)
+    if file_list is None:
+        data_set._init_file_list()
+        file_list = [(f[1].isoformat(), f[2].isoformat(), f[3]) for f in data_set._file_list]
+        write_cache(name, file_list)
+    return [(datetime.fromisoformat(start), datetime.fromisoformat(end), size) for start, end, size in file_list]
+
+
 def get_testchunk_dates(data_set, max_size=40 * 1024 * 1024, max_files=100):
     "assuming files are chunked in time"
-    data_set._init_file_list()
-    num_files = data_set.meta_info['number_of_files']
+    file_list = get_file_list(data_set)
+    num_files = len(file_list)
 
     # pick a random file index
     indx = random.randrange(0, num_files)
-    tstart = data_set._file_list[indx][2]
+    tstart = file_list[indx][1]
 
     tot_size = 0
     file_count = 0
@@ -37,7 +101,7 @@ def get_testchunk_dates(data_set, max_size=40 * 1024 * 1024, max_files=100):
     # or file_count maximum number of files
     # or end of filelist
     while tot_size < max_size and file_count <= max_files and indx < num_files:
-        curr_size = data_set._file_list[indx][3]
+        curr_size = file_list[indx][2]
 
         if curr_size > max_size: break  # skip loop when each file is more then max size
 
@@ -45,14 +109,24 @@ def get_testchunk_dates(data_set, max_size=40 * 1024 * 1024, max_files=100):
         file_count += 1
         indx += 1
 
-    tend = data_set._file_list[indx - 1][1]  # or 2?
+    tend = file_list[indx - 1][0]  # or 1?
     return (tstart, tend)
 
 
+def pytest_generate_tests(metafunc):
+    # tests are collected by dataset ID, datasets and their test chunks are only looked up when a test runs
+    if 'dataset_id' in metafunc.fixturenames:
+        dataset_ids = get_dataset_ids()
+        metafunc.parametrize('dataset_id', dataset_ids, ids=dataset_ids)
+
+
 # Fixtures
-@pytest.fixture(scope="function", params=((dataset, get_testchunk_dates(dataset)) for dataset in data_sets))
-def remote_dataset(request, record_xml_attribute, record_property):
-    dataset, time_range = request.param
+@pytest.fixture(scope="function")
+def remote_dataset(dataset_id, record_xml_attribute, record_property):
+    dataset = get_data_sets().get(dataset_id)
+    if dataset is None:
+        pytest.skip('Dataset is no longer in the store')
+    time_range = get_testchunk_dates(dataset)
     record_xml_attribute('dataset', dataset.id)
     dkeys = ['cci_project', 'time_frequency', 'processing_level', 'data_type', 'sensor_id', 'version']
 
@@ -74,10 +148,11 @@ def remote_dataset(request, record_xml_attribute, record_property):
 @pytest.fixture(scope='function')
 def local_dataset(remote_dataset):
     dataset, time_range = remote_dataset
-    rand_string = f"test{random.choice(string.ascii_lowercase)}"  # needed when tests run in parallel
+    # needed when tests run in parallel, unique per xdist worker and test
+    rand_string = f"test{os.environ.get('PYTEST_XDIST_WORKER', '')}{uuid.uuid4().hex}"
     dataset.make_local(rand_string, time_range=time_range)
     yield f"local.{rand_string}"
-    lds.remove_data_source(f"local.{rand_string}")
+    get_local_data_store().remove_data_source(f"local.{rand_string}")
 
 
 # Tests
@@ -1,42 +1,106 @@
-import os, xml
-import xml.etree.ElementTree as ET
-import pandas as pd
+"""
+Builds test_result.csv and test_result.html from the JUnit XML report of test_data_support.py.
+
+The report is read incrementally with iterparse and every test case is cleared once it has been read,
+so large reports are processed in constant memory. Dataset metadata is taken from the attributes the
+tests record with record_xml_attribute, test cases are joined to their dataset by ID, the store is not
+queried again.
+
+use it as `python tests_parser.py tests.xml`
+"""
+import argparse
+import csv
+import html
+import re
 import xml.etree.ElementTree as ET
-from cate.core.ds import DATA_STORE_REGISTRY
-from cate.core import ds
-import random
 
-data_store = DATA_STORE_REGISTRY.get_data_store('esa_cci_odp')
-data_sets = data_store.query()
+DATASET_ATTRIBUTES = ['cci_project', 'time_frequency', 'processing_level', 'data_type', 'sensor_id', 'version',
+                      'dataset', 'files', 'access_protocols', 'time_coverage', 'size', 'size_per_file',
+                      'test_time_coverage']
+# test case name, e.g. test_open_local[esacci.OC.day.L3S.CHLOR_A.multi-sensor.multi-platform.MERGED.3-1.geographic]
+TEST_NAME = re.compile(r'^test_(?P<test>[^\[]+)\[(?P<dataset>.+)\]$')
+
+
+def get_result(testcase):
+    """True if the test passed, else the message of its failure, error or skip"""
+    for child in testcase:
+        if child.tag in ('failure', 'error'):
+            return child.get('message', child.tag)
+        if child.tag == 'skipped':
+            return f"skipped: {child.get('message', '')}"
+    return True
+
+
+def iter_testcases(xml_file):
+    """(dataset ID, test name, recorded attributes, result) of every test case of the report"""
+    # open elements, a test case is removed from its test suite once it has been read
+    parents = []
+    for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag != 'testcase':
+            continue
+        match = TEST_NAME.match(elem.get('name', ''))
+        dataset_id = elem.get('dataset') or (match and match.group('dataset'))
+        if dataset_id:
+            test_name = match.group('test') if match else elem.get('name')
+            attributes = {k: elem.get(k) for k in DATASET_ATTRIBUTES if elem.get(k) is not None}
+            yield dataset_id, test_name, attributes, get_result(elem)
+        # drop the test case and its output, the test suite would otherwise keep all of them
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+
+
+def collect_results(xml_file):
+    """One row per dataset with its recorded attributes and the result of every test"""
+    rows = {}
+    test_names = []
+    for dataset_id, test_name, attributes, result in iter_testcases(xml_file):
+        row = rows.setdefault(dataset_id, {'dataset': dataset_id})
+        row.update(attributes)
+        row[test_name] = result
+        if test_name not in test_names:
+            test_names.append(test_name)
+    return list(rows.values()), DATASET_ATTRIBUTES + test_names
+
 
+def write_csv(rows, columns, csv_file):
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([''] + columns)
+        for index, row in enumerate(rows):
+            writer.writerow([index] + [row.get(column, '') for column in columns])
 
-et=ET.parse(os.path.join("tests.xml"))
-root=et.getroot()
-test_results=[(elem.tag,elem.attrib) for elem in root.iter() if elem.tag in ["testcase","error","failure"]]
 
-agg = []
-for data_set,r in zip(data_sets,test_results):
-    dkeys = ['cci_project','time_frequency','processing_level','data_type','sensor_id', 'version']
-    ddict = {k: data_set.meta_info[k] for k in dkeys}
-    ddict.update({'dataset': data_set.id})
-    ddict.update({'files': data_set.meta_info['number_of_files']})
-    ddict.update({'access_protocols': data_set.protocols})
-    ddict.update({'time_coverage': tuple(t.strftime('%Y-%m-%d') for t in data_set.temporal_coverage())})
-    ddict.update({'size': hr_size(data_set.meta_info['size'])})
-    ddict.update({'size_per_file':hr_size(data_set.meta_info['size']/data_set.meta_info['number_of_files'])})
-    
-    if r[0] == 'testcase':
-        ddict.update({'open_local': True})
-    else:
-        ddict.update({'open_local': r[1]['message']})
-    agg.append(ddict)
+def write_html(rows, columns, html_file):
+    with open(html_file, 'wt') as f:
+        f.write('<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n'
+                '      <th></th>\n')
+        for column in columns:
+            f.write(f'      <th>{html.escape(column)}</th>\n')
+        f.write('    </tr>\n  </thead>\n  <tbody>\n')
+        for index, row in enumerate(rows):
+            f.write(f'    <tr>\n      <th>{index}</th>\n')
+            for column in columns:
+                f.write(f"      <td>{html.escape(str(row.get(column, '')))}</td>\n")
+            f.write('    </tr>\n')
+        f.write('  </tbody>\n</table>')
 
 
-df=pd.DataFrame(agg)
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Build the result tables from the JUnit XML report.')
+    parser.add_argument('xml_file', nargs='?', default='tests.xml', help='JUnit XML report, defaults to tests.xml')
+    parser.add_argument('--csv', default='test_result.csv', help='CSV to write, defaults to test_result.csv')
+    parser.add_argument('--html', default='test_result.html', help='HTML to write, defaults to test_result.html')
+    args = parser.parse_args(args)
 
-html=df.to_html()
+    rows, columns = collect_results(args.xml_file)
+    write_csv(rows, columns, args.csv)
+    write_html(rows, columns, args.html)
 
-with open('test_result.html','wt') as f:
-    f.write(html)
 
-df.to_csv('test_result.csv')
+if __name__ == '__main__':
+    main()
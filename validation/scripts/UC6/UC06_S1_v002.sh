@@ -1,9 +1,9 @@
 #!/bin/bash
 # Download fire data
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.MODIS.Terra.MODIS_TERRA.2-0.r1 --name CLOUD_2007_UC06 --time '2007-01-01,2007-12-31' --region '72,8,85,17' --vars 'cfc,cot'
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.MODIS.Terra.MODIS_TERRA.2-0.r1 --name CLOUD_2007_UC06 --time '2007-01-01,2007-12-31' --region '72,8,85,17' --vars 'cfc,cot'
 
 # Download sea surface temperature data
-cate ds copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name SST_2006_2007 --time '2006-01-01,2007-12-31' --region ' -175,-10,-115,10' --vars 'analysed_sst,analysis_error'
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name SST_2006_2007 --time '2006-01-01,2007-12-31' --region ' -175,-10,-115,10' --vars 'analysed_sst,analysis_error'
 
 # Start interactive session by initialising an empty workspace
 cate ws init
@@ -1,9 +1,9 @@
 #!/bin/bash
 # Download soil moisture data
-cate ds copy esacci.SOILMOISTURE.day.L3S.SSMV.multi-sensor.multi-platform.COMBINED.03-2.r1 --name esacci.SOILMOISTURE.day.L3S.SSMV.multi-sensor.multi-platform.COMBINED.03-2.r1_19980101_19981231_reg_0_30_20_60_var_sm --time '1998-01-01,1998-12-31' --region '0,30,20,60' --vars 'sm,sm_uncertainty'
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.SOILMOISTURE.day.L3S.SSMV.multi-sensor.multi-platform.COMBINED.03-2.r1 --name esacci.SOILMOISTURE.day.L3S.SSMV.multi-sensor.multi-platform.COMBINED.03-2.r1_19980101_19981231_reg_0_30_20_60_var_sm --time '1998-01-01,1998-12-31' --region '0,30,20,60' --vars 'sm,sm_uncertainty'
 
 # Download sea surface temperature data
-cate ds copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1_19971201_19981231_reg-175_-10_-115_10_var_analysed_sst --time '1997-12-01,1998-12-31' --region ' -175,-10,-115,10' --vars 'analysed_sst,analysis_error'
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1_19971201_19981231_reg-175_-10_-115_10_var_analysed_sst --time '1997-12-01,1998-12-31' --region ' -175,-10,-115,10' --vars 'analysed_sst,analysis_error'
 
 # Start interactive session by initialising an empty workspace
 cate ws init
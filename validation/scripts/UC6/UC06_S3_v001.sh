@@ -1,9 +1,9 @@
 #!/bin/bash
 # Download soil moisture data
-cate ds copy esacci.OC.day.L3S.K_490.multi-sensor.multi-platform.MERGED.2-0.r1 --name esacci.OC.day.L3S.K_490.multi-sensor.multi-platform.MERGED.2-0.r1_20070101_20071231_reg72_8_85_17_var_kd_490 --time '2007-01-01,2007-12-31' --region '72,8,85,17' --vars 'kd_490'
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.OC.day.L3S.K_490.multi-sensor.multi-platform.MERGED.2-0.r1 --name esacci.OC.day.L3S.K_490.multi-sensor.multi-platform.MERGED.2-0.r1_20070101_20071231_reg72_8_85_17_var_kd_490 --time '2007-01-01,2007-12-31' --region '72,8,85,17' --vars 'kd_490'
 
 # Download sea surface temperature data
-cate ds copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name SST_2006_2007 --time '2006-01-01,2007-12-31' --region ' -175,-10,-115,10' --vars 'analysed_sst,analysis_error'
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.SST.day.L4.SSTdepth.multi-sensor.multi-platform.OSTIA.1-1.r1 --name SST_2006_2007 --time '2006-01-01,2007-12-31' --region ' -175,-10,-115,10' --vars 'analysed_sst,analysis_error'
 
 
 # Start interactive session by initialising an empty workspace
@@ -1,8 +1,8 @@
 #!/bin/bash
 #Scenario1: UC09 for globally and monthly data covering one year (2007).
 #-load data:
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.AVHRR.NOAA-17.AVHRR_NOAA.1-0.r1 -n cld_2007 -t 2007-01-01,2007-12-31
-cate ds copy esacci.AEROSOL.mon.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 -n aerosol2_2007 -t 2007-01-01,2007-12-31
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.AVHRR.NOAA-17.AVHRR_NOAA.1-0.r1 -n cld_2007 -t 2007-01-01,2007-12-31
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.AEROSOL.mon.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 -n aerosol2_2007 -t 2007-01-01,2007-12-31
 
 #-open workspace
 cate ws new
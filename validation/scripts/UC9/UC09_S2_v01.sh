@@ -1,8 +1,8 @@
 #!/bin/bash
 #Scenario2: UC09 for multiple-years (even full NOAA-17-CLOUD dataset) with monthly timesteps covering the western EU.
 #-load data:
-cate ds copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.AVHRR.NOAA-17.AVHRR_NOAA.1-0.r1 -n cld_20070101_20091229 -t 2007-01-01,2009-12-29  #range: 2007-01-01 to 2009-12-29
-cate ds copy esacci.AEROSOL.mon.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 -n aerosol_20070101_20091229  -t 2007-01-01,2009-12-29  #range: 1978-11-01 to 2015-11-29
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.CLOUD.mon.L3C.CLD_PRODUCTS.AVHRR.NOAA-17.AVHRR_NOAA.1-0.r1 -n cld_20070101_20091229 -t 2007-01-01,2009-12-29  #range: 2007-01-01 to 2009-12-29
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.AEROSOL.mon.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 -n aerosol_20070101_20091229  -t 2007-01-01,2009-12-29  #range: 1978-11-01 to 2015-11-29
 
 #-open workspace
 cate ws new
@@ -2,8 +2,8 @@
 #Scenario3: UC09 for globally and daily data of May 2007
 
 #-load data:
-cate ds copy esacci.CLOUD.day.L3U.CLD_PRODUCTS.multi-sensor.Envisat.MERISAATSR_ENVISAT.1-0.r1 -n cloud_200705 -t 2007-05-01,2007-05-31
-cate ds copy esacci.AEROSOL.day.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 -n aerosol_200705 -t 2007-05-01,2007-05-31
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.CLOUD.day.L3U.CLD_PRODUCTS.multi-sensor.Envisat.MERISAATSR_ENVISAT.1-0.r1 -n cloud_200705 -t 2007-05-01,2007-05-31
+python "$(dirname "$0")/../../../ds_cache.py" copy esacci.AEROSOL.day.L3.AAI.multi-sensor.multi-platform.ms_uvai.1-5-7.r1 -n aerosol_200705 -t 2007-05-01,2007-05-31
 
 #-open workspace
 cate ws new